@@ -1,11 +1,13 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db.models import Count
 from .models import User
 from django.contrib.auth import logout
-from notifications.models import Notification 
+from notifications.models import CompteurNotifications, Notification
 from commandes.models import Commande 
+from grow_with_green.pagination import paginer_requete
 
 def logout_user(request):
     logout(request)
@@ -178,10 +180,10 @@ def notifications(request):
     # Récupérer les commandes récentes
     commandes_recentes = Commande.objects.filter(
         user=request.user
-    ).order_by('-date_commande')[:10]
+    ).annotate(nombre_articles=Count('items')).order_by('-date_commande')[:10]
     
-    # Compter les notifications non lues
-    notifications_non_lues = notifications_list.filter(lu=False).count()
+    # Compteur dénormalisé : pas de COUNT sur l'historique
+    notifications_non_lues = CompteurNotifications.non_lues_de(request.user)
     
     # Créer des notifications de démonstration si aucune
     if not notifications_list.exists():
@@ -195,10 +197,10 @@ def notifications(request):
         )
         
         # Recréer la liste
-        notifications_list = Notification.objects.filter(user=request.user).order_by('-date_creation')
+        notifications_list = Notification.objects.filter(user=request.user)
     
     context = {
-        'notifications': notifications_list,
+        'notifications': paginer_requete(request, notifications_list, ('-date_creation', '-pk')),
         'commandes_recentes': commandes_recentes,
         'notifications_non_lues': notifications_non_lues,
         'promotions': [],  # À remplir si vous avez un système de promotions
@@ -210,12 +212,11 @@ def notifications(request):
 def marquer_notification_lu(request, pk):
     """Marquer une notification comme lue"""
     notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    notification.lu = True
-    notification.save()
+    notification.marquer_comme_lu()
     return redirect('accounts:notifications')
 
 @login_required
 def marquer_tout_lu(request):
     """Marquer toutes les notifications comme lues"""
-    Notification.objects.filter(user=request.user, lu=False).update(lu=True)
+    Notification.marquer_tout_lu(request.user)
     return redirect('accounts:notifications')
\ No newline at end of file
@@ -0,0 +1,27 @@
+from boutique.cache_catalogue import reponse_versionnee
+
+
+class CatalogueCacheMixin:
+    """
+    Sert les actions de lecture d'un viewset public depuis le cache
+    versionné du catalogue (boutique.cache_catalogue), avec ETag.
+    """
+    actions_en_cache = ('list', 'retrieve')
+    # Paramètres dont la présence désactive le cache (effets de bord de la vue)
+    parametres_hors_cache = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        if (
+            request.method not in ('GET', 'HEAD')
+            or action not in self.actions_en_cache
+            or any(parametre in request.GET for parametre in self.parametres_hors_cache)
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        def calculer():
+            response = super(CatalogueCacheMixin, self).dispatch(request, *args, **kwargs)
+            response.render()
+            return response
+
+        return reponse_versionnee(request, calculer)
@@ -0,0 +1,22 @@
+from rest_framework import filters
+
+from boutique.models import TermeRecherche
+from boutique.search import rechercher
+
+
+class RechercheProduitFilter(filters.SearchFilter):
+    """
+    ?search= sur l'index plein texte des produits, trié par pertinence
+    (un paramètre ?ordering= explicite reste prioritaire).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        texte = request.query_params.get(self.search_param, '').strip()
+        if not texte:
+            return queryset
+        resultats = rechercher(queryset, texte)
+        # Comme la page de recherche : seules les recherches qui aboutissent
+        # sont comptées (une fois, sur la première page)
+        if not request.query_params.get('page') and resultats.exists():
+            TermeRecherche.enregistrer(texte)
+        return resultats.order_by('-pertinence')
@@ -0,0 +1,80 @@
+"""
+En-tête Idempotency-Key pour les actions d'écriture de l'API.
+
+Un client qui renvoie une requête (délai dépassé, réseau mobile) avec la
+même clé reçoit la réponse enregistrée au premier passage, sans que
+l'action soit exécutée une seconde fois. Les réponses sont conservées
+settings.IDEMPOTENCE_TTL secondes dans le cache, par utilisateur, action
+et clé. Pendant l'exécution, un second envoi reçoit 409 ; une clé
+réutilisée avec un autre corps reçoit 422.
+
+Un nouvel essai peut arriver sur un autre worker : la réservation
+(cache.add, atomique) et la réponse enregistrée vivent dans le cache commun
+à tous les processus, que les settings exigent dès qu'il y en a plusieurs
+(CACHE_PROFIL redis ou db).
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+EN_COURS = 'en_cours'
+
+
+def _empreinte(request):
+    corps = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(corps.encode()).hexdigest()
+
+
+def idempotent(action):
+    """Décorateur des actions de viewset acceptant l'en-tête Idempotency-Key"""
+    @wraps(action)
+    def wrapper(self, request, *args, **kwargs):
+        cle_client = request.headers.get('Idempotency-Key')
+        if not cle_client:
+            return action(self, request, *args, **kwargs)
+
+        cle = hashlib.sha256(
+            f'{request.user.pk}|{request.method}|{request.path}|{cle_client}'.encode()
+        ).hexdigest()
+        cle = f'idempotence:{cle}'
+        empreinte = _empreinte(request)
+
+        if not cache.add(cle, EN_COURS, settings.IDEMPOTENCE_TTL):
+            enregistre = cache.get(cle)
+            if enregistre == EN_COURS:
+                return Response(
+                    {'error': 'Requête déjà en cours de traitement'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if enregistre is not None:
+                if enregistre['empreinte'] != empreinte:
+                    return Response(
+                        {'error': 'Idempotency-Key déjà utilisée pour une autre requête'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                response = Response(enregistre['data'], status=enregistre['statut'])
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            # Entrée expirée entre add() et get() : on réserve à nouveau
+            cache.add(cle, EN_COURS, settings.IDEMPOTENCE_TTL)
+
+        response = None
+        try:
+            response = action(self, request, *args, **kwargs)
+        finally:
+            # Les erreurs serveur ne sont pas mémorisées : le client peut réessayer
+            if response is not None and response.status_code < 500:
+                cache.set(cle, {
+                    'empreinte': empreinte,
+                    'statut': response.status_code,
+                    'data': response.data,
+                }, settings.IDEMPOTENCE_TTL)
+            else:
+                cache.delete(cle)
+        return response
+    return wrapper
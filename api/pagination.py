@@ -0,0 +1,12 @@
+from grow_with_green.pagination import CurseurPagination
+
+
+class CommandePagination(CurseurPagination):
+    """Historique des commandes, du plus récent au plus ancien"""
+    ordre = ('-date_commande', '-pk')
+
+
+class AvisPagination(CurseurPagination):
+    """Avis d'un produit, du plus récent au plus ancien"""
+    ordre = ('-date_creation', '-pk')
+    page_size = 10
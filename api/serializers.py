@@ -156,36 +156,15 @@ class CommandeCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         """Créer une commande à partir du panier"""
+        from commandes.services import passer_commande
+        
         user = self.context['request'].user
         zone_id = validated_data.pop('zone_livraison_id')
         
         # Récupérer la zone
         zone = ZoneLivraison.objects.get(pk=zone_id, active=True)
         
-        # Récupérer le panier
-        panier = Panier.objects.get(user=user)
-        
-        # Créer la commande
-        commande = Commande.objects.create(
-            user=user,
-            zone_livraison=zone,
-            montant_produits=panier.total,
-            frais_livraison=zone.frais_livraison,
-            **validated_data
-        )
-        
-        # Créer les items
-        for item in panier.items.all():
-            CommandeItem.objects.create(
-                commande=commande,
-                produit=item.produit,
-                quantite=item.quantite,
-                prix_unitaire=item.prix_unitaire
-            )
-        
-        # Vider le panier
-        panier.items.all().delete()
-        
+        commande, message = passer_commande(user=user, zone=zone, **validated_data)
         return commande
 
 
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 
 
 from rest_framework import viewsets, status, filters
@@ -5,13 +7,20 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 
+from boutique import services, suggestions
 from boutique.models import Produit, Panier, PanierItem, Avis
 from production.models import Legume, Stock
 from commandes.models import Commande, ZoneLivraison
+from commandes.services import PanierVide
 from accounts.models import User, PointsFidelite
 
+from .cache import CatalogueCacheMixin
+from .filters import RechercheProduitFilter
+from .idempotence import idempotent
+from .pagination import AvisPagination, CommandePagination
 from .serializers import (
     LegumeSerializer, StockSerializer,
     ProduitListSerializer, ProduitDetailSerializer, AvisSerializer,
@@ -26,7 +35,7 @@ from .serializers import (
 # ViewSets Produits
 # ============================================
 
-class LegumeViewSet(viewsets.ReadOnlyModelViewSet):
+class LegumeViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint pour les légumes (lecture seule)
     """
@@ -35,25 +44,42 @@ class LegumeViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]
 
 
-class ProduitViewSet(viewsets.ReadOnlyModelViewSet):
+class ProduitViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint pour les produits
     
     list: Retourne la liste des produits actifs
     retrieve: Retourne le détail d'un produit
     """
-    queryset = Produit.objects.filter(actif=True)
+    queryset = Produit.objects.catalogue()
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, RechercheProduitFilter, filters.OrderingFilter]
     filterset_fields = ['legume', 'actif']
-    search_fields = ['nom', 'description']
     ordering_fields = ['prix_b2c', 'nom', 'date_creation']
+    actions_en_cache = ('list', 'retrieve', 'en_stock', 'avis')
+    # ?search= alimente les termes fréquents des suggestions
+    parametres_hors_cache = ('search',)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # Auteurs des avis imbriqués chargés avec les avis
+            queryset = queryset.prefetch_related(Prefetch('avis', queryset=Avis.objects.select_related('user')))
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProduitDetailSerializer
         return ProduitListSerializer
     
+    @action(detail=True, methods=['get'])
+    def avis(self, request, pk=None):
+        """Avis du produit, paginés par curseur"""
+        produit = self.get_object()
+        paginator = AvisPagination()
+        page = paginator.paginate_queryset(produit.avis.select_related('user'), request, view=self)
+        return paginator.get_paginated_response(AvisSerializer(page, many=True).data)
+    
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def ajouter_avis(self, request, pk=None):
         """Ajouter un avis sur un produit"""
@@ -75,9 +101,23 @@ class ProduitViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def en_stock(self, request):
         """Retourne uniquement les produits en stock"""
-        produits = [p for p in self.get_queryset() if p.est_disponible]
+        produits = self.get_queryset().en_stock()
         serializer = self.get_serializer(produits, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[AllowAny])
+    def suggest(self, request):
+        """Suggestions de recherche (?q=) servies depuis l'index en mémoire"""
+        texte = request.query_params.get('q', '')
+        try:
+            limite = min(int(request.query_params.get('limit', 10)), 20)
+        except ValueError:
+            limite = 10
+        return Response({
+            'q': texte,
+            'version': suggestions.index_a_jour().version,
+            'suggestions': suggestions.suggerer(texte, limite),
+        })
 
 
 # ============================================
@@ -97,17 +137,21 @@ class PanierViewSet(viewsets.ViewSet):
     
     def list(self, request):
         """Voir le panier"""
-        panier, created = Panier.objects.get_or_create(user=request.user)
-        serializer = PanierSerializer(panier)
+        serializer = PanierSerializer(Panier.du_client(request.user))
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def add_item(self, request):
         """Ajouter un produit au panier"""
-        panier, created = Panier.objects.get_or_create(user=request.user)
-        
         produit_id = request.data.get('produit_id')
-        quantite = float(request.data.get('quantite', 1))
+        try:
+            quantite = services.quantite_valide(request.data.get('quantite', 1))
+        except services.QuantiteInvalide:
+            return Response(
+                {'error': 'Quantité invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         try:
             produit = Produit.objects.get(pk=produit_id, actif=True)
@@ -117,34 +161,20 @@ class PanierViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Vérifier le stock
-        if quantite > produit.stock_disponible:
+        # Ajout ou incrément atomique (requêtes répétées sans perte)
+        try:
+            services.ajouter_au_panier(request.user, produit, quantite)
+        except services.StockInsuffisant as e:
             return Response(
-                {'error': f'Stock insuffisant. Disponible: {produit.stock_disponible} kg'},
+                {'error': f'Stock insuffisant. Disponible: {e.disponible} kg'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Ajouter ou mettre à jour
-        item, created = PanierItem.objects.get_or_create(
-            panier=panier,
-            produit=produit,
-            defaults={'quantite': quantite}
-        )
-        
-        if not created:
-            nouvelle_quantite = item.quantite + quantite
-            if nouvelle_quantite > produit.stock_disponible:
-                return Response(
-                    {'error': f'Stock insuffisant. Disponible: {produit.stock_disponible} kg'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            item.quantite = nouvelle_quantite
-            item.save()
-        
-        serializer = PanierSerializer(panier)
+        serializer = PanierSerializer(Panier.du_client(request.user))
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def remove_item(self, request):
         """Retirer un produit du panier"""
         panier = get_object_or_404(Panier, user=request.user)
@@ -153,7 +183,7 @@ class PanierViewSet(viewsets.ViewSet):
         try:
             item = PanierItem.objects.get(pk=item_id, panier=panier)
             item.delete()
-            serializer = PanierSerializer(panier)
+            serializer = PanierSerializer(Panier.du_client(request.user))
             return Response(serializer.data)
         except PanierItem.DoesNotExist:
             return Response(
@@ -162,11 +192,12 @@ class PanierViewSet(viewsets.ViewSet):
             )
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def clear(self, request):
         """Vider le panier"""
         panier = get_object_or_404(Panier, user=request.user)
         panier.items.all().delete()
-        serializer = PanierSerializer(panier)
+        serializer = PanierSerializer(Panier.du_client(request.user))
         return Response(serializer.data)
 
 
@@ -174,7 +205,7 @@ class PanierViewSet(viewsets.ViewSet):
 # ViewSets Commandes
 # ============================================
 
-class ZoneLivraisonViewSet(viewsets.ReadOnlyModelViewSet):
+class ZoneLivraisonViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint pour les zones de livraison (lecture seule)
     """
@@ -192,10 +223,16 @@ class CommandeViewSet(viewsets.ModelViewSet):
     create: Créer une nouvelle commande
     """
     permission_classes = [IsAuthenticated]
+    pagination_class = CommandePagination
     
     def get_queryset(self):
         """Retourne uniquement les commandes de l'utilisateur"""
-        return Commande.objects.filter(user=self.request.user)
+        queryset = Commande.objects.filter(user=self.request.user).select_related('zone_livraison')
+        if self.action == 'retrieve':
+            queryset = queryset.select_related('user').prefetch_related(
+                'items', Prefetch('items__produit', queryset=Produit.objects.avec_stock())
+            )
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -204,6 +241,7 @@ class CommandeViewSet(viewsets.ModelViewSet):
             return CommandeDetailSerializer
         return CommandeListSerializer
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         """Créer une commande à partir du panier"""
         serializer = self.get_serializer(data=request.data)
@@ -212,18 +250,10 @@ class CommandeViewSet(viewsets.ModelViewSet):
         try:
             commande = serializer.save()
             
-            # Créer notification
-            from notifications.models import Notification
-            Notification.notifier_nouvelle_commande(commande)
-            
-            # Envoyer email
-            from commandes.emails import envoyer_confirmation_commande
-            envoyer_confirmation_commande(commande)
-            
             detail_serializer = CommandeDetailSerializer(commande)
             return Response(detail_serializer.data, status=status.HTTP_201_CREATED)
         
-        except Panier.DoesNotExist:
+        except PanierVide:
             return Response(
                 {'error': 'Panier vide'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import Produit, Panier, PanierItem
 # Ajoute ces imports et classes à boutique/admin.py
 
-from .models import Avis, AvisUtile, Wishlist, WishlistItem
+from .models import Avis, AvisUtile, Wishlist, WishlistItem, TermeRecherche
+from . import suggestions
 
 @admin.register(Avis)
 class AvisAdmin(admin.ModelAdmin):
@@ -76,10 +77,46 @@ class PanierAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email']
     inlines = [PanierItemInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').prefetch_related('items__produit')
+    
     def nombre_articles(self, obj):
         return obj.nombre_articles
     nombre_articles.short_description = 'Nb articles'
     
     def total(self, obj):
         return f"{obj.total} FCFA"
-    total.short_description = 'Total'
\ No newline at end of file
+    total.short_description = 'Total'
+
+@admin.register(TermeRecherche)
+class TermeRechercheAdmin(admin.ModelAdmin):
+    list_display = ['terme', 'nombre', 'approuve', 'derniere_recherche']
+    list_filter = ['approuve']
+    search_fields = ['terme']
+    readonly_fields = ['nombre', 'derniere_recherche']
+    
+    actions = ['approuver', 'retirer']
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        suggestions.invalider()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        suggestions.invalider()
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        suggestions.invalider()
+    
+    def approuver(self, request, queryset):
+        queryset.update(approuve=True)
+        suggestions.invalider()
+        self.message_user(request, "Termes proposés en suggestion")
+    approuver.short_description = "Proposer en suggestion"
+    
+    def retirer(self, request, queryset):
+        queryset.update(approuve=False)
+        suggestions.invalider()
+        self.message_user(request, "Termes retirés des suggestions")
+    retirer.short_description = "Retirer des suggestions"
@@ -0,0 +1,124 @@
+"""
+Cache de réponses versionné pour les pages et endpoints publics du catalogue.
+
+Une « génération » (horodatage en nanosecondes stocké dans le cache partagé)
+change à chaque écriture sur Produit, Stock, Avis, Legume ou ZoneLivraison
+(signaux de boutique.signals, réservations de stock). Les réponses sont
+rangées sous une clé qui contient la génération : une écriture rend toutes
+les entrées obsolètes sans avoir à les énumérer, elles expirent ensuite. Le
+cache doit être commun à tous les processus (CACHE_PROFIL redis ou db en
+production) pour que tous les workers servent la même génération et le
+même ETag.
+
+Chaque réponse porte un ETag (génération + URL) et un Last-Modified
+(date de la génération) : les clients et proxys revalident et obtiennent
+un 304 tant que le catalogue n'a pas changé.
+
+Pages HTML : seules les requêtes anonymes sont servies depuis le cache
+(les pages connectées affichent le panier, les favoris...). Le jeton CSRF
+des formulaires est remplacé par un marqueur au stockage puis par le jeton
+du visiteur à la lecture.
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+CLE_GENERATION = 'catalogue:generation'
+
+_CSRF = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_MARQUEUR_CSRF = b'__CSRF_CATALOGUE__'
+
+
+def generation():
+    """Génération courante du catalogue (créée au premier appel)"""
+    valeur = cache.get(CLE_GENERATION)
+    if valeur is None:
+        cache.add(CLE_GENERATION, time.time_ns(), None)
+        valeur = cache.get(CLE_GENERATION)
+    return valeur
+
+
+def _publier():
+    cache.set(CLE_GENERATION, time.time_ns(), None)
+
+
+def invalider():
+    """Ouvre une nouvelle génération après validation de la transaction"""
+    transaction.on_commit(_publier)
+
+
+def _empreinte(request):
+    brut = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.md5(brut.encode()).hexdigest()
+
+
+def reponse_versionnee(request, calculer, avant_stockage=None, apres_lecture=None):
+    """
+    Sert `calculer()` (qui retourne une réponse rendue) depuis le cache
+    versionné, avec ETag / Last-Modified et 304 conditionnels.
+    """
+    gen = generation()
+    empreinte = _empreinte(request)
+    etag = f'"{gen}-{empreinte[:16]}"'
+    modifie = gen // 1_000_000_000
+
+    response = get_conditional_response(request, etag=etag, last_modified=modifie)
+    if response is None:
+        cle = f'catalogue:reponse:{gen}:{empreinte}'
+        entree = cache.get(cle)
+        if entree is not None:
+            contenu, content_type = entree
+            if apres_lecture:
+                contenu = apres_lecture(contenu)
+            response = HttpResponse(contenu, content_type=content_type)
+        else:
+            response = calculer()
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                contenu = response.content
+                if avant_stockage:
+                    contenu = avant_stockage(contenu)
+                cache.set(
+                    cle, (contenu, response['Content-Type']),
+                    settings.CATALOGUE_CACHE_TIMEOUT
+                )
+
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modifie)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def cache_catalogue(view):
+    """Décorateur des vues HTML publiques du catalogue"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or request.user.is_authenticated
+            or 'messages' in request.COOKIES
+        ):
+            return view(request, *args, **kwargs)
+
+        def apres_lecture(contenu):
+            return contenu.replace(_MARQUEUR_CSRF, get_token(request).encode())
+
+        response = reponse_versionnee(
+            request,
+            lambda: view(request, *args, **kwargs),
+            avant_stockage=lambda contenu: _CSRF.sub(rb'\1' + _MARQUEUR_CSRF + rb'\2', contenu),
+            apres_lecture=apres_lecture,
+        )
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapper
@@ -0,0 +1,132 @@
+"""
+Indicateurs du dashboard administrateur
+
+Calculés en quelques requêtes groupées (agrégats filtrés, ventes
+journalières pré-agrégées, comparaison F('seuil_alerte')) et mis en cache pendant
+DASHBOARD_CACHE_TIMEOUT secondes ; le cache est invalidé à la validation
+de la transaction qui enregistre ou supprime une commande payée.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from commandes.models import Commande, CommandeItem, VenteJournaliere
+from production.models import Stock
+
+CLE_CACHE = 'dashboard:statistiques'
+
+
+def _debuts_de_mois(maintenant, nombre):
+    """Premiers jours des `nombre` derniers mois, du plus ancien au plus récent"""
+    debut = maintenant.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    mois = [debut]
+    for _ in range(nombre - 1):
+        debut = (debut - timedelta(days=1)).replace(day=1)
+        mois.append(debut)
+    return list(reversed(mois))
+
+
+def calculer_statistiques():
+    """Calcule tous les indicateurs du dashboard"""
+    from accounts.models import User
+    
+    maintenant = timezone.now()
+    mois = _debuts_de_mois(maintenant, 6)
+    
+    # Commandes : total et commandes du mois en une requête
+    commandes = Commande.objects.aggregate(
+        total_commandes=Count('id'),
+        commandes_mois=Count('id', filter=Q(date_commande__gte=mois[-1])),
+    )
+    
+    # Clients
+    clients = User.objects.aggregate(
+        total_clients=Count('id', filter=Q(user_type__in=['B2C', 'B2B'])),
+        nouveaux_clients=Count('id', filter=Q(date_creation__gte=maintenant - timedelta(days=30))),
+    )
+    
+    # Stock
+    stock_total = Stock.objects.aggregate(total=Sum('quantite_disponible'))['total'] or 0
+    alertes_stock = list(
+        Stock.objects.filter(quantite_disponible__lte=F('seuil_alerte')).select_related('legume')
+    )
+    
+    # Chiffre d'affaires sur le même montant que la série mensuelle : lignes
+    # des commandes payées et non annulées (hors livraison et réduction)
+    ca_total = VenteJournaliere.objects.aggregate(total=Sum('chiffre_affaires'))['total'] or 0
+    
+    # Ventes par mois (6 derniers mois), depuis les ventes journalières
+    ventes = dict(
+        VenteJournaliere.objects.filter(date__gte=mois[0].date())
+        .annotate(mois=TruncMonth('date'))
+        .values('mois')
+        .annotate(total=Sum('chiffre_affaires'))
+        .values_list('mois', 'total')
+    )
+    ventes_par_mois = [float(ventes.get(debut.date(), 0) or 0) for debut in mois]
+    labels_mois = [debut.strftime('%B') for debut in mois]
+    
+    # Top produits
+    top_produits = list(
+        VenteJournaliere.objects.values('produit__nom')
+        .annotate(quantite=Sum('quantite'))
+        .order_by('-quantite')[:4]
+    )
+    
+    # Commandes récentes
+    commandes_recentes = list(
+        Commande.objects.select_related('user').order_by('-date_commande')[:10]
+    )
+    
+    # Top clients sur le même montant que le chiffre d'affaires (lignes des
+    # commandes payées et non annulées), utilisateurs chargés en une requête
+    top_clients = list(
+        CommandeItem.objects.filter(commande__paiement_valide=True)
+        .exclude(commande__statut='ANNULEE')
+        .values('commande__user')
+        .annotate(
+            total_commandes=Count('commande', distinct=True),
+            total_depense=Sum('sous_total'),
+            derniere_commande=Max('commande__date_commande')
+        )
+        .order_by('-total_depense')[:5]
+    )
+    users = User.objects.in_bulk([client['commande__user'] for client in top_clients])
+    for client in top_clients:
+        client['user'] = users[client.pop('commande__user')]
+    
+    return {
+        'stats': {
+            'ca_total': ca_total,
+            'total_commandes': commandes['total_commandes'],
+            'commandes_mois': commandes['commandes_mois'],
+            'total_clients': clients['total_clients'],
+            'nouveaux_clients': clients['nouveaux_clients'],
+            'stock_total': stock_total,
+            'alertes_stock': len(alertes_stock),
+        },
+        'ventes_labels': labels_mois,
+        'ventes_data': ventes_par_mois,
+        'produits_labels': [p['produit__nom'] for p in top_produits],
+        'produits_data': [float(p['quantite']) for p in top_produits],
+        'commandes_recentes': commandes_recentes,
+        'alertes_stock': alertes_stock,
+        'top_clients': top_clients,
+    }
+
+
+def statistiques_dashboard():
+    """Indicateurs du dashboard, depuis le cache si possible"""
+    statistiques = cache.get(CLE_CACHE)
+    if statistiques is None:
+        statistiques = calculer_statistiques()
+        cache.set(CLE_CACHE, statistiques, settings.DASHBOARD_CACHE_TIMEOUT)
+    return statistiques
+
+
+def invalider_dashboard():
+    cache.delete(CLE_CACHE)
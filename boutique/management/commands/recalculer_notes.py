@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from boutique.models import Produit
+
+
+class Command(BaseCommand):
+    help = "Recalcule la note moyenne et le nombre d'avis de chaque produit à partir des avis"
+
+    def handle(self, *args, **options):
+        nombre = Produit.objects.recalculer_notes()
+        self.stdout.write(self.style.SUCCESS(f"Notes recalculées pour {nombre} produit(s)"))
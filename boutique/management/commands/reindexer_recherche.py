@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from boutique.search import reindexer
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des produits (SQLite FTS5 ou PostgreSQL)"
+
+    def handle(self, *args, **options):
+        nombre = reindexer()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} produit(s) indexé(s)"))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:49
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calculer_notes(apps, schema_editor):
+    Produit = apps.get_model('boutique', 'Produit')
+    Avis = apps.get_model('boutique', 'Avis')
+    agregats = Avis.objects.values('produit').annotate(somme=Sum('note'), nombre=Count('pk'))
+    for agregat in agregats:
+        Produit.objects.filter(pk=agregat['produit']).update(
+            note_somme=agregat['somme'],
+            nombre_avis=agregat['nombre'],
+            note_moyenne=round(agregat['somme'] / agregat['nombre'], 1),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0002_avis_wishlist_avisutile_wishlistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='nombre_avis',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Nombre d'avis"),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='note_moyenne',
+            field=models.DecimalField(db_index=True, decimal_places=1, default=0, editable=False, max_digits=3, verbose_name='Note moyenne'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='note_somme',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Somme des notes'),
+        ),
+        migrations.RunPython(calculer_notes, migrations.RunPython.noop),
+    ]
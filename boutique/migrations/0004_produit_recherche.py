@@ -0,0 +1,82 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Copie figée de boutique.search : la migration ne dépend pas du code courant
+TABLE_FTS = 'boutique_produit_fts'
+CONFIG_POSTGRES = 'fr_unaccent'
+
+MOTS_VIDES = {
+    'a', 'au', 'aux', 'avec', 'ce', 'ces', 'd', 'dans', 'de', 'des', 'du',
+    'en', 'et', 'l', 'la', 'le', 'les', 'leur', 'ou', 'par', 'pour', 'sur',
+    'un', 'une',
+}
+
+
+def raciniser(mot):
+    if len(mot) > 4 and mot.endswith('aux'):
+        return mot[:-3] + 'al'
+    if len(mot) > 3 and mot[-1] in 'sx':
+        mot = mot[:-1]
+    if len(mot) > 3 and mot.endswith('e'):
+        mot = mot[:-1]
+    return mot
+
+
+def normaliser(texte):
+    decompose = unicodedata.normalize('NFKD', (texte or '').lower())
+    texte = ''.join(c for c in decompose if not unicodedata.combining(c))
+    return ' '.join(raciniser(mot) for mot in re.findall(r'\w+', texte) if mot not in MOTS_VIDES)
+
+
+def creer_index(apps, schema_editor):
+    connexion = schema_editor.connection
+    if connexion.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_FTS} "
+            f"USING fts5(nom, description, legume, tokenize='unicode61 remove_diacritics 2')"
+        )
+        Produit = apps.get_model('boutique', 'Produit')
+        with connexion.cursor() as cursor:
+            for produit in Produit.objects.select_related('legume'):
+                cursor.execute(
+                    f"INSERT INTO {TABLE_FTS} (rowid, nom, description, legume) VALUES (%s, %s, %s, %s)",
+                    [
+                        produit.pk,
+                        normaliser(produit.nom),
+                        normaliser(produit.description),
+                        normaliser(produit.legume.nom),
+                    ]
+                )
+    elif connexion.vendor == 'postgresql':
+        # Configuration seule : la table indexée est créée par 0010
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        schema_editor.execute(
+            f"""
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIG_POSTGRES}') THEN
+                    CREATE TEXT SEARCH CONFIGURATION {CONFIG_POSTGRES} (COPY = french);
+                    ALTER TEXT SEARCH CONFIGURATION {CONFIG_POSTGRES}
+                        ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+                END IF;
+            END $$
+            """
+        )
+
+
+def supprimer_index(apps, schema_editor):
+    connexion = schema_editor.connection
+    if connexion.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE_FTS}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0003_produit_notes'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0004_produit_recherche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermeRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terme', models.CharField(max_length=100, unique=True, verbose_name='Terme')),
+                ('nombre', models.PositiveIntegerField(default=0, verbose_name='Nombre de recherches')),
+                ('derniere_recherche', models.DateTimeField(auto_now=True, verbose_name='Dernière recherche')),
+            ],
+            options={
+                'verbose_name': 'Terme recherché',
+                'verbose_name_plural': 'Termes recherchés',
+                'ordering': ['-nombre'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0005_termerecherche'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(fields=['produit', 'date_creation', 'id'], name='avis_produit_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0006_avis_avis_produit_date_idx'),
+        ('production', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('actif', True)), fields=['legume'], name='produit_actif_idx'),
+        ),
+    ]
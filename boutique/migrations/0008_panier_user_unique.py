@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def fusionner_paniers(apps, schema_editor):
+    """Regroupe les articles des paniers en double dans le plus ancien"""
+    Panier = apps.get_model('boutique', 'Panier')
+    PanierItem = apps.get_model('boutique', 'PanierItem')
+    doublons = Panier.objects.values('user').annotate(nombre=Count('pk')).filter(nombre__gt=1)
+    for ligne in doublons:
+        conserve, *autres = Panier.objects.filter(user_id=ligne['user']).order_by('pk')
+        for item in PanierItem.objects.filter(panier__in=autres):
+            if not PanierItem.objects.filter(panier=conserve, produit_id=item.produit_id).update(
+                quantite=F('quantite') + item.quantite
+            ):
+                PanierItem.objects.filter(pk=item.pk).update(panier=conserve)
+        Panier.objects.filter(pk__in=[panier.pk for panier in autres]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0007_produit_produit_actif_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionner_paniers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='panier',
+            constraint=models.UniqueConstraint(fields=('user',), name='panier_user_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0008_panier_user_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='termerecherche',
+            name='approuve',
+            field=models.BooleanField(default=False, help_text="Les termes saisis par les visiteurs ne sont suggérés qu'après validation", verbose_name='Proposé en suggestion'),
+        ),
+    ]
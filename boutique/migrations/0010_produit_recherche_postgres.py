@@ -0,0 +1,56 @@
+from django.db import migrations
+
+TABLE_POSTGRES = 'boutique_produit_recherche'
+CONFIG_POSTGRES = 'fr_unaccent'
+
+
+def creer_table(apps, schema_editor):
+    """
+    PostgreSQL : le document indexé inclut le nom du légume (comme l'index
+    FTS5 de SQLite), ce qu'un index d'expression sur boutique_produit ne
+    permet pas : table dédiée tenue à jour par signaux.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_POSTGRES} (
+            produit_id bigint PRIMARY KEY REFERENCES boutique_produit (id) ON DELETE CASCADE
+                DEFERRABLE INITIALLY DEFERRED,
+            document tsvector NOT NULL
+        )
+        """
+    )
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {TABLE_POSTGRES}_document_idx ON {TABLE_POSTGRES} USING GIN (document)"
+    )
+    schema_editor.execute(
+        f"""
+        INSERT INTO {TABLE_POSTGRES} (produit_id, document)
+        SELECT produit.id,
+            setweight(to_tsvector('{CONFIG_POSTGRES}', produit.nom), 'A')
+            || setweight(to_tsvector('{CONFIG_POSTGRES}', legume.nom), 'B')
+            || setweight(to_tsvector('{CONFIG_POSTGRES}', produit.description), 'C')
+        FROM boutique_produit produit
+        JOIN production_legume legume ON legume.id = produit.legume_id
+        ON CONFLICT (produit_id) DO NOTHING
+        """
+    )
+
+
+def supprimer_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE_POSTGRES}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0009_termerecherche_approuve'),
+        ('production', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_table, supprimer_table),
+    ]
@@ -1,6 +1,74 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, FloatField, OuterRef, Prefetch, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Cast, Coalesce, Round
 from production.models import Legume
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+
+class ProduitQuerySet(models.QuerySet):
+    """
+    Requêtes réutilisables pour l'affichage des produits
+    """
+
+    def catalogue(self):
+        """
+        Produits actifs avec leur stock calculé dans la même requête SQL
+        (note moyenne et nombre d'avis sont stockés sur le produit)
+        """
+        return self.filter(actif=True).avec_stock()
+
+    def avec_stock(self):
+        """Produits (actifs ou non) avec leur légume et leur stock en une requête"""
+        return self.select_related('legume').annotate(
+            stock_annote=Coalesce(
+                'legume__stock__quantite_disponible',
+                Value(0),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            ),
+        )
+
+    def en_stock(self):
+        """Produits du catalogue dont le stock est positif"""
+        return self.filter(stock_annote__gt=0)
+
+    def ajuster_notes(self, delta_somme, delta_nombre):
+        """
+        Ajoute delta_somme / delta_nombre aux agrégats de notes
+        de façon atomique (expressions F, sans lecture préalable)
+        """
+        with transaction.atomic():
+            self.update(
+                note_somme=F('note_somme') + delta_somme,
+                nombre_avis=F('nombre_avis') + delta_nombre,
+            )
+            self._maj_note_moyenne()
+
+    def recalculer_notes(self):
+        """Recalcule entièrement les agrégats de notes depuis les avis"""
+        avis = Avis.objects.filter(produit=OuterRef('pk')).order_by().values('produit')
+        with transaction.atomic():
+            nombre = self.update(
+                note_somme=Coalesce(Subquery(avis.annotate(s=Sum('note')).values('s')), 0),
+                nombre_avis=Coalesce(Subquery(avis.annotate(c=Count('pk')).values('c')), 0),
+            )
+            self._maj_note_moyenne()
+        return nombre
+
+    def _maj_note_moyenne(self):
+        # Requête séparée : certains SGBD (MySQL) évaluent les colonnes
+        # déjà modifiées dans un même UPDATE
+        self.update(note_moyenne=Case(
+            When(nombre_avis__gt=0, then=Round(
+                Cast('note_somme', FloatField()) / F('nombre_avis'), 1
+            )),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=1),
+        ))
+
+
 class Produit(models.Model):
     """
     Produits disponibles à la vente (basés sur les légumes)
@@ -36,12 +104,37 @@ class Produit(models.Model):
         verbose_name="Produit actif",
         help_text="Décocher pour masquer le produit de la boutique"
     )
+    # Agrégats des avis, maintenus par Avis.save et le signal post_delete
+    note_somme = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Somme des notes"
+    )
+    nombre_avis = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Nombre d'avis"
+    )
+    note_moyenne = models.DecimalField(
+        max_digits=3,
+        decimal_places=1,
+        default=0,
+        editable=False,
+        db_index=True,
+        verbose_name="Note moyenne"
+    )
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
     
+    objects = ProduitQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
+        indexes = [
+            # Catalogue : seuls les produits actifs, joints à leur légume
+            models.Index(fields=['legume'], condition=models.Q(actif=True), name='produit_actif_idx'),
+        ]
     
     def __str__(self):
         return self.nom
@@ -49,12 +142,11 @@ class Produit(models.Model):
     @property
     def stock_disponible(self):
         """Retourne le stock disponible pour ce produit"""
-        from production.models import Stock
-        try:
-            stock = Stock.objects.get(legume=self.legume)
-            return stock.quantite_disponible
-        except Stock.DoesNotExist:
-            return 0
+        # Valeur déjà calculée par Produit.objects.catalogue()
+        if hasattr(self, 'stock_annote'):
+            return self.stock_annote
+        from production import stock_cache
+        return stock_cache.quantite_disponible(self.legume_id)
     
     @property
     def est_disponible(self):
@@ -90,21 +182,45 @@ class Panier(models.Model):
     class Meta:
         verbose_name = "Panier"
         verbose_name_plural = "Paniers"
+        constraints = [
+            # Un seul panier par client : deux premiers ajouts simultanés
+            # retrouvent le même panier (get_or_create)
+            models.UniqueConstraint(fields=['user'], name='panier_user_unique'),
+        ]
     
     def __str__(self):
         return f"Panier de {self.user}"
     
+    @classmethod
+    def du_client(cls, user):
+        """
+        Panier du client (créé au besoin), articles, produits, légumes et
+        stocks préchargés : affichage en un nombre fixe de requêtes
+        """
+        panier, created = cls.objects.select_related('user').prefetch_related(
+            'items', Prefetch('items__produit', queryset=Produit.objects.avec_stock())
+        ).get_or_create(user=user)
+        return panier
+    
+    def _articles(self):
+        """Articles préchargés par du_client(), sinon lus avec leur produit"""
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.items.all()
+        return self.items.select_related('produit')
+    
     @property
     def total(self):
         """Calcule le montant total du panier"""
         total = 0
-        for item in self.items.all():
+        for item in self._articles():
             total += item.sous_total
         return total
     
     @property
     def nombre_articles(self):
         """Compte le nombre d'articles dans le panier"""
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return len(self.items.all())
         return self.items.count()
 
 
@@ -195,6 +311,9 @@ class Avis(models.Model):
         verbose_name_plural = "Avis"
         ordering = ['-date_creation']
         unique_together = ['produit', 'user']  # Un avis par produit par utilisateur
+        indexes = [
+            models.Index(fields=['produit', 'date_creation', 'id'], name='avis_produit_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.produit.nom} ({self.note}⭐)"
@@ -208,7 +327,22 @@ class Avis(models.Model):
             produit=self.produit
         ).exists()
         self.verifie = has_bought
-        super().save(*args, **kwargs)
+        
+        with transaction.atomic():
+            # Ligne verrouillée : deux modifications concurrentes ne
+            # calculent pas leur delta depuis la même ancienne note
+            ancien = None
+            if not self._state.adding:
+                ancien = Avis.objects.select_for_update().filter(pk=self.pk).values('produit_id', 'note').first()
+            super().save(*args, **kwargs)
+            # Mettre à jour les agrégats de notes du produit
+            if ancien is None:
+                Produit.objects.filter(pk=self.produit_id).ajuster_notes(self.note, 1)
+            elif ancien['produit_id'] != self.produit_id:
+                Produit.objects.filter(pk=ancien['produit_id']).ajuster_notes(-ancien['note'], -1)
+                Produit.objects.filter(pk=self.produit_id).ajuster_notes(self.note, 1)
+            elif ancien['note'] != self.note:
+                Produit.objects.filter(pk=self.produit_id).ajuster_notes(self.note - ancien['note'], 0)
 
 
 class AvisUtile(models.Model):
@@ -235,21 +369,6 @@ class AvisUtile(models.Model):
         return f"{self.user.username} trouve utile l'avis de {self.avis.user.username}"
 
 
-# Ajoute cette méthode à la classe Produit existante
-def note_moyenne(self):
-    """Calcule la note moyenne du produit"""
-    from django.db.models import Avg
-    avg = self.avis.aggregate(Avg('note'))['note__avg']
-    return round(avg, 1) if avg else 0
-
-def nombre_avis(self):
-    """Compte le nombre d'avis"""
-    return self.avis.count()
-
-# Ajoute ces méthodes comme properties à la classe Produit
-Produit.note_moyenne = property(note_moyenne)
-Produit.nombre_avis = property(nombre_avis)
-
 # Ajoute ce modèle à la fin de boutique/models.py
 
 class Wishlist(models.Model):
@@ -303,4 +422,67 @@ class WishlistItem(models.Model):
         ordering = ['-date_ajout']
     
     def __str__(self):
-        return f"{self.produit.nom} - {self.wishlist.user.username}"
\ No newline at end of file
+        return f"{self.produit.nom} - {self.wishlist.user.username}"
+
+class TermeRecherche(models.Model):
+    """
+    Termes saisis dans la recherche, comptés pour alimenter les suggestions
+    """
+    terme = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name="Terme"
+    )
+    nombre = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Nombre de recherches"
+    )
+    derniere_recherche = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Dernière recherche"
+    )
+    approuve = models.BooleanField(
+        default=False,
+        verbose_name="Proposé en suggestion",
+        help_text="Les termes saisis par les visiteurs ne sont suggérés qu'après validation"
+    )
+    
+    class Meta:
+        verbose_name = "Terme recherché"
+        verbose_name_plural = "Termes recherchés"
+        ordering = ['-nombre']
+    
+    def __str__(self):
+        return f"{self.terme} ({self.nombre})"
+    
+    @classmethod
+    def enregistrer(cls, texte):
+        """
+        Compte une recherche (terme normalisé, sans accents) en mémoire ;
+        écrite en lot par boutique.suggestions.vider_recherches
+        """
+        from . import suggestions
+        from .search import sans_accents
+        terme = ' '.join(sans_accents(texte).split())[:100]
+        if terme:
+            suggestions.compter_recherche(terme)
+
+    @classmethod
+    def enregistrer_lot(cls, comptes):
+        """
+        Ajoute les comptes {terme: nombre} : une insertion pour les nouveaux
+        termes, puis une mise à jour par valeur de compte distincte
+        """
+        maintenant = timezone.now()
+        par_nombre = {}
+        for terme, nombre in comptes.items():
+            par_nombre.setdefault(nombre, []).append(terme)
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(terme=terme, nombre=0) for terme in sorted(comptes)],
+                ignore_conflicts=True
+            )
+            for nombre, termes in sorted(par_nombre.items()):
+                cls.objects.filter(terme__in=termes).update(
+                    nombre=F('nombre') + nombre, derniere_recherche=maintenant
+                )
@@ -0,0 +1,184 @@
+"""
+Recherche plein texte sur les produits.
+
+- SQLite : table virtuelle FTS5 ``boutique_produit_fts``, classement BM25.
+- PostgreSQL : table ``boutique_produit_recherche`` (tsvector, index GIN,
+  configuration ``fr_unaccent`` = français + unaccent), classement ts_rank.
+- Autres moteurs : repli sur icontains.
+
+Les deux index contiennent le nom, la description et le nom du légume
+(poids décroissants : nom, légume, description) et sont tenus à jour par
+les signaux de boutique. Le filtre et le score sont des sous-requêtes SQL
+sur l'index : le tri et la pagination restent dans la base quel que soit
+le nombre de résultats.
+
+Les textes sont normalisés (minuscules, sans accents) et réduits par un
+raciniseur français léger, à l'indexation comme à la requête, afin que
+« aubergine » trouve « Aubergines ».
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+TABLE_FTS = 'boutique_produit_fts'
+TABLE_POSTGRES = 'boutique_produit_recherche'
+CONFIG_POSTGRES = 'fr_unaccent'
+
+# Poids BM25 des colonnes (nom, description, legume)
+POIDS_BM25 = (10.0, 1.0, 5.0)
+
+MOTS_VIDES = {
+    'a', 'au', 'aux', 'avec', 'ce', 'ces', 'd', 'dans', 'de', 'des', 'du',
+    'en', 'et', 'l', 'la', 'le', 'les', 'leur', 'ou', 'par', 'pour', 'sur',
+    'un', 'une',
+}
+
+_MOT = re.compile(r'\w+')
+
+
+def sans_accents(texte):
+    """Minuscules sans diacritiques"""
+    decompose = unicodedata.normalize('NFKD', texte.lower())
+    return ''.join(c for c in decompose if not unicodedata.combining(c))
+
+
+def raciniser(mot):
+    """
+    Raciniseur français léger : retire les marques de pluriel et de féminin
+    (aubergines -> aubergin, courges -> courg, chevaux -> cheval).
+    """
+    if len(mot) > 4 and mot.endswith('aux'):
+        return mot[:-3] + 'al'
+    if len(mot) > 3 and mot[-1] in 'sx':
+        mot = mot[:-1]
+    if len(mot) > 3 and mot.endswith('e'):
+        mot = mot[:-1]
+    return mot
+
+
+def termes(texte):
+    """Racines des mots significatifs d'un texte"""
+    return [
+        raciniser(mot)
+        for mot in _MOT.findall(sans_accents(texte or ''))
+        if mot not in MOTS_VIDES
+    ]
+
+
+def normaliser(texte):
+    """Texte tel qu'il est stocké dans l'index FTS5"""
+    return ' '.join(termes(texte))
+
+
+# ---------------------------------------------------------------------------
+# Synchronisation de l'index
+# ---------------------------------------------------------------------------
+
+def indexer_produit(produit):
+    """Insère ou remplace l'entrée d'index d'un produit"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE_FTS} WHERE rowid = %s", [produit.pk])
+            cursor.execute(
+                f"INSERT INTO {TABLE_FTS} (rowid, nom, description, legume) VALUES (%s, %s, %s, %s)",
+                [
+                    produit.pk,
+                    normaliser(produit.nom),
+                    normaliser(produit.description),
+                    normaliser(produit.legume.nom),
+                ]
+            )
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {TABLE_POSTGRES} (produit_id, document) VALUES (%s,
+                    setweight(to_tsvector('{CONFIG_POSTGRES}', %s), 'A')
+                    || setweight(to_tsvector('{CONFIG_POSTGRES}', %s), 'B')
+                    || setweight(to_tsvector('{CONFIG_POSTGRES}', %s), 'C'))
+                ON CONFLICT (produit_id) DO UPDATE SET document = EXCLUDED.document
+                """,
+                [produit.pk, produit.nom, produit.legume.nom, produit.description]
+            )
+
+
+def supprimer_produit(produit_id):
+    """Retire un produit de l'index (PostgreSQL : suppression en cascade)"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE_FTS} WHERE rowid = %s", [produit_id])
+
+
+def reindexer():
+    """Reconstruit tout l'index ; retourne le nombre de produits indexés"""
+    from .models import Produit
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE_FTS if connection.vendor == 'sqlite' else TABLE_POSTGRES}")
+    nombre = 0
+    for produit in Produit.objects.select_related('legume').iterator():
+        indexer_produit(produit)
+        nombre += 1
+    return nombre
+
+
+# ---------------------------------------------------------------------------
+# Requêtes
+# ---------------------------------------------------------------------------
+
+def _colonne_pk(queryset):
+    """Clé primaire de la table principale, pour corréler le score"""
+    meta = queryset.model._meta
+    return f'{connection.ops.quote_name(meta.db_table)}.{connection.ops.quote_name(meta.pk.column)}'
+
+
+def _rechercher_sqlite(queryset, mots):
+    # Chaque racine est un préfixe ; les termes sont combinés en ET
+    expression = ' '.join(f'"{mot}"*' for mot in mots)
+    poids = ', '.join(str(p) for p in POIDS_BM25)
+    correspondances = RawSQL(f"SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s", [expression])
+    # bm25() est négatif : plus il est petit, plus le document est pertinent
+    score = RawSQL(
+        f"SELECT -bm25({TABLE_FTS}, {poids}) FROM {TABLE_FTS} "
+        f"WHERE {TABLE_FTS} MATCH %s AND rowid = {_colonne_pk(queryset)}",
+        [expression], output_field=FloatField()
+    )
+    return queryset.filter(pk__in=correspondances).annotate(pertinence=score)
+
+
+def _rechercher_postgres(queryset, texte):
+    requete = f"websearch_to_tsquery('{CONFIG_POSTGRES}', %s)"
+    correspondances = RawSQL(f"SELECT produit_id FROM {TABLE_POSTGRES} WHERE document @@ {requete}", [texte])
+    score = RawSQL(
+        f"SELECT ts_rank(document, {requete}) FROM {TABLE_POSTGRES} "
+        f"WHERE produit_id = {_colonne_pk(queryset)}",
+        [texte], output_field=FloatField()
+    )
+    return queryset.filter(pk__in=correspondances).annotate(pertinence=score)
+
+
+def rechercher(queryset, texte):
+    """
+    Filtre un queryset de produits sur le texte recherché et l'annote avec
+    ``pertinence`` (plus grand = plus pertinent). L'ordre n'est pas imposé.
+    """
+    mots = termes(texte)
+    if not mots:
+        return queryset.annotate(pertinence=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == 'sqlite':
+        return _rechercher_sqlite(queryset, mots)
+    if connection.vendor == 'postgresql':
+        return _rechercher_postgres(queryset, texte)
+
+    filtre = Q()
+    for mot in mots:
+        filtre &= (
+            Q(nom__icontains=mot) | Q(description__icontains=mot) | Q(legume__nom__icontains=mot)
+        )
+    return queryset.filter(filtre).annotate(pertinence=Value(0.0, output_field=FloatField()))
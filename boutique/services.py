@@ -0,0 +1,89 @@
+"""
+Modification du panier sans perte de mise à jour
+
+Deux requêtes simultanées (double clic, nouvel essai d'une application
+mobile) ne doivent ni perdre un incrément ni échouer sur l'unicité
+(panier, produit). L'article est incrémenté par un UPDATE ... SET
+quantite = quantite + x dont la clause WHERE vérifie aussi le stock ;
+s'il n'existe pas encore, il est inséré dans un point de sauvegarde et
+une insertion concurrente se replie sur l'UPDATE.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Panier, PanierItem
+
+
+class StockInsuffisant(Exception):
+    """La quantité demandée dépasse le stock disponible"""
+
+    def __init__(self, disponible):
+        self.disponible = disponible
+        super().__init__(f"Stock insuffisant. Disponible : {disponible} kg")
+
+
+class QuantiteInvalide(ValueError):
+    """La quantité n'est pas un nombre de kilos strictement positif"""
+
+    def __init__(self):
+        super().__init__("Quantité invalide")
+
+
+def quantite_valide(valeur):
+    """
+    Convertit `valeur` en Decimal fini, strictement positif et d'au plus
+    deux décimales (précision de PanierItem.quantite) ; lève
+    QuantiteInvalide sinon (NaN, Infinity, zéro, négatif, texte)
+    """
+    try:
+        quantite = Decimal(str(valeur))
+    except InvalidOperation:
+        raise QuantiteInvalide()
+    if not quantite.is_finite() or quantite <= 0 or quantite != quantite.quantize(Decimal('0.01')):
+        raise QuantiteInvalide()
+    return quantite
+
+
+def panier_de(user):
+    """
+    Panier de l'utilisateur, créé au premier ajout. La contrainte
+    panier_user_unique fait échouer une création concurrente, que
+    get_or_create replie sur la lecture du panier déjà créé.
+    """
+    return Panier.objects.get_or_create(user=user)[0]
+
+
+def _incrementer(panier, produit, quantite, disponible):
+    return PanierItem.objects.filter(
+        panier=panier, produit=produit, quantite__lte=disponible - quantite
+    ).update(quantite=F('quantite') + quantite)
+
+
+def ajouter_au_panier(user, produit, quantite):
+    """
+    Ajoute `quantite` kg de `produit` au panier de `user`.
+
+    Retourne le panier ; lève QuantiteInvalide si la quantité n'est pas
+    un nombre strictement positif et StockInsuffisant si la quantité
+    totale de l'article dépasserait le stock disponible.
+    """
+    quantite = quantite_valide(quantite)
+    disponible = Decimal(produit.stock_disponible)
+    if quantite > disponible:
+        raise StockInsuffisant(disponible)
+
+    panier = panier_de(user)
+    with transaction.atomic():
+        if _incrementer(panier, produit, quantite, disponible):
+            return panier
+        try:
+            with transaction.atomic():
+                PanierItem.objects.create(panier=panier, produit=produit, quantite=quantite)
+        except IntegrityError:
+            # L'article existe (déjà présent ou inséré en parallèle) :
+            # l'incrément a échoué sur le stock
+            if not _incrementer(panier, produit, quantite, disponible):
+                raise StockInsuffisant(disponible)
+    return panier
@@ -0,0 +1,83 @@
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from commandes.models import Commande, ZoneLivraison
+from production.models import Legume, Stock
+from grow_with_green import entete
+from .models import Avis, PanierItem, Produit
+from .dashboard import invalider_dashboard
+from . import cache_catalogue, search, suggestions
+
+@receiver(post_delete, sender=Avis)
+def retirer_note_avis(sender, instance, **kwargs):
+    """Retirer la note d'un avis supprimé des agrégats du produit"""
+    Produit.objects.filter(pk=instance.produit_id).ajuster_notes(-instance.note, -1)
+
+
+@receiver(post_save, sender=Commande)
+@receiver(post_delete, sender=Commande)
+def invalider_dashboard_commande(sender, instance, **kwargs):
+    """
+    Une commande payée modifie le chiffre d'affaires du dashboard.
+    Invalidé après la validation : un dashboard recalculé avant ne
+    verrait pas encore la commande et resterait en cache.
+    """
+    if instance.paiement_valide:
+        transaction.on_commit(invalider_dashboard)
+
+
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, **kwargs):
+    """Tenir l'index de recherche à jour"""
+    search.indexer_produit(instance)
+    suggestions.invalider()
+
+
+@receiver(post_delete, sender=Produit)
+def desindexer_produit(sender, instance, **kwargs):
+    """Retirer un produit supprimé de l'index de recherche"""
+    search.supprimer_produit(instance.pk)
+    suggestions.invalider()
+
+
+@receiver(post_save, sender=Legume)
+def reindexer_legume(sender, instance, **kwargs):
+    """Le nom du légume fait partie du document indexé"""
+    for produit in Produit.objects.filter(legume=instance).select_related('legume'):
+        search.indexer_produit(produit)
+    suggestions.invalider()
+
+
+@receiver(post_delete, sender=Legume)
+def retirer_legume_suggestions(sender, instance, **kwargs):
+    """Un légume supprimé ne doit plus être suggéré"""
+    suggestions.invalider()
+
+
+@receiver(request_finished)
+def vider_recherches(sender, **kwargs):
+    """Écrire les recherches comptées, une fois la réponse envoyée"""
+    suggestions.vider_recherches()
+
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+@receiver(post_save, sender=Avis)
+@receiver(post_delete, sender=Avis)
+@receiver(post_save, sender=Legume)
+@receiver(post_delete, sender=Legume)
+@receiver(post_save, sender=ZoneLivraison)
+@receiver(post_delete, sender=ZoneLivraison)
+def invalider_catalogue(sender, **kwargs):
+    """Toute écriture sur le catalogue ouvre une nouvelle génération de cache"""
+    cache_catalogue.invalider()
+
+
+@receiver(post_save, sender=PanierItem)
+@receiver(post_delete, sender=PanierItem)
+def invalider_entete_panier(sender, instance, **kwargs):
+    """Le nombre d'articles du panier est affiché dans l'en-tête"""
+    entete.invalider_panier_item(instance)
@@ -0,0 +1,217 @@
+"""
+Suggestions de recherche (autocomplétion) servies depuis la mémoire du worker.
+
+L'index est un tableau trié de clés normalisées (minuscules, sans accents)
+interrogé par dichotomie (bisect) : une suggestion ne touche pas la base.
+Chaque libellé est indexé à partir du début de chacun de ses mots, afin que
+« viol » propose « Aubergines violettes ».
+
+Sources : noms des produits actifs, noms des légumes, termes recherchés
+fréquemment (TermeRecherche) et validés dans l'administration : un texte
+saisi par un visiteur n'est jamais proposé publiquement sans validation.
+
+L'index est construit au démarrage du worker (prechauffer, appelé par
+grow_with_green.wsgi) : la première suggestion ne paie pas la construction.
+
+Convergence entre workers : les signaux Produit/Legume et la validation des
+termes incrémentent un compteur de version dans le cache, commun à tous les
+processus (CACHE_PROFIL redis ou db, voir les settings). Chaque worker lit
+cette version au plus toutes les settings.SUGGESTIONS_VERIFICATION secondes
+et reconstruit son index si elle a changé ; le worker qui publie une version
+la voit immédiatement. L'index est aussi reconstruit après
+settings.SUGGESTIONS_TTL pour intégrer les nouveaux termes.
+
+Les recherches abouties sont comptées en mémoire (compter_recherche) et
+écrites en lot par vider_recherches, à la fin d'une requête au plus toutes
+les settings.SUGGESTIONS_ENREGISTREMENT_INTERVALLE secondes : une recherche
+n'écrit pas en base. Les comptes non écrits sont perdus si le worker
+s'arrête, ce qui est sans conséquence pour une statistique de popularité.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+
+from .search import sans_accents
+
+logger = logging.getLogger(__name__)
+
+CLE_VERSION = 'suggestions:version'
+
+# Poids des sources, à pertinence de préfixe égale
+POIDS_PRODUIT = 3
+POIDS_LEGUME = 2
+POIDS_RECHERCHE = 1
+
+LONGUEUR_MIN = 2
+
+
+class IndexSuggestions:
+    """Index de préfixes immuable une fois construit"""
+
+    def __init__(self, entrees=(), version=None):
+        # (clé, -poids, libellé, type, id) triés par clé
+        lignes = []
+        for libelle, type_, id_, poids in entrees:
+            normalise = sans_accents(libelle)
+            debut = 0
+            for mot in normalise.split():
+                debut = normalise.index(mot, debut)
+                lignes.append((normalise[debut:], -poids, libelle, type_, id_))
+                debut += len(mot)
+        lignes.sort()
+        self._cles = [ligne[0] for ligne in lignes]
+        self._lignes = lignes
+        self.version = version
+        self.construit_le = time.monotonic()
+
+    def __len__(self):
+        return len(self._lignes)
+
+    def chercher(self, prefixe, limite=10):
+        """Libellés dont un mot commence par le préfixe (déjà normalisé)"""
+        trouves = []
+        i = bisect_left(self._cles, prefixe)
+        while i < len(self._cles) and self._cles[i].startswith(prefixe):
+            trouves.append(self._lignes[i])
+            i += 1
+
+        # Meilleur poids d'abord, puis correspondance en début de libellé,
+        # puis libellé le plus court
+        trouves.sort(key=lambda l: (l[1], l[0] != sans_accents(l[2]), len(l[2])))
+        resultats, vus = [], set()
+        for _, _, libelle, type_, id_ in trouves:
+            if libelle in vus:
+                continue
+            vus.add(libelle)
+            resultats.append({'libelle': libelle, 'type': type_, 'id': id_})
+            if len(resultats) >= limite:
+                break
+        return resultats
+
+
+_index = IndexSuggestions()
+_verrou = threading.Lock()
+# Dernière lecture de la version partagée (time.monotonic)
+_version_lue_le = float('-inf')
+
+_recherches = Counter()
+_verrou_recherches = threading.Lock()
+_recherches_videes_le = time.monotonic()
+
+
+def _entrees():
+    from production.models import Legume
+    from .models import Produit, TermeRecherche
+
+    for pk, nom in Produit.objects.filter(actif=True).values_list('pk', 'nom'):
+        yield nom, 'produit', pk, POIDS_PRODUIT
+    for legume in Legume.objects.all():
+        yield legume.get_nom_display(), 'legume', legume.pk, POIDS_LEGUME
+    termes = TermeRecherche.objects.filter(
+        approuve=True, nombre__gte=settings.SUGGESTIONS_TERME_MIN
+    ).values_list('terme', flat=True)[:500]
+    for terme in termes:
+        yield terme, 'recherche', None, POIDS_RECHERCHE
+
+
+def version_partagee():
+    return cache.get_or_set(CLE_VERSION, 1, None)
+
+
+def construire(version=None):
+    """(Re)construit l'index du worker et le retourne"""
+    global _index, _version_lue_le
+    if version is None:
+        version = version_partagee()
+        _version_lue_le = time.monotonic()
+    nouvel_index = IndexSuggestions(list(_entrees()), version)
+    _index = nouvel_index
+    return nouvel_index
+
+
+def prechauffer():
+    """Construit l'index au démarrage du worker (sans effet si la base n'est pas prête)"""
+    try:
+        construire()
+    except DatabaseError:
+        logger.warning("Index de suggestions non construit au démarrage", exc_info=True)
+
+
+def index_a_jour():
+    """Index courant, reconstruit si une autre version a été publiée ou s'il a expiré"""
+    global _version_lue_le
+    index = _index
+    maintenant = time.monotonic()
+    perime = maintenant - index.construit_le > settings.SUGGESTIONS_TTL
+    if (
+        not perime and index.version is not None
+        and maintenant - _version_lue_le < settings.SUGGESTIONS_VERIFICATION
+    ):
+        return index
+    version = version_partagee()
+    _version_lue_le = maintenant
+    if index.version == version and not perime:
+        return index
+    with _verrou:
+        index = _index
+        if index.version != version or time.monotonic() - index.construit_le > settings.SUGGESTIONS_TTL:
+            index = construire(version)
+    return index
+
+
+def suggerer(texte, limite=10):
+    """Suggestions pour le texte saisi (liste vide si trop court)"""
+    prefixe = ' '.join(sans_accents(texte or '').split())
+    if len(prefixe) < LONGUEUR_MIN:
+        return []
+    return index_a_jour().chercher(prefixe, limite)
+
+
+def _publier_version():
+    global _version_lue_le
+    try:
+        cache.incr(CLE_VERSION)
+    except ValueError:
+        cache.set(CLE_VERSION, 2, None)
+    # Ce worker relit la version dès la prochaine suggestion
+    _version_lue_le = float('-inf')
+
+
+def invalider():
+    """Publie une nouvelle version après validation de la transaction"""
+    transaction.on_commit(_publier_version)
+
+
+def compter_recherche(terme):
+    """Compte une recherche (terme déjà normalisé) dans la mémoire du worker"""
+    with _verrou_recherches:
+        _recherches[terme] += 1
+
+
+def vider_recherches(forcer=False):
+    """
+    Écrit en lot les recherches comptées depuis le dernier passage, au plus
+    toutes les settings.SUGGESTIONS_ENREGISTREMENT_INTERVALLE secondes
+    """
+    global _recherches, _recherches_videes_le
+    if not _recherches:
+        return
+    with _verrou_recherches:
+        maintenant = time.monotonic()
+        intervalle = settings.SUGGESTIONS_ENREGISTREMENT_INTERVALLE
+        if not _recherches or (not forcer and maintenant - _recherches_videes_le < intervalle):
+            return
+        comptes, _recherches = _recherches, Counter()
+        _recherches_videes_le = maintenant
+
+    from .models import TermeRecherche
+    try:
+        TermeRecherche.enregistrer_lot(comptes)
+    except DatabaseError:
+        logger.warning("Recherches non enregistrées : %s", dict(comptes), exc_info=True)
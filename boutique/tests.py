@@ -1,3 +1,424 @@
-from django.test import TestCase
+import re
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from commandes.models import Commande, CommandeItem, ZoneLivraison
+from grow_with_green.testing import JournalRequetes, PlanRequetesMixin
+from production.models import Legume, Stock
+from . import cache_catalogue, dashboard, search, services, suggestions
+from .models import Avis, Panier, PanierItem, Produit, TermeRecherche
+
+
+class IndexBoutiqueTests(PlanRequetesMixin, TestCase):
+    """Les requêtes principales de la boutique passent par leurs index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        for nom in ('COURGE', 'GOMBO', 'AUBERGINE'):
+            legume = Legume.objects.create(nom=nom, cycle_jours=60, description=nom)
+            Stock.objects.create(legume=legume, quantite_disponible=100)
+            Produit.objects.create(
+                legume=legume, nom=nom.title(), description=nom, image='products/a.jpg',
+                prix_b2c=1000, prix_b2b=800
+            )
+        cls.produit = Produit.objects.first()
+        commande = Commande.objects.create(
+            user=cls.user, zone_livraison=zone, adresse_livraison='Cocody',
+            mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000, statut='LIVREE'
+        )
+        CommandeItem.objects.create(commande=commande, produit=cls.produit, quantite=1, prix_unitaire=1000)
+
+    def test_catalogue(self):
+        self.assertIndexUtilise(
+            lambda: self.client.get('/boutique/'), 'boutique_produit', 'produit_actif_idx'
+        )
+
+    def test_avis_du_produit(self):
+        self.assertIndexUtilise(
+            lambda: self.client.get(f'/boutique/produit/{self.produit.pk}/'),
+            'boutique_avis', 'avis_produit_date_idx'
+        )
+
+    def test_achat_verifie(self):
+        self.assertIndexUtilise(
+            lambda: Avis.objects.create(produit=self.produit, user=self.user, note=5, titre='Bon'),
+            'commandes_commandeitem', 'commandeitem_produit_idx'
+        )
+
+
+class NotesAvisTests(TestCase):
+    """Agrégats de notes tenus à jour à la création, la modification et la suppression"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'client{i}', f'client{i}@example.com', 'motdepasse') for i in range(2)]
+        cls.produits = [
+            Produit.objects.create(
+                legume=Legume.objects.create(nom=nom, cycle_jours=60, description=nom),
+                nom=nom.title(), description=nom, image='products/a.jpg', prix_b2c=1000, prix_b2b=800
+            )
+            for nom in ('COURGE', 'GOMBO')
+        ]
+
+    def notes(self, produit):
+        produit.refresh_from_db()
+        notes = (produit.note_somme, produit.nombre_avis, produit.note_moyenne)
+        # L'ajustement incrémental et le recalcul complet concordent
+        Produit.objects.filter(pk=produit.pk).recalculer_notes()
+        produit.refresh_from_db()
+        self.assertEqual((produit.note_somme, produit.nombre_avis, produit.note_moyenne), notes)
+        return notes
+
+    def test_creation(self):
+        courge = self.produits[0]
+        Avis.objects.create(produit=courge, user=self.users[0], note=5, titre='Bon')
+        Avis.objects.create(produit=courge, user=self.users[1], note=2, titre='Moyen')
+        self.assertEqual(self.notes(courge), (7, 2, Decimal('3.5')))
+
+    def test_modification(self):
+        courge, gombo = self.produits
+        avis = Avis.objects.create(produit=courge, user=self.users[0], note=5, titre='Bon')
+        Avis.objects.create(produit=courge, user=self.users[1], note=3, titre='Moyen')
+
+        avis.note = 1
+        avis.save()
+        self.assertEqual(self.notes(courge), (4, 2, Decimal('2.0')))
+
+        # Instance périmée : le delta part de la note en base, pas de celle en mémoire
+        perime = Avis.objects.get(pk=avis.pk)
+        avis.note = 4
+        avis.save()
+        perime.note = 2
+        perime.save()
+        self.assertEqual(self.notes(courge), (5, 2, Decimal('2.5')))
+
+        avis.refresh_from_db()
+        avis.produit = gombo
+        avis.save()
+        self.assertEqual(self.notes(courge), (3, 1, Decimal('3.0')))
+        self.assertEqual(self.notes(gombo), (2, 1, Decimal('2.0')))
+
+    def test_suppression(self):
+        courge = self.produits[0]
+        avis = Avis.objects.create(produit=courge, user=self.users[0], note=5, titre='Bon')
+        Avis.objects.create(produit=courge, user=self.users[1], note=2, titre='Moyen')
+        avis.delete()
+        self.assertEqual(self.notes(courge), (2, 1, Decimal('2.0')))
+        Avis.objects.filter(produit=courge).delete()
+        self.assertEqual(self.notes(courge), (0, 0, Decimal('0.0')))
+
+
+class PanierTests(TestCase):
+    """Incréments atomiques du panier et rejeu des requêtes de l'API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        Stock.objects.create(legume=legume, quantite_disponible=10)
+        cls.produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def quantite(self):
+        return PanierItem.objects.get(panier__user=self.user, produit=self.produit).quantite
+
+    def test_increment(self):
+        services.ajouter_au_panier(self.user, self.produit, Decimal('2'))
+        services.ajouter_au_panier(self.user, self.produit, Decimal('3'))
+        self.assertEqual(self.quantite(), Decimal('5'))
+
+    def test_un_seul_panier(self):
+        panier = services.panier_de(self.user)
+        self.assertEqual(services.panier_de(self.user), panier)
+        # Création concurrente : rejetée par la contrainte, pas de second panier
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Panier.objects.create(user=self.user)
+
+    def test_stock_insuffisant(self):
+        services.ajouter_au_panier(self.user, self.produit, Decimal('8'))
+        with self.assertRaises(services.StockInsuffisant):
+            services.ajouter_au_panier(self.user, self.produit, Decimal('3'))
+        self.assertEqual(self.quantite(), Decimal('8'))
+
+    def test_idempotency_key(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        def ajouter(quantite, cle='cle-1'):
+            return client.post(
+                '/api/v1/panier/add_item/', {'produit_id': self.produit.pk, 'quantite': quantite},
+                format='json', HTTP_IDEMPOTENCY_KEY=cle
+            )
+
+        premiere, rejouee = ajouter(1), ajouter(1)
+        self.assertEqual(rejouee.status_code, 200)
+        self.assertEqual(rejouee['Idempotent-Replayed'], 'true')
+        self.assertEqual(rejouee.data, premiere.data)
+        self.assertEqual(self.quantite(), Decimal('1'))
+
+        self.assertEqual(ajouter(2).status_code, 422)
+        ajouter(1, cle='cle-2')
+        self.assertEqual(self.quantite(), Decimal('2'))
+
+    def test_quantite_invalide(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.client.force_login(self.user)
+        for quantite in ('NaN', 'Infinity', '-5', '0', '1.234', 'abc'):
+            with self.subTest(quantite=quantite):
+                with self.assertRaises(services.QuantiteInvalide):
+                    services.ajouter_au_panier(self.user, self.produit, quantite)
+                reponse = client.post(
+                    '/api/v1/panier/add_item/', {'produit_id': self.produit.pk, 'quantite': quantite}, format='json'
+                )
+                self.assertEqual(reponse.status_code, 400)
+                reponse = self.client.post(f'/boutique/panier/ajouter/{self.produit.pk}/', {'quantite': quantite})
+                self.assertEqual(reponse.status_code, 400)
+        self.assertFalse(PanierItem.objects.exists())
+
+
+class SuggestionsTests(TestCase):
+    """Termes recherchés : comptés s'ils aboutissent, suggérés une fois validés"""
+
+    @classmethod
+    def setUpTestData(cls):
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        Stock.objects.create(legume=legume, quantite_disponible=10)
+        Produit.objects.create(
+            legume=legume, nom='Gombo frais', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+
+    def setUp(self):
+        cache.clear()
+        suggestions._recherches.clear()
+
+    @override_settings(SUGGESTIONS_ENREGISTREMENT_INTERVALLE=0)
+    def test_recherche_api_sans_resultat(self):
+        self.client.get('/api/v1/produits/', {'search': 'introuvable'})
+        self.assertFalse(TermeRecherche.objects.exists())
+        self.client.get('/api/v1/produits/', {'search': 'gombo'})
+        self.assertEqual(list(TermeRecherche.objects.values_list('terme', 'nombre')), [('gombo', 1)])
+
+    def test_terme_valide(self):
+        TermeRecherche.objects.create(terme='gombo du jour', nombre=50)
+
+        def libelles():
+            with self.captureOnCommitCallbacks(execute=True):
+                suggestions.invalider()
+            return [s['libelle'] for s in suggestions.suggerer('gombo')]
+
+        self.assertNotIn('gombo du jour', libelles())
+        TermeRecherche.objects.update(approuve=True)
+        self.assertIn('gombo du jour', libelles())
+
+    @override_settings(SUGGESTIONS_ENREGISTREMENT_INTERVALLE=3600)
+    def test_recherches_ecrites_en_lot(self):
+        for texte in ('gombo', 'Gombo', 'gombo frais', 'GOMBO'):
+            self.client.get('/api/v1/produits/', {'search': texte})
+        # Comptées en mémoire : aucune écriture pendant les requêtes
+        self.assertFalse(TermeRecherche.objects.exists())
+
+        # Une insertion, une mise à jour par valeur de compte
+        with self.assertNumQueries(5):
+            suggestions.vider_recherches(forcer=True)
+        self.assertEqual(
+            list(TermeRecherche.objects.order_by('terme').values_list('terme', 'nombre')),
+            [('gombo', 3), ('gombo frais', 1)]
+        )
+        self.client.get('/api/v1/produits/', {'search': 'gombo'})
+        suggestions.vider_recherches(forcer=True)
+        self.assertEqual(TermeRecherche.objects.get(terme='gombo').nombre, 4)
+
+    def test_index_prechauffe(self):
+        suggestions.prechauffer()
+        with self.assertNumQueries(0):
+            self.assertEqual([s['libelle'] for s in suggestions.suggerer('gom')], ['Gombo frais', 'Gombo'])
+
+    def test_version_lue_par_intervalle(self):
+        version = suggestions.construire().version
+        # Version publiée par un autre processus
+        cache.incr(suggestions.CLE_VERSION)
+        with override_settings(SUGGESTIONS_VERIFICATION=3600):
+            self.assertEqual(suggestions.index_a_jour().version, version)
+        with override_settings(SUGGESTIONS_VERIFICATION=0):
+            self.assertEqual(suggestions.index_a_jour().version, version + 1)
+
+
+class RechercheTests(TestCase):
+    """Index plein texte : racines, nom du légume, score et tri calculés en SQL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aubergines = cls.creer('AUBERGINE', 'Aubergines violettes', 'Légume frais')
+        cls.lady_finger = cls.creer('GOMBO', 'Lady finger', 'Idéal avec une aubergine')
+        cls.butternut = cls.creer('COURGE', 'Butternut', 'Variété locale')
+
+    @classmethod
+    def creer(cls, legume, nom, description):
+        return Produit.objects.create(
+            legume=Legume.objects.create(nom=legume, cycle_jours=60, description=legume),
+            nom=nom, description=description, image='products/a.jpg', prix_b2c=1000, prix_b2b=800
+        )
+
+    def rechercher(self, texte):
+        return search.rechercher(Produit.objects.all(), texte).order_by('-pertinence', 'pk')
+
+    def test_racines_et_accents(self):
+        # Le nom pèse plus que la description
+        self.assertEqual(list(self.rechercher('AUBERGINE')), [self.aubergines, self.lady_finger])
+        self.assertEqual(list(self.rechercher('legumes frais')), [self.aubergines])
+
+    def test_nom_du_legume(self):
+        self.assertEqual(list(self.rechercher('gombo')), [self.lady_finger])
+
+    def test_filtre_et_score_en_sql(self):
+        # Paramètres fixes (texte recherché), quel que soit le nombre de résultats
+        resultats = self.rechercher('aubergines')
+        self.assertEqual(len(resultats.query.sql_with_params()[1]), 2)
+        self.assertEqual(list(resultats[1:]), [self.lady_finger])
+        self.assertEqual(resultats.count(), 2)
+
+
+class DashboardTests(TestCase):
+    """Indicateurs du dashboard servis depuis le cache, invalidés à la validation d'une vente"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        cls.zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        cls.produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def vendre(self, quantite):
+        commande = Commande.objects.create(
+            user=self.user, zone_livraison=self.zone, adresse_livraison='Cocody',
+            mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000
+        )
+        CommandeItem.objects.create(commande=commande, produit=self.produit, quantite=quantite, prix_unitaire=1000)
+        commande.paiement_valide = True
+        commande.save()
+        return commande
+
+    def test_invalidation_apres_une_vente(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendre(2)
+        self.assertEqual(dashboard.statistiques_dashboard()['stats']['ca_total'], 2000)
+        # Servi depuis le cache
+        with self.assertNumQueries(0):
+            dashboard.statistiques_dashboard()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            commande = self.vendre(3)
+            # Pas encore validée : le cache n'est pas invalidé
+            self.assertEqual(dashboard.statistiques_dashboard()['stats']['ca_total'], 2000)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(dashboard.statistiques_dashboard()['stats']['ca_total'], 5000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            commande.delete()
+        self.assertEqual(dashboard.statistiques_dashboard()['stats']['ca_total'], 2000)
+
+    def test_commande_non_payee(self):
+        dashboard.statistiques_dashboard()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Commande.objects.create(
+                user=self.user, zone_livraison=self.zone, adresse_livraison='Cocody',
+                mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000
+            )
+        self.assertNotIn(dashboard.invalider_dashboard, callbacks)
+        with self.assertNumQueries(0):
+            dashboard.statistiques_dashboard()
+
+
+class CatalogueCacheTests(TestCase):
+    """Pages publiques servies depuis le cache versionné : anonymes seulement, ETag, jeton CSRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        cls.stock = Stock.objects.create(legume=legume, quantite_disponible=50)
+        cls.produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def jeton_csrf(self, reponse):
+        return re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', reponse.content.decode()).group(1)
+
+    def test_anonyme_servi_depuis_le_cache(self):
+        url = reverse('boutique:catalogue')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.assertNumQueries(0):
+            reponse = self.client.get(url)
+        self.assertContains(reponse, 'Gombo')
+
+        # Connecté : la page est recalculée (panier, favoris...)
+        self.client.force_login(self.user)
+        with JournalRequetes() as journal:
+            reponse = self.client.get(url)
+        self.assertGreater(len(journal), 0)
+        self.assertNotIn('ETag', reponse)
+
+    def test_etag_et_304(self):
+        url = reverse('boutique:catalogue')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(reponse['ETag'], etag)
+
+        # Une écriture sur le stock ouvre une nouvelle génération
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.quantite_disponible = 40
+            self.stock.save()
+        reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], etag)
+
+    def test_etag_api(self):
+        client = APIClient()
+        url = reverse('api:produit-list')
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_jeton_csrf_du_visiteur(self):
+        url = reverse('boutique:catalogue')
+        premier = Client(enforce_csrf_checks=True)
+        premier.get(url)
+
+        # Page servie depuis le cache à un second visiteur : son propre jeton
+        second = Client(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            reponse = second.get(url)
+        self.assertNotContains(reponse, cache_catalogue._MARQUEUR_CSRF.decode())
+        jeton = self.jeton_csrf(reponse)
+
+        ajout = reverse('boutique:ajouter_au_panier', args=[self.produit.pk])
+        # Accepté par le middleware CSRF : redirection vers la connexion, pas 403
+        self.assertEqual(second.post(ajout, {'csrfmiddlewaretoken': jeton, 'quantite': '1'}).status_code, 302)
+        self.assertEqual(premier.post(ajout, {'csrfmiddlewaretoken': jeton, 'quantite': '1'}).status_code, 403)
@@ -1,9 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Produit, Panier, PanierItem, Avis, Wishlist, WishlistItem, AvisUtile
+from django.http import HttpResponseBadRequest
+from .models import Produit, Panier, PanierItem, Avis, Wishlist, WishlistItem, AvisUtile, TermeRecherche
 from production.models import Stock
-from django.db.models import Q, Avg, Sum, Count, Max
+from django.db.models import Sum, Count, Max
 from django.contrib.admin.views.decorators import staff_member_required
 from datetime import timedelta
 from django.utils import timezone
@@ -11,13 +12,18 @@ import json
 from decimal import Decimal
 from commandes.models import Commande, CommandeItem  # Ajout de l'import
 from production.models import Stock, Legume
-
+from notifications.models import CompteurNotifications
+from .dashboard import statistiques_dashboard
+from .search import rechercher
+from .cache_catalogue import cache_catalogue
+from . import services
+from grow_with_green.pagination import paginer_requete
+
+@cache_catalogue
 def catalogue(request):
     """Page catalogue - tous les produits"""
-    produits = Produit.objects.filter(actif=True).select_related('legume')
-    
-    # Filtrer uniquement les produits en stock
-    produits_disponibles = [p for p in produits if p.est_disponible]
+    # Stock, note et nombre d'avis sont annotés : nombre de requêtes fixe
+    produits_disponibles = list(Produit.objects.catalogue().en_stock())
     
     # Préparer les données JSON pour le JavaScript
     produits_json = []
@@ -54,6 +60,7 @@ def catalogue(request):
     return render(request, 'boutique/catalogue.html', context)
 
 
+@cache_catalogue
 def detail_produit(request, pk):
     """Détail d'un produit"""
     produit = get_object_or_404(Produit, pk=pk, actif=True)
@@ -65,10 +72,12 @@ def detail_produit(request, pk):
         stock = None
     
     # Récupérer les avis associés
-    avis = produit.avis.select_related('user').order_by('-date_creation')
+    avis = paginer_requete(
+        request, produit.avis.select_related('user'), ('-date_creation', '-pk'), taille=10
+    )
     
-    # Calculer la note moyenne
-    note_moyenne = produit.avis.aggregate(Avg('note'))['note__avg'] or 0
+    # Note moyenne stockée sur le produit
+    note_moyenne = produit.note_moyenne
     
     # Récupérer les produits similaires (même catégorie)
     produits_similaires = Produit.objects.filter(
@@ -101,32 +110,18 @@ def ajouter_au_panier(request, produit_id):
     if request.method == 'POST':
         produit = get_object_or_404(Produit, pk=produit_id, actif=True)
         
-        # Utiliser Decimal
-        quantite = Decimal(request.POST.get('quantite', '1'))
+        try:
+            quantite = services.quantite_valide(request.POST.get('quantite', '1'))
+        except services.QuantiteInvalide as e:
+            return HttpResponseBadRequest(str(e))
         
-        # Vérifier le stock disponible
-        if quantite > Decimal(produit.stock_disponible):
-            messages.error(request, f"Stock insuffisant. Disponible : {produit.stock_disponible} kg")
+        # Incrément atomique : pas de mise à jour perdue sur un double clic
+        try:
+            services.ajouter_au_panier(request.user, produit, quantite)
+        except services.StockInsuffisant as e:
+            messages.error(request, str(e))
             return redirect('boutique:detail_produit', pk=produit_id)
         
-        panier, created = Panier.objects.get_or_create(user=request.user)
-        
-        panier_item, created = PanierItem.objects.get_or_create(
-            panier=panier,
-            produit=produit,
-            defaults={'quantite': quantite}
-        )
-        
-        if not created:
-            nouvelle_quantite = panier_item.quantite + quantite
-            
-            if nouvelle_quantite > Decimal(produit.stock_disponible):
-                messages.error(request, f"Stock insuffisant. Disponible : {produit.stock_disponible} kg")
-                return redirect('boutique:voir_panier')
-            
-            panier_item.quantite = nouvelle_quantite
-            panier_item.save()
-        
         messages.success(request, f"{produit.nom} ajouté au panier")
         return redirect('boutique:voir_panier')
     
@@ -142,15 +137,11 @@ def recherche(request):
     tri = request.GET.get('tri', 'pertinence')
     
     # Base queryset
-    produits = Produit.objects.filter(actif=True)
+    produits = Produit.objects.catalogue()
     
     # Recherche par mot-clé
     if query:
-        produits = produits.filter(
-            Q(nom__icontains=query) |
-            Q(description__icontains=query) |
-            Q(legume__nom__icontains=query)
-        )
+        produits = rechercher(produits, query)
     
     # Filtre par catégorie (type de légume)
     if categorie:
@@ -170,16 +161,20 @@ def recherche(request):
     elif tri == 'nom':
         produits = produits.order_by('nom')
     elif tri == 'note':
-        produits = produits.annotate(avg_note=Avg('avis__note')).order_by('-avg_note')
+        produits = produits.order_by('-note_moyenne')
+    elif query:
+        produits = produits.order_by('-pertinence')
     
     # Filtrer seulement les produits en stock
-    produits_disponibles = [p for p in produits if p.est_disponible]
+    produits_disponibles = list(produits.en_stock())
+    
+    # Alimenter les suggestions avec les recherches qui aboutissent
+    if query and produits_disponibles:
+        TermeRecherche.enregistrer(query)
     
     # Préparer les données JSON
     produits_json = []
     for produit in produits_disponibles:
-        note_moyenne = produit.avis.aggregate(Avg('note'))['note__avg'] or 0
-        
         produits_json.append({
             'id': produit.id,
             'nom': produit.nom,
@@ -191,7 +186,7 @@ def recherche(request):
             'est_disponible': produit.est_disponible,
             'stock_disponible': float(produit.stock_disponible) if produit.stock_disponible else 0,
             'image': produit.image.url if produit.image else None,
-            'note_moyenne': float(note_moyenne),
+            'note_moyenne': float(produit.note_moyenne),
         })
     
     context = {
@@ -245,11 +240,9 @@ def wishlist(request):
     wishlist, created = Wishlist.objects.get_or_create(user=request.user)
     
     # Préparer les données JSON
+    produits = Produit.objects.catalogue().filter(wishlistitem__wishlist=wishlist)
     produits_json = []
-    for item in wishlist.items.all():
-        produit = item.produit
-        note_moyenne = produit.avis.aggregate(Avg('note'))['note__avg'] or 0
-        
+    for produit in produits:
         produits_json.append({
             'id': produit.id,
             'nom': produit.nom,
@@ -259,11 +252,12 @@ def wishlist(request):
             'categorie': produit.legume.get_nom_display(),
             'est_disponible': produit.est_disponible,
             'image': produit.image.url if produit.image else None,
-            'note_moyenne': float(note_moyenne),
+            'note_moyenne': float(produit.note_moyenne),
         })
     
     context = {
         'wishlist': wishlist,
+        'produits': produits,
         'produits_json': json.dumps(produits_json, default=str),
     }
     return render(request, 'boutique/wishlist.html', context)
@@ -272,7 +266,7 @@ def wishlist(request):
 @login_required
 def voir_panier(request):
     """Voir le panier"""
-    panier, created = Panier.objects.get_or_create(user=request.user)
+    panier = Panier.du_client(request.user)
     
     context = {
         'panier': panier,
@@ -284,96 +278,27 @@ def voir_panier(request):
 @staff_member_required
 def dashboard_admin(request):
     """Dashboard administrateur avec statistiques"""
-    
-    # Stats générales
-    from accounts.models import User
-    
-    # Chiffre d'affaires total
-    ca_total = Commande.objects.filter(
-        paiement_valide=True
-    ).aggregate(total=Sum('montant_total'))['total'] or 0
-    
-    # Commandes
-    total_commandes = Commande.objects.count()
-    commandes_mois = Commande.objects.filter(
-        date_commande__month=timezone.now().month
-    ).count()
-    
-    # Clients
-    total_clients = User.objects.filter(user_type__in=['B2C', 'B2B']).count()
-    nouveaux_clients = User.objects.filter(
-        date_creation__gte=timezone.now() - timedelta(days=30)
-    ).count()
-    
-    # Stock
-    stock_total = Stock.objects.aggregate(total=Sum('quantite_disponible'))['total'] or 0
-    alertes_stock = Stock.objects.filter(est_en_alerte=True)
-    
-    # Ventes par mois (6 derniers mois)
-    ventes_par_mois = []
-    labels_mois = []
-    for i in range(5, -1, -1):
-        date = timezone.now() - timedelta(days=30*i)
-        ventes = Commande.objects.filter(
-            date_commande__month=date.month,
-            date_commande__year=date.year,
-            paiement_valide=True
-        ).aggregate(total=Sum('montant_total'))['total'] or 0
-        ventes_par_mois.append(float(ventes))
-        labels_mois.append(date.strftime('%B'))
-    
-    # Top produits
-    top_produits = CommandeItem.objects.values(
-        'produit__nom'
-    ).annotate(
-        quantite=Sum('quantite')
-    ).order_by('-quantite')[:4]
-    
-    produits_labels = [p['produit__nom'] for p in top_produits]
-    produits_data = [float(p['quantite']) for p in top_produits]
-    
-    # Commandes récentes
-    commandes_recentes = Commande.objects.select_related('user').order_by('-date_commande')[:10]
-    
-    # Top clients
-    top_clients = Commande.objects.filter(
-        paiement_valide=True
-    ).values('user').annotate(
-        total_commandes=Count('id'),
-        total_depense=Sum('montant_total'),
-        derniere_commande=Max('date_commande')
-    ).order_by('-total_depense')[:5]
-    
-    # Enrichir avec les infos utilisateur
-    for client in top_clients:
-        client['user'] = User.objects.get(pk=client['user'])
+    statistiques = statistiques_dashboard()
     
     context = {
         'date_aujourdhui': timezone.now(),
-        'stats': {
-            'ca_total': ca_total,
-            'total_commandes': total_commandes,
-            'commandes_mois': commandes_mois,
-            'total_clients': total_clients,
-            'nouveaux_clients': nouveaux_clients,
-            'stock_total': stock_total,
-            'alertes_stock': alertes_stock.count(),
-        },
-        'ventes_labels': json.dumps(labels_mois),
-        'ventes_data': json.dumps(ventes_par_mois),
-        'produits_labels': json.dumps(produits_labels),
-        'produits_data': json.dumps(produits_data),
-        'commandes_recentes': commandes_recentes,
-        'alertes_stock': alertes_stock,
-        'top_clients': top_clients,
+        'stats': statistiques['stats'],
+        'ventes_labels': json.dumps(statistiques['ventes_labels']),
+        'ventes_data': json.dumps(statistiques['ventes_data']),
+        'produits_labels': json.dumps(statistiques['produits_labels']),
+        'produits_data': json.dumps(statistiques['produits_data']),
+        'commandes_recentes': statistiques['commandes_recentes'],
+        'alertes_stock': statistiques['alertes_stock'],
+        'top_clients': statistiques['top_clients'],
     }
     
     return render(request, 'admin/dashboard.html', context)
 
 
+@cache_catalogue
 def index(request):
     """Page d'accueil"""
-    produits_featured = Produit.objects.filter(actif=True)[:3]
+    produits_featured = Produit.objects.catalogue()[:3]
     context = {
         'produits': produits_featured,
     }
@@ -433,7 +358,8 @@ def marquer_utile(request, avis_id):
 @login_required
 def supprimer_du_panier(request, item_id):
     """Supprimer un article du panier"""
-    item = get_object_or_404(PanierItem, pk=item_id, panier__user=request.user)
+    # Panier chargé avec l'article : l'invalidation de l'en-tête connaît le client
+    item = get_object_or_404(PanierItem.objects.select_related('panier'), pk=item_id, panier__user=request.user)
     item.delete()
     messages.success(request, "Article supprimé du panier")
     return redirect('boutique:voir_panier')
@@ -444,11 +370,8 @@ def mes_favoris(request):
     # Récupérer ou créer la wishlist
     wishlist, created = Wishlist.objects.get_or_create(user=request.user)
     
-    # Récupérer tous les produits favoris
-    produits_favoris = Produit.objects.filter(
-        wishlistitem__wishlist=wishlist,
-        actif=True
-    ).select_related('legume')
+    # Récupérer tous les produits favoris, stock compris
+    produits_favoris = Produit.objects.catalogue().filter(wishlistitem__wishlist=wishlist)
     
     # Préparer les statistiques
     total = produits_favoris.count()
@@ -473,7 +396,7 @@ def notifications(request):
     # Récupérer les commandes récentes
     commandes_recentes = Commande.objects.filter(
         user=request.user
-    ).order_by('-date_commande')[:10]
+    ).annotate(nombre_articles=Count('items')).order_by('-date_commande')[:10]
     
     # Récupérer les avis récents sur les produits de l'utilisateur
     # (si vous avez un système de suivi de produits)
@@ -482,7 +405,7 @@ def notifications(request):
     promotions = []  # À remplir avec votre modèle de promotions si vous en avez
     
     # Compter les notifications non lues
-    notifications_non_lues = 0
+    notifications_non_lues = CompteurNotifications.non_lues_de(request.user)
     
     context = {
         'commandes_recentes': commandes_recentes,
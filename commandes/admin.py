@@ -1,7 +1,6 @@
-from django.contrib import admin
-from .models import ZoneLivraison, Commande, CommandeItem
-from .emails import envoyer_notification_expedition, envoyer_notification_livraison
-from notifications.models import Notification
+from django.contrib import admin, messages
+from production.services import ConflitStock
+from .models import ZoneLivraison, Commande, CommandeItem, EmailSortant, VenteJournaliere
 @admin.register(ZoneLivraison)
 class ZoneLivraisonAdmin(admin.ModelAdmin):
     list_display = ['nom', 'frais_livraison', 'delai_livraison', 'active']
@@ -48,21 +47,48 @@ class CommandeAdmin(admin.ModelAdmin):
     actions = ['confirmer_commandes', 'expedier_commandes']
     
     def confirmer_commandes(self, request, queryset):
-        for commande in queryset:
-            if commande.paiement_valide:
-                commande.confirmer()
-        self.message_user(request, "Commandes confirmées")
+        try:
+            commandes, rejetees = Commande.objects.transition(queryset, 'CONFIRMEE')
+        except ConflitStock:
+            # Transaction annulée : aucune commande n'a changé de statut
+            self.message_user(
+                request,
+                "Le stock a été modifié pendant la confirmation, aucune commande confirmée : "
+                "relancez l'action",
+                level=messages.ERROR
+            )
+            return
+        if commandes:
+            self.message_user(request, f"{len(commandes)} commande(s) confirmée(s)", level=messages.SUCCESS)
+        if rejetees:
+            self.message_user(
+                request,
+                f"{len(rejetees)} commande(s) non confirmée(s), stock insuffisant pour : "
+                f"{', '.join(c.numero_commande for c in rejetees)}",
+                level=messages.ERROR if not commandes else messages.WARNING
+            )
+        elif not commandes:
+            self.message_user(request, "Aucune commande payée en attente dans la sélection", level=messages.WARNING)
     confirmer_commandes.short_description = "Confirmer les commandes sélectionnées"
     
-def expedier_commandes(self, request, queryset):
-    from django.utils import timezone
-    for commande in queryset:
-        if commande.statut in ['CONFIRMEE', 'EN_PREPARATION']:
-            commande.statut = 'EXPEDIEE'
-            commande.date_expedition = timezone.now()
-            commande.save()
-            Notification.notifier_expedition(commande)
-            # Envoyer email
-            envoyer_notification_expedition(commande)
-    self.message_user(request, "Commandes expédiées et emails envoyés")
-expedier_commandes.short_description = "Marquer comme expédiées et notifier"
\ No newline at end of file
+    def expedier_commandes(self, request, queryset):
+        commandes, rejetees = Commande.objects.transition(queryset, 'EXPEDIEE')
+        self.message_user(request, f"{len(commandes)} commande(s) expédiée(s), emails mis en file d'attente")
+    expedier_commandes.short_description = "Marquer comme expédiées et notifier"
+
+
+
+@admin.register(EmailSortant)
+class EmailSortantAdmin(admin.ModelAdmin):
+    list_display = ['destinataire', 'sujet', 'statut', 'tentatives', 'prochaine_tentative', 'date_envoi']
+    list_filter = ['statut', 'date_creation']
+    search_fields = ['destinataire', 'sujet']
+    readonly_fields = ['date_creation', 'date_envoi', 'derniere_erreur']
+
+
+
+@admin.register(VenteJournaliere)
+class VenteJournaliereAdmin(admin.ModelAdmin):
+    list_display = ['date', 'produit', 'type_client', 'zone_livraison', 'quantite', 'chiffre_affaires', 'nombre_commandes']
+    list_filter = ['type_client', 'zone_livraison', 'produit']
+    date_hierarchy = 'date'
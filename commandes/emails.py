@@ -1,9 +1,12 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-def envoyer_confirmation_commande(commande):
-    """Envoie un email de confirmation de commande"""
+
+def contenu_confirmation_commande(commande):
+    """Sujet et message de l'email de confirmation de commande"""
     subject = f"Commande {commande.numero_commande} confirmée - Grow With Green"
     
     message = f"""
@@ -19,7 +22,7 @@ def envoyer_confirmation_commande(commande):
     Articles commandés :
     """
     
-    for item in commande.items.all():
+    for item in commande.items.select_related('produit'):
         message += f"- {item.produit.nom} : {item.quantite} kg x {item.prix_unitaire} FCFA\n"
     
     message += f"""
@@ -33,22 +36,11 @@ def envoyer_confirmation_commande(commande):
     L'équipe Grow With Green
     """
     
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [commande.user.email],
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        print(f"Erreur envoi email : {e}")
-        return False
+    return subject, message
 
 
-def envoyer_notification_expedition(commande):
-    """Envoie un email quand la commande est expédiée"""
+def contenu_notification_expedition(commande):
+    """Sujet et message de l'email d'expédition"""
     subject = f"Votre commande {commande.numero_commande} a été expédiée !"
     
     message = f"""
@@ -67,22 +59,11 @@ def envoyer_notification_expedition(commande):
     L'équipe Grow With Green
     """
     
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [commande.user.email],
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        print(f"Erreur envoi email : {e}")
-        return False
+    return subject, message
 
 
-def envoyer_notification_livraison(commande):
-    """Envoie un email quand la commande est livrée"""
+def contenu_notification_livraison(commande):
+    """Sujet et message de l'email de livraison"""
     subject = f"Votre commande {commande.numero_commande} est livrée ! 🎉"
     
     message = f"""
@@ -100,15 +81,111 @@ def envoyer_notification_livraison(commande):
     L'équipe Grow With Green
     """
     
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [commande.user.email],
-            fail_silently=False,
+    return subject, message
+
+
+def mettre_en_file(contenu, commandes):
+    """
+    Ajoute à la file d'attente un email par commande (une seule requête).
+    Les emails sont envoyés par la commande envoyer_emails.
+    """
+    from .models import EmailSortant
+    emails = []
+    for commande in commandes:
+        sujet, message = contenu(commande)
+        emails.append(EmailSortant(
+            destinataire=commande.user.email,
+            sujet=sujet,
+            message=message
+        ))
+    return EmailSortant.objects.bulk_create(emails)
+
+
+def envoyer_confirmation_commande(commande):
+    """Met en file l'email de confirmation de commande"""
+    mettre_en_file(contenu_confirmation_commande, [commande])
+    return True
+
+
+def envoyer_notification_expedition(commande):
+    """Met en file l'email d'expédition"""
+    mettre_en_file(contenu_notification_expedition, [commande])
+    return True
+
+
+def envoyer_notification_livraison(commande):
+    """Met en file l'email de livraison"""
+    mettre_en_file(contenu_notification_livraison, [commande])
+    return True
+
+
+def _reporter(email, erreur, now):
+    """Planifie une nouvelle tentative avec un délai exponentiel"""
+    email.tentatives += 1
+    email.derniere_erreur = str(erreur)
+    if email.tentatives >= settings.EMAIL_OUTBOX_MAX_TENTATIVES:
+        email.statut = 'ECHEC'
+    else:
+        delai = settings.EMAIL_OUTBOX_BACKOFF * 2 ** (email.tentatives - 1)
+        email.prochaine_tentative = now + timedelta(seconds=delai)
+
+
+def envoyer_file(limite=50):
+    """
+    Envoie un lot d'emails en attente sur une seule connexion SMTP.
+
+    Le lot est réservé dans une transaction courte : sa prochaine tentative
+    est repoussée de EMAIL_OUTBOX_BAIL secondes, ce qui l'écarte des autres
+    workers sans garder de verrou pendant les envois SMTP. Un worker arrêté
+    en cours de lot laisse ses emails repartir à l'expiration du bail.
+
+    Retourne (nombre envoyés, nombre en échec).
+    """
+    from .models import EmailSortant
+    now = timezone.now()
+    envoyes = echecs = 0
+
+    with transaction.atomic():
+        lot = list(
+            EmailSortant.objects.select_for_update(skip_locked=True)
+            .filter(statut='EN_ATTENTE', prochaine_tentative__lte=now)
+            .order_by('pk')[:limite]
         )
-        return True
+        if not lot:
+            return 0, 0
+        EmailSortant.objects.filter(pk__in=[email.pk for email in lot]).update(
+            prochaine_tentative=now + timedelta(seconds=settings.EMAIL_OUTBOX_BAIL)
+        )
+
+    connexion = get_connection(fail_silently=False)
+    try:
+        connexion.open()
     except Exception as e:
-        print(f"Erreur envoi email : {e}")
-        return False
\ No newline at end of file
+        # Serveur injoignable : tout le lot est reporté
+        for email in lot:
+            _reporter(email, e, now)
+        echecs = len(lot)
+    else:
+        try:
+            for email in lot:
+                try:
+                    EmailMessage(
+                        email.sujet,
+                        email.message,
+                        settings.DEFAULT_FROM_EMAIL,
+                        [email.destinataire],
+                        connection=connexion
+                    ).send()
+                    email.statut = 'ENVOYE'
+                    email.date_envoi = timezone.now()
+                    envoyes += 1
+                except Exception as e:
+                    _reporter(email, e, now)
+                    echecs += 1
+        finally:
+            connexion.close()
+
+    EmailSortant.objects.bulk_update(
+        lot, ['statut', 'tentatives', 'prochaine_tentative', 'derniere_erreur', 'date_envoi']
+    )
+    return envoyes, echecs
@@ -0,0 +1,229 @@
+"""
+Export groupé des factures (archive ZIP ou PDF fusionné)
+
+Les commandes et leurs lignes sont lues par lots (iterator + prefetch).
+La commande exporter_factures répartit le rendu ReportLab dans un
+ProcessPoolExecutor avec un nombre borné de factures en vol ; la vue web
+rend les factures dans son propre processus. L'archive ZIP comme le PDF
+fusionné sont produits en flux : chaque facture est émise dès qu'elle est
+rendue et la mémoire reste bornée quel que soit le nombre de commandes.
+Sous ASGI, flux_asynchrone() fait avancer ce flux un morceau à la fois
+dans un thread, sans bloquer la boucle ni attendre la fin de l'export.
+"""
+import zipfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from pypdf import PdfReader
+from pypdf.generic import DictionaryObject, IndirectObject, NameObject, NullObject
+
+from .models import Commande, CommandeItem
+from .pdf import donnees_facture, rendre_facture
+
+
+def commandes_a_exporter(debut=None, fin=None, statut=None):
+    """Commandes filtrées par période et statut, lignes et produits préchargés"""
+    commandes = Commande.objects.select_related('user', 'zone_livraison').prefetch_related(
+        Prefetch('items', queryset=CommandeItem.objects.select_related('produit'))
+    ).order_by('date_commande', 'pk')
+    if debut:
+        commandes = commandes.filter(date_commande__date__gte=debut)
+    if fin:
+        commandes = commandes.filter(date_commande__date__lte=fin)
+    if statut:
+        commandes = commandes.filter(statut=statut)
+    return commandes
+
+
+def rendre_factures(commandes, processus=None, lot=200):
+    """
+    Génère (numero_commande, pdf) dans l'ordre du queryset.
+
+    Avec `processus`, le rendu est réparti dans autant de processus avec
+    au plus `lot` factures en cours de rendu ; sinon il a lieu dans le
+    processus courant (pas de processus enfants dans un worker web).
+    """
+    if not processus:
+        for commande in commandes.iterator(chunk_size=lot):
+            yield rendre_facture(donnees_facture(commande, commande.items.all()))
+        return
+    
+    with ProcessPoolExecutor(max_workers=processus) as executor:
+        en_cours = deque()
+        for commande in commandes.iterator(chunk_size=lot):
+            donnees = donnees_facture(commande, commande.items.all())
+            en_cours.append(executor.submit(rendre_facture, donnees))
+            if len(en_cours) >= lot:
+                yield en_cours.popleft().result()
+        while en_cours:
+            yield en_cours.popleft().result()
+
+
+class _Flux:
+    """Fichier en écriture seule dont on récupère le contenu au fil de l'eau"""
+    
+    def __init__(self):
+        self.morceaux = []
+    
+    def write(self, data):
+        self.morceaux.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def vider(self):
+        data = b''.join(self.morceaux)
+        self.morceaux = []
+        return data
+
+
+def flux_zip(factures):
+    """Archive ZIP produite morceau par morceau (une facture par fichier)"""
+    flux = _Flux()
+    with zipfile.ZipFile(flux, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for numero, pdf in factures:
+            archive.writestr(f"facture_{numero}.pdf", pdf)
+            yield flux.vider()
+    yield flux.vider()
+
+
+def _references(objet):
+    """Références indirectes d'un objet PDF, hors lien /Parent vers l'arbre des pages"""
+    if isinstance(objet, IndirectObject):
+        yield objet
+    elif isinstance(objet, dict):
+        for cle, valeur in objet.items():
+            if cle != '/Parent':
+                yield from _references(valeur)
+    elif isinstance(objet, list):
+        for valeur in objet:
+            yield from _references(valeur)
+
+
+def _renumeroter(objet, numeros):
+    """Remplace sur place les références par leur numéro dans le PDF fusionné"""
+    if isinstance(objet, dict):
+        elements = list(objet.items())
+    elif isinstance(objet, list):
+        elements = list(enumerate(objet))
+    else:
+        return
+    for cle, valeur in elements:
+        if isinstance(valeur, IndirectObject):
+            numero = numeros.get(valeur.idnum)
+            objet[cle] = IndirectObject(numero, 0, None) if numero else NullObject()
+        else:
+            _renumeroter(valeur, numeros)
+
+
+class _FusionPdf:
+    """
+    Concaténation de PDF écrite au fil de l'eau. Seuls les décalages des
+    objets (table xref) et les numéros des pages restent en mémoire ;
+    le catalogue (objet 1) et l'arbre des pages (objet 2) sont écrits à
+    la fin.
+    """
+    
+    def __init__(self):
+        self.positions = array('Q', [0, 0])
+        self.pages = array('Q')
+        self.taille = 0
+    
+    def _ecrire(self, tampon, numero, objet):
+        self.positions[numero - 1] = self.taille + tampon.tell()
+        tampon.write(f'{numero} 0 obj\n'.encode())
+        objet.write_to_stream(tampon)
+        tampon.write(b'\nendobj\n')
+    
+    def _emettre(self, tampon):
+        data = tampon.getvalue()
+        self.taille += len(data)
+        return data
+    
+    def entete(self):
+        return self._emettre(BytesIO(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'))
+    
+    def ajouter(self, pdf):
+        """Recopie les pages d'un PDF et les objets qu'elles utilisent"""
+        lecteur = PdfReader(BytesIO(pdf))
+        pages = [page.indirect_reference.idnum for page in lecteur.pages]
+        numeros = {}
+        a_visiter = list(reversed(pages))
+        while a_visiter:
+            ancien = a_visiter.pop()
+            if ancien in numeros:
+                continue
+            self.positions.append(0)
+            numeros[ancien] = len(self.positions)
+            a_visiter.extend(reference.idnum for reference in _references(lecteur.get_object(ancien)))
+        
+        tampon = BytesIO()
+        for ancien, numero in numeros.items():
+            objet = lecteur.get_object(ancien)
+            _renumeroter(objet, numeros)
+            if ancien in pages:
+                objet[NameObject('/Parent')] = IndirectObject(2, 0, None)
+            self._ecrire(tampon, numero, objet)
+        self.pages.extend(numeros[ancien] for ancien in pages)
+        return self._emettre(tampon)
+    
+    def fin(self, taille_morceau=64 * 1024):
+        """Arbre des pages, catalogue, table xref et trailer, par morceaux"""
+        tampon = BytesIO()
+        self.positions[1] = self.taille
+        tampon.write(f'2 0 obj\n<< /Type /Pages /Count {len(self.pages)} /Kids [ '.encode())
+        for numero in self.pages:
+            tampon.write(f'{numero} 0 R '.encode())
+            if tampon.tell() >= taille_morceau:
+                yield self._emettre(tampon)
+                tampon = BytesIO()
+        tampon.write(b']\n>>\nendobj\n')
+        self._ecrire(tampon, 1, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(2, 0, None),
+        }))
+        xref = self.taille + tampon.tell()
+        taille = len(self.positions) + 1
+        tampon.write(f'xref\n0 {taille}\n0000000000 65535 f \n'.encode())
+        for position in self.positions:
+            tampon.write(f'{position:010d} 00000 n \n'.encode())
+            if tampon.tell() >= taille_morceau:
+                yield self._emettre(tampon)
+                tampon = BytesIO()
+        tampon.write(f'trailer\n<< /Size {taille} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+        yield self._emettre(tampon)
+
+
+def flux_pdf(factures):
+    """Un seul PDF contenant toutes les factures, émis facture par facture"""
+    fusion = _FusionPdf()
+    yield fusion.entete()
+    for numero, pdf in factures:
+        yield fusion.ajouter(pdf)
+    yield from fusion.fin()
+
+
+async def flux_asynchrone(morceaux):
+    """
+    Itérateur asynchrone sur un flux synchrone : chaque morceau est
+    produit par sync_to_async, toujours dans le même thread (le curseur
+    du queryset y reste ouvert entre deux morceaux).
+    """
+    fin = object()
+    suivant = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (morceau := await suivant(morceaux, fin)) is not fin:
+            yield morceau
+    finally:
+        await sync_to_async(morceaux.close, thread_sensitive=True)()
+
+
+FORMATS = {
+    'zip': (flux_zip, 'application/zip'),
+    'pdf': (flux_pdf, 'application/pdf'),
+}
@@ -0,0 +1,107 @@
+import json
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from accounts.models import User
+from boutique.models import Panier, PanierItem, Produit
+from commandes.models import EmailSortant, ZoneLivraison
+from commandes.services import passer_commande
+
+DOMAINE = 'benchmark.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit du checkout (commandes/s) avec N workers concurrents "
+        "sur la base configurée. Lancer une fois par profil pour comparer, "
+        "par exemple DB_PROFIL=sqlite puis DB_PROFIL=postgres. Les comptes et "
+        "commandes de test sont supprimés à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 4, 8],
+            help="Nombres de workers concurrents à mesurer"
+        )
+        parser.add_argument('--commandes', type=int, default=50, help="Commandes passées par worker")
+        parser.add_argument('--json', help="Fichier où écrire les résultats")
+
+    def handle(self, *args, **options):
+        produit = Produit.objects.filter(actif=True).first()
+        zone = ZoneLivraison.objects.filter(active=True).first()
+        if produit is None or zone is None:
+            raise CommandError("Il faut au moins un produit actif et une zone de livraison active")
+
+        self.stdout.write(f"Profil {settings.DB_PROFIL} ({connection.vendor})")
+        resultats = []
+        try:
+            for workers in options['workers']:
+                resultat = self.mesurer(workers, options['commandes'], produit, zone)
+                resultats.append(resultat)
+                self.stdout.write(
+                    f"{workers:>3} worker(s) : {resultat['commandes_par_seconde']:>8.1f} commandes/s, "
+                    f"p50 {resultat['p50_ms']:.1f} ms, p95 {resultat['p95_ms']:.1f} ms, "
+                    f"{resultat['erreurs']} erreur(s)"
+                )
+        finally:
+            self.nettoyer()
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as fichier:
+                json.dump({'profil': settings.DB_PROFIL, 'resultats': resultats}, fichier, indent=2)
+
+    def mesurer(self, workers, nombre, produit, zone):
+        clients = [
+            User.objects.create_user(f'benchmark-{workers}-{i}', f'benchmark-{workers}-{i}@{DOMAINE}')
+            for i in range(workers)
+        ]
+        paniers = {client: Panier.objects.create(user=client) for client in clients}
+        durees, erreurs = [], []
+        depart = threading.Barrier(workers + 1)
+
+        def worker(client):
+            panier = paniers[client]
+            try:
+                depart.wait()
+                for _ in range(nombre):
+                    debut = time.perf_counter()
+                    try:
+                        PanierItem.objects.create(panier=panier, produit=produit, quantite=Decimal('1'))
+                        passer_commande(client, zone, 'Benchmark', 'WAVE')
+                    except DatabaseError as e:
+                        erreurs.append(str(e))
+                    else:
+                        durees.append(time.perf_counter() - debut)
+            finally:
+                # Chaque thread a sa propre connexion
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        depart.wait()
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        total = time.perf_counter() - debut
+
+        durees.sort()
+        return {
+            'workers': workers,
+            'commandes': len(durees),
+            'erreurs': len(erreurs),
+            'duree_s': round(total, 3),
+            'commandes_par_seconde': round(len(durees) / total, 1) if total else 0,
+            'p50_ms': round(statistics.median(durees) * 1000, 1) if durees else 0,
+            'p95_ms': round(durees[max(int(len(durees) * 0.95) - 1, 0)] * 1000, 1) if durees else 0,
+        }
+
+    def nettoyer(self):
+        EmailSortant.objects.filter(destinataire__endswith=f'@{DOMAINE}').delete()
+        User.objects.filter(email__endswith=f'@{DOMAINE}').delete()
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from commandes.emails import envoyer_file
+
+
+class Command(BaseCommand):
+    help = "Envoie les emails en file d'attente par lots sur une connexion SMTP réutilisée"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=50, help="Nombre d'emails par lot")
+        parser.add_argument('--boucle', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--pause', type=float, default=5, help="Pause (s) quand la file est vide")
+
+    def handle(self, *args, **options):
+        while True:
+            envoyes, echecs = envoyer_file(limite=options['lot'])
+            if envoyes or echecs:
+                self.stdout.write(f"{envoyes} email(s) envoyé(s), {echecs} en échec")
+            if not options['boucle']:
+                break
+            # Lot complet : il reste probablement des emails, on enchaîne
+            if envoyes + echecs < options['lot']:
+                time.sleep(options['pause'])
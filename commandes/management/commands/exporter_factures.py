@@ -0,0 +1,32 @@
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from commandes.export import commandes_a_exporter, rendre_factures, FORMATS
+
+
+class Command(BaseCommand):
+    help = "Exporte les factures d'une période dans une archive ZIP ou un PDF fusionné"
+
+    def add_arguments(self, parser):
+        parser.add_argument('sortie', help="Fichier de sortie")
+        parser.add_argument('--debut', type=date.fromisoformat, help="Date de début (AAAA-MM-JJ)")
+        parser.add_argument('--fin', type=date.fromisoformat, help="Date de fin (AAAA-MM-JJ)")
+        parser.add_argument('--statut', help="Statut des commandes (ex : LIVREE)")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='zip')
+        parser.add_argument('--processus', type=int, default=os.cpu_count(), help="Nombre de processus de rendu (0 : aucun)")
+        parser.add_argument('--lot', type=int, default=200, help="Factures en cours de rendu au maximum")
+
+    def handle(self, *args, **options):
+        commandes = commandes_a_exporter(
+            debut=options['debut'], fin=options['fin'], statut=options['statut']
+        )
+        total = commandes.count()
+        if not total:
+            raise CommandError("Aucune commande pour ces critères")
+        
+        flux, content_type = FORMATS[options['format']]
+        with open(options['sortie'], 'wb') as sortie:
+            for morceau in flux(rendre_factures(commandes, options['processus'], options['lot'])):
+                sortie.write(morceau)
+        self.stdout.write(self.style.SUCCESS(f"{total} facture(s) exportée(s) dans {options['sortie']}"))
@@ -0,0 +1,16 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from commandes.models import VenteJournaliere
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les ventes journalières d'une période à partir des commandes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=date.fromisoformat, help="Date de début (AAAA-MM-JJ)")
+        parser.add_argument('--fin', type=date.fromisoformat, help="Date de fin (AAAA-MM-JJ)")
+
+    def handle(self, *args, **options):
+        lignes = VenteJournaliere.recalculer(debut=options['debut'], fin=options['fin'])
+        self.stdout.write(self.style.SUCCESS(f"{len(lignes)} ligne(s) de ventes journalières recalculée(s)"))
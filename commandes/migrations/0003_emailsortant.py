@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0002_commande_code_promo_utilise_commande_reduction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinataire', models.EmailField(max_length=254, verbose_name='Destinataire')),
+                ('sujet', models.CharField(max_length=255, verbose_name='Sujet')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('ENVOYE', 'Envoyé'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20, verbose_name='Statut')),
+                ('tentatives', models.PositiveIntegerField(default=0, verbose_name='Tentatives')),
+                ('prochaine_tentative', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Prochaine tentative')),
+                ('derniere_erreur', models.TextField(blank=True, default='', verbose_name='Dernière erreur')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('date_envoi', models.DateTimeField(blank=True, null=True, verbose_name="Date d'envoi")),
+            ],
+            options={
+                'verbose_name': 'Email sortant',
+                'verbose_name_plural': 'Emails sortants',
+                'ordering': ['-date_creation'],
+                'indexes': [models.Index(fields=['statut', 'prochaine_tentative'], name='email_file_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0003_produit_notes'),
+        ('commandes', '0003_emailsortant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VenteJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('type_client', models.CharField(max_length=10, verbose_name='Type de client')),
+                ('quantite', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Quantité vendue (kg)')),
+                ('chiffre_affaires', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name="Chiffre d'affaires (FCFA)")),
+                ('nombre_commandes', models.IntegerField(default=0, verbose_name='Nombre de commandes')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='boutique.produit', verbose_name='Produit')),
+                ('zone_livraison', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='commandes.zonelivraison', verbose_name='Zone de livraison')),
+            ],
+            options={
+                'verbose_name': 'Vente journalière',
+                'verbose_name_plural': 'Ventes journalières',
+                'ordering': ['-date'],
+                'unique_together': {('date', 'produit', 'type_client', 'zone_livraison')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_codepromo_pointsfidelite_historiquepoints'),
+        ('commandes', '0004_ventejournaliere'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['user', 'date_commande', 'id'], name='commande_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_codepromo_pointsfidelite_historiquepoints'),
+        ('boutique', '0007_produit_produit_actif_idx'),
+        ('commandes', '0005_commande_commande_user_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(condition=models.Q(('paiement_valide', True)), fields=['date_commande'], name='commande_payee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['date_commande'], name='commande_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commandeitem',
+            index=models.Index(fields=['produit', 'commande'], name='commandeitem_produit_idx'),
+        ),
+    ]
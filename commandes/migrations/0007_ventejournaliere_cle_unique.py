@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:11
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fusionner_doublons(apps, schema_editor):
+    """Regroupe les lignes sans zone en double (unique_together ne les empêchait pas)"""
+    VenteJournaliere = apps.get_model('commandes', 'VenteJournaliere')
+    cle = ('date', 'produit', 'type_client')
+    doublons = VenteJournaliere.objects.filter(zone_livraison=None).values(*cle).annotate(
+        nombre=Count('pk'),
+        quantite_totale=Sum('quantite'),
+        total=Sum('chiffre_affaires'),
+        commandes=Sum('nombre_commandes'),
+    ).filter(nombre__gt=1)
+    for ligne in doublons:
+        conservee, *autres = VenteJournaliere.objects.filter(
+            zone_livraison=None, date=ligne['date'], produit_id=ligne['produit'], type_client=ligne['type_client']
+        ).order_by('pk')
+        VenteJournaliere.objects.filter(pk=conservee.pk).update(
+            quantite=ligne['quantite_totale'],
+            chiffre_affaires=ligne['total'],
+            nombre_commandes=ligne['commandes'],
+        )
+        VenteJournaliere.objects.filter(pk__in=[vente.pk for vente in autres]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0010_produit_recherche_postgres'),
+        ('commandes', '0006_commande_commande_payee_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionner_doublons, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='ventejournaliere',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='ventejournaliere',
+            name='zone_livraison',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='commandes.zonelivraison', verbose_name='Zone de livraison'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventejournaliere',
+            constraint=models.UniqueConstraint(models.F('date'), models.F('produit'), models.F('type_client'), django.db.models.functions.comparison.Coalesce('zone_livraison', models.Value(0)), name='ventejournaliere_cle_unique'),
+        ),
+    ]
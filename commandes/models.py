@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Coalesce
 from boutique.models import Produit
 from django.utils import timezone
+from datetime import datetime, time, timedelta
 
 class ZoneLivraison(models.Model):
     """
@@ -32,6 +34,71 @@ class ZoneLivraison(models.Model):
         return f"{self.nom} - {self.frais_livraison} FCFA"
 
 
+class CommandeManager(models.Manager):
+    """
+    Manager des commandes avec transitions de statut en masse
+    """
+    # statut cible : (statuts de départ autorisés, champ date à renseigner)
+    TRANSITIONS = {
+        'CONFIRMEE': (['EN_ATTENTE'], 'date_confirmation'),
+        'EXPEDIEE': (['CONFIRMEE', 'EN_PREPARATION'], 'date_expedition'),
+        'LIVREE': (['EXPEDIEE'], 'date_livraison'),
+    }
+    
+    def transition(self, queryset, statut):
+        """
+        Fait passer les commandes du queryset au statut donné en quelques
+        requêtes : mise à jour ensembliste du statut et de la date, stocks
+        décrémentés par légume, notifications en bulk_create et emails
+        mis en file d'attente.
+        
+        Retourne (commandes modifiées, commandes rejetées faute de stock) ;
+        lève ConflitStock (transaction annulée) si un stock a changé
+        pendant la réservation.
+        """
+        from production.services import reserver_commandes
+        from notifications.models import Notification
+        from .emails import (
+            mettre_en_file, contenu_notification_expedition, contenu_notification_livraison
+        )
+        
+        statuts_depart, champ_date = self.TRANSITIONS[statut]
+        now = timezone.now()
+        
+        with transaction.atomic():
+            eligibles = queryset.select_for_update().filter(statut__in=statuts_depart)
+            if statut == 'CONFIRMEE':
+                eligibles = eligibles.filter(paiement_valide=True)
+            # select_for_update ne supporte pas les jointures nullables sur PostgreSQL
+            commandes = list(
+                self.filter(pk__in=list(eligibles.values_list('pk', flat=True)))
+                .select_related('user', 'zone_livraison')
+                .order_by('date_commande', 'pk')
+            )
+            
+            rejetees = []
+            if statut == 'CONFIRMEE':
+                resultats = reserver_commandes(commandes)
+                rejetees = [c for c in commandes if not resultats[c.pk].ok]
+                commandes = [c for c in commandes if resultats[c.pk].ok]
+            
+            self.filter(pk__in=[c.pk for c in commandes]).update(
+                statut=statut, **{champ_date: now}
+            )
+            for commande in commandes:
+                commande.statut = statut
+                setattr(commande, champ_date, now)
+            
+            if statut == 'EXPEDIEE':
+                Notification.notifier_en_masse(Notification.contenu_expedition, commandes)
+                mettre_en_file(contenu_notification_expedition, commandes)
+            elif statut == 'LIVREE':
+                Notification.notifier_en_masse(Notification.contenu_livraison, commandes)
+                mettre_en_file(contenu_notification_livraison, commandes)
+        
+        return commandes, rejetees
+
+
 class Commande(models.Model):
     """
     Commandes clients
@@ -164,14 +231,42 @@ class Commande(models.Model):
         verbose_name="Notes administrateur"
     )
     
+    objects = CommandeManager()
+    
     class Meta:
         verbose_name = "Commande"
         verbose_name_plural = "Commandes"
         ordering = ['-date_commande']
+        indexes = [
+            # Historique d'un client, paginé par curseur (date_commande, id)
+            models.Index(fields=['user', 'date_commande', 'id'], name='commande_user_date_idx'),
+            # Commandes payées par période (reconstruction des ventes) ; partiel car
+            # le filtre booléen n'est pas une égalité exploitable en tête d'index
+            models.Index(
+                fields=['date_commande'],
+                condition=models.Q(paiement_valide=True),
+                name='commande_payee_date_idx'
+            ),
+            # Commandes récentes (dashboard, admin)
+            models.Index(fields=['date_commande'], name='commande_date_idx'),
+        ]
     
     def __str__(self):
         return f"Commande {self.numero_commande} - {self.user}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémoriser l'état chargé pour détecter paiement / annulation
+        if {'paiement_valide', 'statut'} <= set(field_names):
+            instance._comptee_en_base = instance.est_comptee_dans_ventes
+        return instance
+    
+    @property
+    def est_comptee_dans_ventes(self):
+        """Une commande payée et non annulée compte dans les ventes"""
+        return self.paiement_valide and self.statut != 'ANNULEE'
+    
     def save(self, *args, **kwargs):
         # Générer un numéro de commande unique
         if not self.numero_commande:
@@ -181,24 +276,46 @@ class Commande(models.Model):
         # Calculer le montant total
         self.montant_total = self.montant_produits + self.frais_livraison
         
-        super().save(*args, **kwargs)
+        if self._state.adding:
+            comptee_avant = False
+        elif hasattr(self, '_comptee_en_base'):
+            comptee_avant = self._comptee_en_base
+        else:
+            comptee_avant = Commande.objects.filter(
+                pk=self.pk, paiement_valide=True
+            ).exclude(statut='ANNULEE').exists()
+        comptee_apres = self.est_comptee_dans_ventes
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Mettre à jour les ventes journalières au paiement / à l'annulation
+            if comptee_avant != comptee_apres:
+                VenteJournaliere.enregistrer(self, 1 if comptee_apres else -1)
+        self._comptee_en_base = comptee_apres
     
     def confirmer(self):
-        """Confirme la commande et met à jour les stocks"""
+        """
+        Confirme la commande et réserve les stocks.
+        
+        Retourne le ResultatReservation (None si la commande n'est pas
+        confirmable) ; la commande reste en attente si le stock manque.
+        Lève ConflitStock si le stock a changé pendant la réservation.
+        """
         if self.statut == 'EN_ATTENTE' and self.paiement_valide:
-            self.statut = 'CONFIRMEE'
-            self.date_confirmation = timezone.now()
-            self.save()
-            
-            # Diminuer les stocks
-            from production.models import Stock
-            for item in self.items.all():
-                try:
-                    stock = Stock.objects.get(legume=item.produit.legume)
-                    stock.quantite_disponible -= item.quantite
-                    stock.save()
-                except Stock.DoesNotExist:
-                    pass
+            from production.services import reserver_commande
+            with transaction.atomic():
+                # Verrouiller la commande pour éviter une double confirmation
+                if not Commande.objects.select_for_update().filter(
+                    pk=self.pk, statut='EN_ATTENTE'
+                ).exists():
+                    return None
+                
+                # Diminuer les stocks
+                resultat = reserver_commande(self)
+                if resultat.ok:
+                    self.statut = 'CONFIRMEE'
+                    self.date_confirmation = timezone.now()
+                    self.save()
+            return resultat
 
 
 class CommandeItem(models.Model):
@@ -235,6 +352,10 @@ class CommandeItem(models.Model):
     class Meta:
         verbose_name = "Article de commande"
         verbose_name_plural = "Articles de commande"
+        indexes = [
+            # Achat vérifié (Avis.save) : produit -> commandes, sans lire la table
+            models.Index(fields=['produit', 'commande'], name='commandeitem_produit_idx'),
+        ]
     
     def __str__(self):
         return f"{self.produit} x {self.quantite} kg"
@@ -242,4 +363,225 @@ class CommandeItem(models.Model):
     def save(self, *args, **kwargs):
         # Calculer le sous-total
         self.sous_total = self.quantite * self.prix_unitaire
-        super().save(*args, **kwargs)
\ No newline at end of file
+        with transaction.atomic():
+            commande = self._commande_comptee()
+            if commande:
+                VenteJournaliere.enregistrer(commande, -1)
+            super().save(*args, **kwargs)
+            if commande:
+                VenteJournaliere.enregistrer(commande, 1)
+    
+    def _commande_comptee(self):
+        """
+        Commande verrouillée si elle compte déjà dans les ventes : ses lignes
+        y sont retirées puis ré-enregistrées autour de la modification (ligne
+        ajoutée à une commande créée payée, par exemple dans l'admin). Les
+        suppressions passent par les signaux de commandes.signals.
+        """
+        return Commande.objects.select_for_update(of=('self',)).select_related('user').filter(
+            pk=self.commande_id, paiement_valide=True
+        ).exclude(statut='ANNULEE').first()
+
+
+class EmailSortant(models.Model):
+    """
+    File d'attente persistante des emails transactionnels
+    (envoyés par la commande envoyer_emails)
+    """
+    STATUT_CHOICES = (
+        ('EN_ATTENTE', 'En attente'),
+        ('ENVOYE', 'Envoyé'),
+        ('ECHEC', 'Échec'),
+    )
+    
+    destinataire = models.EmailField(
+        verbose_name="Destinataire"
+    )
+    sujet = models.CharField(
+        max_length=255,
+        verbose_name="Sujet"
+    )
+    message = models.TextField(
+        verbose_name="Message"
+    )
+    statut = models.CharField(
+        max_length=20,
+        choices=STATUT_CHOICES,
+        default='EN_ATTENTE',
+        verbose_name="Statut"
+    )
+    tentatives = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Tentatives"
+    )
+    prochaine_tentative = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Prochaine tentative"
+    )
+    derniere_erreur = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Dernière erreur"
+    )
+    date_creation = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Date de création"
+    )
+    date_envoi = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Date d'envoi"
+    )
+    
+    class Meta:
+        verbose_name = "Email sortant"
+        verbose_name_plural = "Emails sortants"
+        ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['statut', 'prochaine_tentative'], name='email_file_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.destinataire} - {self.sujet}"
+
+
+
+class VenteJournaliere(models.Model):
+    """
+    Ventes agrégées par jour, produit, type de client et zone de livraison
+    (commandes payées et non annulées ; montants hors livraison et réduction)
+    """
+    date = models.DateField(
+        verbose_name="Date"
+    )
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        verbose_name="Produit"
+    )
+    type_client = models.CharField(
+        max_length=10,
+        verbose_name="Type de client"
+    )
+    # PROTECT : passer les lignes d'une zone supprimée à NULL les ferait
+    # entrer en conflit avec celles déjà sans zone
+    zone_livraison = models.ForeignKey(
+        ZoneLivraison,
+        on_delete=models.PROTECT,
+        null=True,
+        verbose_name="Zone de livraison"
+    )
+    quantite = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Quantité vendue (kg)"
+    )
+    chiffre_affaires = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Chiffre d'affaires (FCFA)"
+    )
+    nombre_commandes = models.IntegerField(
+        default=0,
+        verbose_name="Nombre de commandes"
+    )
+    
+    class Meta:
+        verbose_name = "Vente journalière"
+        verbose_name_plural = "Ventes journalières"
+        ordering = ['-date']
+        constraints = [
+            # Zone NULL comptée comme une valeur (0) : unique_together laisse
+            # passer plusieurs lignes sans zone pour la même clé
+            models.UniqueConstraint(
+                models.F('date'), models.F('produit'), models.F('type_client'),
+                Coalesce('zone_livraison', models.Value(0)),
+                name='ventejournaliere_cle_unique'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.produit} ({self.type_client}) : {self.quantite} kg"
+    
+    @staticmethod
+    def enregistrer(commande, signe):
+        """
+        Ajoute (signe=1) ou retire (signe=-1) les lignes d'une commande
+        des agrégats, avec des mises à jour F() atomiques
+        """
+        date = timezone.localdate(commande.date_commande)
+        type_client = commande.user.user_type
+        lignes = CommandeItem.objects.filter(commande=commande).values('produit').annotate(
+            quantite_totale=models.Sum('quantite'),
+            total=models.Sum('sous_total'),
+        )
+        for ligne in lignes:
+            cle = dict(
+                date=date,
+                produit_id=ligne['produit'],
+                type_client=type_client,
+                zone_livraison_id=commande.zone_livraison_id,
+            )
+            deltas = dict(
+                quantite=models.F('quantite') + signe * ligne['quantite_totale'],
+                chiffre_affaires=models.F('chiffre_affaires') + signe * ligne['total'],
+                nombre_commandes=models.F('nombre_commandes') + signe,
+            )
+            if not VenteJournaliere.objects.filter(**cle).update(**deltas):
+                try:
+                    with transaction.atomic():
+                        VenteJournaliere.objects.create(
+                            quantite=signe * ligne['quantite_totale'],
+                            chiffre_affaires=signe * ligne['total'],
+                            nombre_commandes=signe,
+                            **cle
+                        )
+                except IntegrityError:
+                    # Ligne créée entre-temps par une autre transaction
+                    VenteJournaliere.objects.filter(**cle).update(**deltas)
+    
+    @staticmethod
+    def recalculer(debut=None, fin=None):
+        """Reconstruit les agrégats d'une période depuis les commandes"""
+        from django.db.models.functions import TruncDate
+        
+        def minuit(jour):
+            return timezone.make_aware(datetime.combine(jour, time.min))
+        
+        # Bornes sur la colonne brute (et non date_commande__date) pour
+        # utiliser l'index commande_payee_date_idx
+        commandes = Commande.objects.filter(paiement_valide=True).exclude(statut='ANNULEE')
+        ventes = VenteJournaliere.objects.all()
+        if debut:
+            commandes = commandes.filter(date_commande__gte=minuit(debut))
+            ventes = ventes.filter(date__gte=debut)
+        if fin:
+            commandes = commandes.filter(date_commande__lt=minuit(fin + timedelta(days=1)))
+            ventes = ventes.filter(date__lte=fin)
+        
+        agregats = CommandeItem.objects.filter(commande__in=commandes).annotate(
+            jour=TruncDate('commande__date_commande'),
+        ).values(
+            'jour', 'produit', 'commande__user__user_type', 'commande__zone_livraison'
+        ).annotate(
+            quantite_totale=models.Sum('quantite'),
+            total=models.Sum('sous_total'),
+            commandes=models.Count('commande', distinct=True),
+        ).order_by()
+        
+        with transaction.atomic():
+            ventes.delete()
+            return VenteJournaliere.objects.bulk_create([
+                VenteJournaliere(
+                    date=agregat['jour'],
+                    produit_id=agregat['produit'],
+                    type_client=agregat['commande__user__user_type'],
+                    zone_livraison_id=agregat['commande__zone_livraison'],
+                    quantite=agregat['quantite_totale'],
+                    chiffre_affaires=agregat['total'],
+                    nombre_commandes=agregat['commandes'],
+                )
+                for agregat in agregats.iterator()
+            ], batch_size=500)
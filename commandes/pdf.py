@@ -1,24 +1,24 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from functools import lru_cache
+from pathlib import Path
+
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse
 from datetime import datetime
 
-def generer_facture_pdf(commande):
-    """Génère une facture PDF pour une commande"""
-    
-    # Créer la réponse HTTP
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="facture_{commande.numero_commande}.pdf"'
-    
-    # Créer le document PDF
-    doc = SimpleDocTemplate(response, pagesize=A4)
-    elements = []
-    
-    # Styles
+
+@lru_cache(maxsize=1)
+def _styles():
+    """Feuille de styles construite une seule fois par processus"""
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
         'CustomTitle',
@@ -28,6 +28,48 @@ def generer_facture_pdf(commande):
         spaceAfter=30,
         alignment=TA_CENTER
     )
+    return styles, title_style
+
+
+def donnees_facture(commande, items=None):
+    """
+    Champs affichés sur la facture, sous forme de chaînes
+    (sérialisables pour le rendu dans un autre processus)
+    """
+    if items is None:
+        items = commande.items.select_related('produit')
+    return {
+        'numero_commande': commande.numero_commande,
+        'date': commande.date_commande.strftime('%d/%m/%Y'),
+        'client': commande.user.get_full_name(),
+        'email': commande.user.email,
+        'telephone': commande.user.telephone,
+        'adresse_livraison': commande.adresse_livraison,
+        'zone_livraison': commande.zone_livraison.nom if commande.zone_livraison else '',
+        'lignes': [
+            (item.produit.nom, str(item.quantite), str(item.prix_unitaire), str(item.sous_total))
+            for item in items
+        ],
+        'montant_produits': str(commande.montant_produits),
+        'frais_livraison': str(commande.frais_livraison),
+        'montant_total': str(commande.montant_total),
+        'mode_paiement': commande.get_mode_paiement_display(),
+        'statut': commande.get_statut_display(),
+    }
+
+
+def empreinte_facture(donnees):
+    """Hash des champs qui apparaissent sur la facture"""
+    return hashlib.sha256(repr(sorted(donnees.items())).encode()).hexdigest()
+
+
+def construire_facture_pdf(donnees, destination):
+    """Écrit la facture PDF dans destination (chemin ou fichier)"""
+    doc = SimpleDocTemplate(destination, pagesize=A4)
+    elements = []
+    
+    # Styles
+    styles, title_style = _styles()
     
     # En-tête
     elements.append(Paragraph("GROW WITH GREEN", title_style))
@@ -36,20 +78,20 @@ def generer_facture_pdf(commande):
     elements.append(Spacer(1, 1*cm))
     
     # Titre facture
-    elements.append(Paragraph(f"FACTURE N° {commande.numero_commande}", styles['Heading2']))
-    elements.append(Paragraph(f"Date: {commande.date_commande.strftime('%d/%m/%Y')}", styles['Normal']))
+    elements.append(Paragraph(f"FACTURE N° {donnees['numero_commande']}", styles['Heading2']))
+    elements.append(Paragraph(f"Date: {donnees['date']}", styles['Normal']))
     elements.append(Spacer(1, 0.5*cm))
     
     # Informations client
     client_info = f"""
     <b>Client:</b><br/>
-    {commande.user.get_full_name()}<br/>
-    {commande.user.email}<br/>
-    {commande.user.telephone}<br/>
+    {donnees['client']}<br/>
+    {donnees['email']}<br/>
+    {donnees['telephone']}<br/>
     <br/>
     <b>Adresse de livraison:</b><br/>
-    {commande.adresse_livraison}<br/>
-    {commande.zone_livraison.nom}
+    {donnees['adresse_livraison']}<br/>
+    {donnees['zone_livraison']}
     """
     elements.append(Paragraph(client_info, styles['Normal']))
     elements.append(Spacer(1, 1*cm))
@@ -57,18 +99,18 @@ def generer_facture_pdf(commande):
     # Tableau des articles
     data = [['Produit', 'Quantité', 'Prix unitaire', 'Total']]
     
-    for item in commande.items.all():
+    for nom, quantite, prix_unitaire, sous_total in donnees['lignes']:
         data.append([
-            item.produit.nom,
-            f"{item.quantite} kg",
-            f"{item.prix_unitaire} FCFA",
-            f"{item.sous_total} FCFA"
+            nom,
+            f"{quantite} kg",
+            f"{prix_unitaire} FCFA",
+            f"{sous_total} FCFA"
         ])
     
     # Totaux
-    data.append(['', '', 'Sous-total:', f"{commande.montant_produits} FCFA"])
-    data.append(['', '', 'Frais de livraison:', f"{commande.frais_livraison} FCFA"])
-    data.append(['', '', '<b>TOTAL:</b>', f"<b>{commande.montant_total} FCFA</b>"])
+    data.append(['', '', 'Sous-total:', f"{donnees['montant_produits']} FCFA"])
+    data.append(['', '', 'Frais de livraison:', f"{donnees['frais_livraison']} FCFA"])
+    data.append(['', '', '<b>TOTAL:</b>', f"<b>{donnees['montant_total']} FCFA</b>"])
     
     # Style du tableau
     table = Table(data, colWidths=[8*cm, 3*cm, 4*cm, 3*cm])
@@ -89,8 +131,8 @@ def generer_facture_pdf(commande):
     
     # Pied de page
     footer = f"""
-    <b>Mode de paiement:</b> {commande.get_mode_paiement_display()}<br/>
-    <b>Statut:</b> {commande.get_statut_display()}<br/>
+    <b>Mode de paiement:</b> {donnees['mode_paiement']}<br/>
+    <b>Statut:</b> {donnees['statut']}<br/>
     <br/>
     Merci pour votre confiance !<br/>
     <i>Grow With Green - Légumes Premium</i>
@@ -99,5 +141,60 @@ def generer_facture_pdf(commande):
     
     # Construire le PDF
     doc.build(elements)
+
+
+def facture_pdf(commande):
+    """
+    Retourne (chemin, empreinte) de la facture, générée seulement si
+    aucun fichier n'existe pour l'état actuel de la commande.
+    
+    Les factures sont stockées sous MEDIA_ROOT/factures/, nommées par
+    numéro de commande et empreinte des champs affichés.
+    """
+    donnees = donnees_facture(commande)
+    empreinte = empreinte_facture(donnees)
+    dossier = Path(settings.MEDIA_ROOT) / 'factures'
+    chemin = dossier / f"{commande.numero_commande}-{empreinte[:16]}.pdf"
+    
+    if not chemin.exists():
+        dossier.mkdir(parents=True, exist_ok=True)
+        # Écriture atomique : fichier temporaire puis renommage
+        fd, temporaire = tempfile.mkstemp(dir=dossier, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fichier:
+                construire_facture_pdf(donnees, fichier)
+            os.replace(temporaire, chemin)
+        except BaseException:
+            os.unlink(temporaire)
+            raise
+        # Supprimer les versions précédentes de cette facture
+        for ancien in dossier.glob(f"{commande.numero_commande}-*.pdf"):
+            if ancien != chemin:
+                ancien.unlink(missing_ok=True)
     
-    return response
\ No newline at end of file
+    return chemin, empreinte
+
+
+def reponse_facture(commande, chemin, empreinte):
+    """Réponse HTTP servant le fichier de facture (sendfile si disponible)"""
+    response = FileResponse(
+        open(chemin, 'rb'),
+        as_attachment=True,
+        filename=f"facture_{commande.numero_commande}.pdf",
+        content_type='application/pdf'
+    )
+    response['ETag'] = f'"{empreinte}"'
+    return response
+
+
+def generer_facture_pdf(commande):
+    """Génère (ou réutilise) la facture PDF d'une commande"""
+    chemin, empreinte = facture_pdf(commande)
+    return reponse_facture(commande, chemin, empreinte)
+
+
+def rendre_facture(donnees):
+    """Rendu en mémoire d'une facture ; exécuté dans les processus d'export"""
+    tampon = BytesIO()
+    construire_facture_pdf(donnees, tampon)
+    return donnees['numero_commande'], tampon.getvalue()
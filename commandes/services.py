@@ -0,0 +1,99 @@
+"""
+Création des commandes à partir du panier
+
+Service commun au checkout HTML et à l'API : le panier est chargé une
+seule fois (produits et client inclus), les totaux sont calculés en un
+passage et les lignes sont insérées avec bulk_create, le tout dans une
+seule transaction.
+
+Les deux points d'entrée ont donc le même effet. En particulier, une
+commande passée par l'API (POST /api/v1/commandes/) attribue maintenant les
+points de fidélité, ce que seul le checkout HTML faisait auparavant.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from accounts.models import PointsFidelite, HistoriquePoints
+from boutique.models import PanierItem
+from .emails import envoyer_confirmation_commande
+from .models import Commande, CommandeItem
+
+
+class PanierVide(Exception):
+    """Le panier de l'utilisateur ne contient aucun article"""
+
+
+def passer_commande(user, zone, adresse_livraison, mode_paiement, notes_client='', code_promo=None):
+    """
+    Crée la commande, ses lignes et les points de fidélité, puis vide le panier.
+    
+    Retourne (commande, message) ; message explique pourquoi le code promo
+    n'a pas été appliqué (None sinon).
+    """
+    with transaction.atomic():
+        items = list(
+            PanierItem.objects.filter(panier__user=user)
+            .select_related('produit', 'panier__user')
+            .select_for_update(of=('self',))
+        )
+        if not items:
+            raise PanierVide("Votre panier est vide")
+        
+        lignes = []
+        total = Decimal('0')
+        for item in items:
+            prix_unitaire = item.prix_unitaire
+            sous_total = item.quantite * prix_unitaire
+            total += sous_total
+            lignes.append(CommandeItem(
+                produit=item.produit,
+                quantite=item.quantite,
+                prix_unitaire=prix_unitaire,
+                sous_total=sous_total
+            ))
+        
+        reduction = Decimal('0')
+        message = None
+        if code_promo is not None:
+            est_valide, message = code_promo.est_valide(total)
+            if est_valide:
+                reduction = code_promo.calculer_reduction(total)
+                code_promo.utiliser()
+                message = None
+        
+        commande = Commande.objects.create(
+            user=user,
+            adresse_livraison=adresse_livraison,
+            zone_livraison=zone,
+            montant_produits=total - reduction,
+            frais_livraison=zone.frais_livraison,
+            mode_paiement=mode_paiement,
+            notes_client=notes_client,
+            paiement_valide=False,
+            statut='EN_ATTENTE',
+            reduction=reduction,
+            code_promo_utilise=code_promo if reduction > 0 else None
+        )
+        
+        for ligne in lignes:
+            ligne.commande = commande
+        CommandeItem.objects.bulk_create(lignes)
+        
+        # Points de fidélité sur le montant APRÈS réduction
+        points_fidelite, created = PointsFidelite.objects.get_or_create(user=user)
+        points_gagnes = points_fidelite.ajouter_points(commande.montant_total)
+        HistoriquePoints.objects.create(
+            points_fidelite=points_fidelite,
+            type='GAIN',
+            points=points_gagnes,
+            description=f"Commande {commande.numero_commande}",
+            commande=commande
+        )
+        
+        # Vider le panier
+        PanierItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+        
+        envoyer_confirmation_commande(commande)
+    
+    return commande, message
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from .models import CommandeItem, VenteJournaliere
+
+
+def _retirees(origin):
+    """Commandes retirées des ventes pour une suppression donnée"""
+    if not hasattr(origin, '_ventes_retirees'):
+        origin._ventes_retirees = {}
+    return origin._ventes_retirees
+
+
+@receiver(pre_delete, sender=CommandeItem)
+def retirer_commande_des_ventes(sender, instance, origin, **kwargs):
+    """
+    Suppression de lignes (instance, queryset ou cascade depuis la
+    commande ou l'utilisateur) : la commande est retirée des ventes une
+    seule fois par suppression, avant que ses lignes disparaissent
+    """
+    retirees = _retirees(origin)
+    if instance.commande_id not in retirees:
+        commande = instance._commande_comptee()
+        retirees[instance.commande_id] = commande
+        if commande:
+            VenteJournaliere.enregistrer(commande, -1)
+
+
+@receiver(post_delete, sender=CommandeItem)
+def reenregistrer_commande_dans_les_ventes(sender, instance, origin, **kwargs):
+    """
+    Après la suppression, les lignes restantes sont ré-enregistrées
+    (aucune si la commande est supprimée avec ses lignes)
+    """
+    commande = _retirees(origin).pop(instance.commande_id, None)
+    if commande:
+        VenteJournaliere.enregistrer(commande, 1)
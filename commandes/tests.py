@@ -1,3 +1,494 @@
-from django.test import TestCase
+import json
+import tempfile
+import zipfile
+from datetime import date
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+from rest_framework.test import APIClient
+
+from accounts.models import HistoriquePoints, PointsFidelite, User
+from boutique.models import PanierItem, Produit
+from boutique.services import ajouter_au_panier
+from grow_with_green.testing import JournalRequetes, PlanRequetesMixin
+from notifications.models import Notification
+from production.models import Legume, Stock
+from . import emails, pdf
+from .models import Commande, CommandeItem, EmailSortant, VenteJournaliere, ZoneLivraison
+
+
+class IndexCommandesTests(PlanRequetesMixin, TestCase):
+    """Les requêtes principales sur les commandes passent par leurs index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse', is_staff=True)
+        zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        for paiement_valide in (True, False):
+            Commande.objects.create(
+                user=cls.user, zone_livraison=zone, adresse_livraison='Cocody',
+                mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000,
+                paiement_valide=paiement_valide
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_mes_commandes(self):
+        self.assertIndexUtilise(
+            lambda: self.client.get('/commandes/mes-commandes/'),
+            'commandes_commande', 'commande_user_date_idx'
+        )
+
+    def test_commandes_recentes_dashboard(self):
+        self.assertIndexUtilise(
+            lambda: self.client.get('/admin/dashboard/'),
+            'commandes_commande', 'commande_date_idx'
+        )
+
+    def test_recalcul_des_ventes(self):
+        self.assertIndexUtilise(
+            lambda: VenteJournaliere.recalculer(date(2020, 1, 1), date.today()),
+            'commandes_commandeitem', 'commande_payee_date_idx'
+        )
+
+    def test_commande_recalculer_ventes(self):
+        sortie = StringIO()
+        call_command('recalculer_ventes', '--debut', '2020-01-01', '--fin', date.today().isoformat(), stdout=sortie)
+        call_command('recalculer_ventes', debut=date(2020, 1, 1), fin=date.today(), stdout=sortie)
+        self.assertEqual(sortie.getvalue().count('recalculée(s)'), 2)
+
+
+class VentesJournalieresTests(TestCase):
+    """Agrégats tenus à jour au paiement, à l'annulation et à l'ajout de lignes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        cls.zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        cls.produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+
+    def creer_commande(self, paiement_valide=False, quantites=(2,)):
+        commande = Commande.objects.create(
+            user=self.user, zone_livraison=self.zone, adresse_livraison='Cocody',
+            mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000,
+            paiement_valide=paiement_valide
+        )
+        for quantite in quantites:
+            CommandeItem.objects.create(commande=commande, produit=self.produit, quantite=quantite, prix_unitaire=1000)
+        return commande
+
+    def ventes(self):
+        return list(VenteJournaliere.objects.values_list('quantite', 'chiffre_affaires', 'nombre_commandes'))
+
+    def assertVentes(self, attendu):
+        self.assertEqual(self.ventes(), attendu)
+        # L'incrémental et la reconstruction donnent les mêmes agrégats
+        VenteJournaliere.recalculer()
+        self.assertEqual(self.ventes(), [ligne for ligne in attendu if ligne[2]])
+
+    def test_paiement_puis_annulation(self):
+        commande = self.creer_commande()
+        self.assertVentes([])
+
+        commande = Commande.objects.get(pk=commande.pk)
+        commande.paiement_valide = True
+        commande.save()
+        commande.save()
+        self.assertVentes([(2, 2000, 1)])
+
+        commande.statut = 'ANNULEE'
+        commande.save()
+        self.assertVentes([(0, 0, 0)])
+
+    def test_etat_charge_partiellement(self):
+        # Sans paiement_valide/statut chargés, l'état en base est relu
+        commande = Commande.objects.defer('statut').get(pk=self.creer_commande().pk)
+        commande.paiement_valide = True
+        commande.save()
+        self.assertVentes([(2, 2000, 1)])
+
+    def test_lignes_ajoutees_a_une_commande_payee(self):
+        commande = self.creer_commande(paiement_valide=True, quantites=(2, 3))
+        self.assertVentes([(5, 5000, 1)])
+
+        ligne = commande.items.first()
+        ligne.quantite = 1
+        ligne.save()
+        self.assertVentes([(4, 4000, 1)])
+        ligne.delete()
+        self.assertVentes([(3, 3000, 1)])
+
+    def test_suppressions_hors_instance(self):
+        commande = self.creer_commande(paiement_valide=True, quantites=(2, 3))
+        autre = self.creer_commande(paiement_valide=True, quantites=(1,))
+        self.assertVentes([(6, 6000, 2)])
+
+        # Suppression par queryset : une ligne de chaque commande
+        CommandeItem.objects.filter(pk__in=[commande.items.first().pk, autre.items.get().pk]).delete()
+        self.assertVentes([(3, 3000, 1)])
+
+        # Cascade depuis la commande
+        commande.delete()
+        self.assertVentes([(0, 0, 0)])
+
+    def test_une_ligne_par_cle_sans_zone(self):
+        commande = self.creer_commande(paiement_valide=True)
+        Commande.objects.filter(pk=commande.pk).update(zone_livraison=None)
+        commande = Commande.objects.select_related('user').get(pk=commande.pk)
+        VenteJournaliere.enregistrer(commande, 1)
+        self.assertEqual(VenteJournaliere.objects.filter(zone_livraison=None).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            VenteJournaliere.objects.create(
+                date=timezone.localdate(commande.date_commande), produit=self.produit,
+                type_client=self.user.user_type, zone_livraison=None
+            )
+
+    def test_chiffre_affaires_du_dashboard(self):
+        from boutique.dashboard import calculer_statistiques
+
+        self.creer_commande(paiement_valide=True, quantites=(2,))
+        annulee = self.creer_commande(paiement_valide=True, quantites=(3,))
+        annulee.statut = 'ANNULEE'
+        annulee.save()
+        statistiques = calculer_statistiques()
+        # Même montant pour l'indicateur et la série mensuelle
+        self.assertEqual(statistiques['stats']['ca_total'], 2000)
+        self.assertEqual(sum(statistiques['ventes_data']), 2000)
+        self.assertEqual(sum(client['total_depense'] for client in statistiques['top_clients']), 2000)
+
+
+class PasserCommandeTests(TestCase):
+    """Checkout HTML et API : mêmes lignes, mêmes points de fidélité, même email en file"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        cls.zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        Stock.objects.create(legume=legume, quantite_disponible=100)
+        cls.produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1500, prix_b2b=1200
+        )
+
+    def setUp(self):
+        ajouter_au_panier(self.user, self.produit, 2)
+
+    def assertCommandePassee(self):
+        commande = Commande.objects.get(user=self.user)
+        self.assertEqual(commande.montant_total, 4000)
+        self.assertEqual(list(commande.items.values_list('quantite', 'sous_total')), [(2, 3000)])
+        self.assertFalse(PanierItem.objects.filter(panier__user=self.user).exists())
+        # 1 point pour 100 FCFA, sur le total livraison comprise
+        self.assertEqual(PointsFidelite.objects.get(user=self.user).points, 40)
+        self.assertEqual(
+            list(HistoriquePoints.objects.values_list('type', 'points', 'commande')),
+            [('GAIN', 40, commande.pk)]
+        )
+        self.assertEqual(list(EmailSortant.objects.values_list('destinataire', flat=True)), ['client@example.com'])
+
+    def test_checkout_html(self):
+        self.client.force_login(self.user)
+        reponse = self.client.post(reverse('commandes:checkout'), {
+            'adresse_livraison': 'Cocody', 'zone_livraison': self.zone.pk, 'mode_paiement': 'WAVE',
+        })
+        self.assertEqual(reponse.status_code, 302)
+        self.assertCommandePassee()
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        reponse = client.post(reverse('api:commande-list'), {
+            'adresse_livraison': 'Cocody', 'zone_livraison_id': self.zone.pk, 'mode_paiement': 'WAVE',
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+        self.assertCommandePassee()
+
+
+class BenchmarkCheckoutTests(TransactionTestCase):
+    """La commande de mesure du checkout tourne sur le profil SQLite et nettoie ses données"""
+
+    def setUp(self):
+        self.zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        Stock.objects.create(legume=legume, quantite_disponible=100)
+        Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1500, prix_b2b=1200
+        )
+
+    def test_profil_sqlite(self):
+        sortie = StringIO()
+        with tempfile.TemporaryDirectory() as dossier:
+            fichier = Path(dossier) / 'resultats.json'
+            call_command('benchmark_checkout', '--workers', '1', '2', '--commandes', '3',
+                         '--json', str(fichier), stdout=sortie)
+            resultats = json.loads(fichier.read_text(encoding='utf-8'))
+
+        self.assertIn('Profil sqlite (sqlite)', sortie.getvalue())
+        self.assertEqual(resultats['profil'], 'sqlite')
+        self.assertEqual([r['workers'] for r in resultats['resultats']], [1, 2])
+        seul = resultats['resultats'][0]
+        self.assertEqual((seul['commandes'], seul['erreurs']), (3, 0))
+        self.assertGreater(seul['commandes_par_seconde'], 0)
+        # Verrou d'écriture SQLite : les commandes concurrentes passent ou échouent, aucune n'est perdue
+        self.assertEqual(sum(r['commandes'] + r['erreurs'] for r in resultats['resultats']), 9)
+
+        # Comptes de test supprimés, commandes et emails avec eux
+        self.assertFalse(User.objects.filter(email__endswith='@benchmark.invalid').exists())
+        self.assertFalse(Commande.objects.exists())
+        self.assertFalse(EmailSortant.objects.exists())
+
+    def test_sans_produit(self):
+        Produit.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'Il faut au moins un produit actif'):
+            call_command('benchmark_checkout', '--workers', '1', '--commandes', '1', stdout=StringIO())
+
+
+class ExportFacturesTests(TestCase):
+    """Export groupé : dates validées avant le flux, ZIP et PDF fusionné"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'motdepasse', is_staff=True)
+        zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+        for _ in range(3):
+            commande = Commande.objects.create(
+                user=cls.staff, zone_livraison=zone, adresse_livraison='Cocody',
+                mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000
+            )
+            CommandeItem.objects.create(commande=commande, produit=produit, quantite=1, prix_unitaire=1000)
+
+    def exporter(self, **parametres):
+        self.client.force_login(self.staff)
+        return self.client.get('/commandes/factures/export/', parametres)
+
+    def test_date_invalide(self):
+        for parametres in ({'debut': '2026-13-01'}, {'fin': 'hier'}):
+            with self.subTest(**parametres):
+                self.assertEqual(self.exporter(**parametres).status_code, 400)
+
+    def test_zip(self):
+        reponse = self.exporter(format='zip', debut=date.today().isoformat())
+        archive = zipfile.ZipFile(BytesIO(b''.join(reponse.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f'facture_{numero}.pdf' for numero in Commande.objects.values_list('numero_commande', flat=True))
+        )
+
+    def test_pdf_fusionne(self):
+        reponse = self.exporter(format='pdf')
+        lecteur = PdfReader(BytesIO(b''.join(reponse.streaming_content)), strict=True)
+        self.assertEqual(len(lecteur.pages), 3)
+        texte = ''.join(page.extract_text() for page in lecteur.pages)
+        for numero in Commande.objects.values_list('numero_commande', flat=True):
+            self.assertIn(numero, texte)
+
+    async def test_flux_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.staff)
+        reponse = await client.get('/commandes/factures/export/', {'format': 'zip'})
+        self.assertTrue(reponse.is_async)
+
+        morceaux = [morceau async for morceau in reponse.streaming_content]
+        # Au moins un morceau par facture, plus la fin de l'archive
+        self.assertGreaterEqual(len(morceaux), 4)
+        archive = zipfile.ZipFile(BytesIO(b''.join(morceaux)))
+        self.assertEqual(len(archive.namelist()), 3)
+
+
+class FileEmailsTests(TestCase):
+    """File d'emails : envoi différé, reprise avec délai, lot réservé hors transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        cls.commande = Commande.objects.create(
+            user=user, zone_livraison=zone, adresse_livraison='Cocody',
+            mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000
+        )
+
+    def test_envoi_differe(self):
+        emails.envoyer_confirmation_commande(self.commande)
+        emails.envoyer_notification_expedition(self.commande)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(emails.envoyer_file(), (2, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['client@example.com']] * 2)
+        self.assertIn(self.commande.numero_commande, mail.outbox[0].subject)
+        self.assertFalse(EmailSortant.objects.exclude(statut='ENVOYE').exists())
+        self.assertEqual(emails.envoyer_file(), (0, 0))
+
+    @override_settings(EMAIL_OUTBOX_MAX_TENTATIVES=2, EMAIL_OUTBOX_BACKOFF=60)
+    def test_reprise_puis_echec(self):
+        emails.envoyer_notification_livraison(self.commande)
+        with mock.patch.object(emails.EmailMessage, 'send', side_effect=OSError('SMTP indisponible')):
+            self.assertEqual(emails.envoyer_file(), (0, 1))
+            email = EmailSortant.objects.get()
+            self.assertEqual((email.statut, email.tentatives), ('EN_ATTENTE', 1))
+            self.assertGreater(email.prochaine_tentative, timezone.now())
+            self.assertEqual(emails.envoyer_file(), (0, 0))
+
+            EmailSortant.objects.update(prochaine_tentative=timezone.now())
+            self.assertEqual(emails.envoyer_file(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.statut, email.tentatives), ('ECHEC', 2))
+        self.assertEqual(email.derniere_erreur, 'SMTP indisponible')
+
+    def test_lot_reserve_pendant_l_envoi(self):
+        emails.envoyer_confirmation_commande(self.commande)
+        envoi = emails.EmailMessage.send
+        concurrents = []
+
+        def envoyer(message):
+            # Un autre worker passant pendant l'envoi SMTP ne reprend pas le lot
+            concurrents.append(emails.envoyer_file())
+            return envoi(message)
+
+        with mock.patch.object(emails.EmailMessage, 'send', autospec=True, side_effect=envoyer):
+            self.assertEqual(emails.envoyer_file(), (1, 0))
+        self.assertEqual(concurrents, [(0, 0)])
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class TransitionsCommandesTests(TestCase):
+    """Transitions en masse : statut, date, notification et email par commande"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        cls.zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=2)
+
+    def creer_commandes(self, nombre, statut):
+        return Commande.objects.bulk_create([
+            Commande(
+                user=self.user, zone_livraison=self.zone, adresse_livraison='Cocody', numero_commande=f'GWG-T{i}',
+                mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000, montant_total=2000,
+                paiement_valide=True, statut=statut
+            )
+            for i in range(nombre)
+        ])
+
+    def test_expedition_puis_livraison(self):
+        commandes = self.creer_commandes(3, 'CONFIRMEE')
+        queryset = Commande.objects.filter(pk__in=[c.pk for c in commandes])
+
+        expediees, rejetees = Commande.objects.transition(queryset, 'EXPEDIEE')
+        self.assertEqual((len(expediees), rejetees), (3, []))
+        for commande in queryset:
+            self.assertEqual(commande.statut, 'EXPEDIEE')
+            self.assertIsNotNone(commande.date_expedition)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('titre', flat=True)),
+            [f'Commande GWG-T{i} expédiée' for i in range(3)]
+        )
+        self.assertEqual(EmailSortant.objects.filter(destinataire='client@example.com').count(), 3)
+
+        livrees, rejetees = Commande.objects.transition(queryset, 'LIVREE')
+        self.assertEqual((len(livrees), rejetees), (3, []))
+        self.assertEqual(set(queryset.values_list('statut', flat=True)), {'LIVREE'})
+        self.assertFalse(queryset.filter(date_livraison=None).exists())
+        self.assertEqual(Notification.objects.filter(titre__startswith='Commande livrée').count(), 3)
+        self.assertEqual(EmailSortant.objects.count(), 6)
+
+    def test_transitions_refusees(self):
+        en_attente, = self.creer_commandes(1, 'EN_ATTENTE')
+        # Livraison directe sans expédition, expédition d'une commande non confirmée
+        for commande, statut in ((en_attente, 'EXPEDIEE'), (en_attente, 'LIVREE')):
+            with self.subTest(statut=statut):
+                modifiees, rejetees = Commande.objects.transition(Commande.objects.filter(pk=commande.pk), statut)
+                self.assertEqual((modifiees, rejetees), ([], []))
+        en_attente.refresh_from_db()
+        self.assertEqual(en_attente.statut, 'EN_ATTENTE')
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(EmailSortant.objects.exists())
+
+    def test_requetes_independantes_du_nombre_de_commandes(self):
+        def requetes(nombre):
+            commandes = self.creer_commandes(nombre, 'CONFIRMEE')
+            with JournalRequetes() as journal:
+                Commande.objects.transition(Commande.objects.filter(pk__in=[c.pk for c in commandes]), 'EXPEDIEE')
+            Commande.objects.all().delete()
+            return len(journal)
+
+        # Premier passage : création du compteur de notifications du client
+        requetes(1)
+        self.assertEqual(requetes(1), requetes(5))
+
+
+class FacturesTests(TestCase):
+    """Factures PDF : fichier réutilisé tant que la commande ne change pas, ETag et 304"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+        cls.commande = Commande.objects.create(
+            user=cls.user, zone_livraison=zone, adresse_livraison='Cocody',
+            mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000
+        )
+        CommandeItem.objects.create(commande=cls.commande, produit=produit, quantite=1, prix_unitaire=1000)
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(MEDIA_ROOT=dossier.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.dossier = Path(dossier.name) / 'factures'
+
+    def test_fichier_reutilise(self):
+        with mock.patch.object(pdf, 'construire_facture_pdf', wraps=pdf.construire_facture_pdf) as construire:
+            chemin, empreinte = pdf.facture_pdf(self.commande)
+            self.assertEqual(pdf.facture_pdf(self.commande), (chemin, empreinte))
+        self.assertEqual(construire.call_count, 1)
+
+        # Un champ affiché change : nouvelle version, l'ancienne est supprimée
+        self.commande.statut = 'CONFIRMEE'
+        nouveau_chemin, nouvelle_empreinte = pdf.facture_pdf(self.commande)
+        self.assertNotEqual(nouvelle_empreinte, empreinte)
+        self.assertEqual(list(self.dossier.iterdir()), [nouveau_chemin])
+
+    def test_etag_et_304(self):
+        self.client.force_login(self.user)
+        url = reverse('commandes:telecharger_facture', args=[self.commande.numero_commande])
+        reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(reponse.streaming_content).startswith(b'%PDF'))
+
+        reponse = self.client.get(url, headers={'if-none-match': reponse['ETag']})
+        self.assertEqual(reponse.status_code, 304)
+        reponse = self.client.get(url, headers={'if-none-match': '"perimee"'})
+        self.assertEqual(reponse.status_code, 200)
+        reponse.close()
+
+    def test_facture_d_un_autre_client(self):
+        autre = User.objects.create_user('autre', 'autre@example.com', 'motdepasse')
+        self.client.force_login(autre)
+        url = reverse('commandes:telecharger_facture', args=[self.commande.numero_commande])
+        self.assertEqual(self.client.get(url).status_code, 404)
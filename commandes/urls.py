@@ -9,4 +9,5 @@ urlpatterns = [
     path('mes-commandes/', views.mes_commandes, name='mes_commandes'),
     path('detail/<str:numero_commande>/', views.detail_commande, name='detail_commande'),
     path('facture/<str:numero_commande>/', views.telecharger_facture, name='telecharger_facture'),
+    path('factures/export/', views.exporter_factures, name='exporter_factures'),
 ]
\ No newline at end of file
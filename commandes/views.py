@@ -1,21 +1,67 @@
+from datetime import date
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse, HttpResponseBadRequest
 from boutique.models import Panier
 from .models import Commande, CommandeItem, ZoneLivraison
-from .emails import envoyer_confirmation_commande
-from notifications.models import Notification
-from accounts.models import PointsFidelite, HistoriquePoints
-from .pdf import generer_facture_pdf
+from django.utils.cache import get_conditional_response
+from .pdf import facture_pdf, reponse_facture
+from .services import passer_commande, PanierVide
+from .export import commandes_a_exporter, flux_asynchrone, rendre_factures, FORMATS
 from accounts.models import CodePromo
+from grow_with_green.pagination import paginer_requete
 
 @login_required
 def telecharger_facture(request, numero_commande):
     """Télécharger la facture en PDF"""
-    commande = get_object_or_404(Commande, numero_commande=numero_commande, user=request.user)
+    commande = get_object_or_404(
+        Commande.objects.select_related('user', 'zone_livraison'),
+        numero_commande=numero_commande,
+        user=request.user
+    )
+    
+    # Le client a déjà cette version de la facture : 304
+    chemin, empreinte = facture_pdf(commande)
+    non_modifie = get_conditional_response(request, etag=f'"{empreinte}"')
+    if non_modifie is not None:
+        return non_modifie
+    
+    # Retourner le PDF mis en cache (généré seulement si la commande a changé)
+    return reponse_facture(commande, chemin, empreinte)
+
+
+@staff_member_required
+def exporter_factures(request):
+    """Export des factures d'une période (?debut=&fin=&statut=&format=zip|pdf)"""
+    format_export = request.GET.get('format', 'zip')
+    if format_export not in FORMATS:
+        return HttpResponseBadRequest("Format invalide (zip ou pdf)")
+    
+    # Dates validées avant le début du flux : une erreur en cours de
+    # réponse ne peut plus devenir un 400
+    try:
+        debut = date.fromisoformat(request.GET['debut']) if request.GET.get('debut') else None
+        fin = date.fromisoformat(request.GET['fin']) if request.GET.get('fin') else None
+    except ValueError:
+        return HttpResponseBadRequest("Date invalide (AAAA-MM-JJ)")
     
-    # Générer et retourner le PDF
-    return generer_facture_pdf(commande)
+    commandes = commandes_a_exporter(debut=debut, fin=fin, statut=request.GET.get('statut') or None)
+    flux, content_type = FORMATS[format_export]
+    # Rendu dans le processus du worker web (pas de ProcessPoolExecutor ici)
+    morceaux = flux(rendre_factures(commandes))
+    if isinstance(request, ASGIRequest):
+        # Un itérateur synchrone serait consommé en entier avant l'envoi
+        morceaux = flux_asynchrone(morceaux)
+    response = StreamingHttpResponse(morceaux, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="factures.{format_export}"'
+    return response
+
+
 @login_required
 def checkout(request):
     """Page de checkout (finalisation de commande)"""
@@ -49,78 +95,33 @@ def checkout(request):
             messages.error(request, "Zone de livraison invalide")
             return render(request, 'commandes/checkout.html', {'panier': panier})
         
-        # --- CODE PROMO À AJOUTER ICI ---
+        code_promo = None
         code_promo_str = request.POST.get('code_promo', '')
-        reduction = 0
-        
         if code_promo_str:
             try:
                 code_promo = CodePromo.objects.get(code=code_promo_str)
-                est_valide, message = code_promo.est_valide(panier.total)
-                
-                if est_valide:
-                    reduction = code_promo.calculer_reduction(panier.total)
-                    code_promo.utiliser()
-                else:
-                    messages.warning(request, message)
             except CodePromo.DoesNotExist:
                 messages.error(request, "Code promo invalide")
         
-        # Calculer le montant final des produits
-        montant_produits = panier.total - reduction
-        # --- FIN DU CODE PROMO ---
-        
-        # Créer la commande (MODIFIER CETTE LIGNE)
+        # Créer la commande, ses lignes et les points dans une seule transaction
         try:
-            commande = Commande.objects.create(
+            commande, message_promo = passer_commande(
                 user=request.user,
+                zone=zone,
                 adresse_livraison=adresse_livraison,
-                zone_livraison=zone,
-                montant_produits=montant_produits,  # ICI: utiliser montant_produits au lieu de panier.total
-                frais_livraison=zone.frais_livraison,
                 mode_paiement=mode_paiement,
                 notes_client=notes_client,
-                paiement_valide=False,
-                statut='EN_ATTENTE',
-                reduction=reduction  # AJOUTER CETTE LIGNE si vous avez ce champ dans votre modèle
-            )
-            
-            # Ajoutez aussi le code promo utilisé à la commande
-            if code_promo_str and reduction > 0:
-                commande.code_promo_utilise = code_promo  # Assurez-vous d'avoir ce champ dans Commande
-                commande.save()
-            
-            Notification.notifier_nouvelle_commande(commande)
-            envoyer_confirmation_commande(commande)
-            
-            # Calcul des points de fidélité sur le montant APRÈS réduction
-            points_fidelite, created = PointsFidelite.objects.get_or_create(user=request.user)
-            points_gagnes = points_fidelite.ajouter_points(commande.montant_total)
-            
-            # Historique
-            HistoriquePoints.objects.create(
-                points_fidelite=points_fidelite,
-                type='GAIN',
-                points=points_gagnes,
-                description=f"Commande {commande.numero_commande}",
-                commande=commande
+                code_promo=code_promo
             )
-            
-            # Créer les items de commande
-            for item in panier.items.all():
-                CommandeItem.objects.create(
-                    commande=commande,
-                    produit=item.produit,
-                    quantite=item.quantite,
-                    prix_unitaire=item.prix_unitaire
-                )
-            
-            # Vider le panier
-            panier.items.all().delete()
+            if message_promo:
+                messages.warning(request, message_promo)
             
             messages.success(request, f"Commande {commande.numero_commande} créée avec succès !")
             return redirect('commandes:confirmation', numero_commande=commande.numero_commande)
             
+        except PanierVide:
+            messages.warning(request, "Votre panier est vide")
+            return redirect('boutique:catalogue')
         except Exception as e:
             messages.error(request, f"Erreur lors de la création de la commande: {str(e)}")
             return render(request, 'commandes/checkout.html', {'panier': panier})
@@ -146,10 +147,16 @@ def confirmation(request, numero_commande):
 @login_required
 def mes_commandes(request):
     """Liste des commandes de l'utilisateur"""
-    commandes = Commande.objects.filter(user=request.user).order_by('-date_commande')
+    commandes = Commande.objects.filter(user=request.user)
     
     context = {
-        'commandes': commandes,
+        'commandes': paginer_requete(
+            request,
+            commandes.select_related('zone_livraison').annotate(nombre_articles=Count('items')),
+            ('-date_commande', '-pk'),
+            taille=10
+        ),
+        'nombre_commandes': commandes.count(),
     }
     return render(request, 'commandes/mes_commandes.html', context)
 
@@ -157,7 +164,13 @@ def mes_commandes(request):
 @login_required
 def detail_commande(request, numero_commande):
     """Détail d'une commande"""
-    commande = get_object_or_404(Commande, numero_commande=numero_commande, user=request.user)
+    commande = get_object_or_404(
+        Commande.objects.select_related('user', 'zone_livraison').prefetch_related(
+            Prefetch('items', queryset=CommandeItem.objects.select_related('produit__legume'))
+        ),
+        numero_commande=numero_commande,
+        user=request.user
+    )
     
     context = {
         'commande': commande,
@@ -3,6 +3,14 @@ ASGI config for grow_with_green project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Seul le flux SSE des notifications (/notifications/flux/) est servi par ce
+point d'entrée (processus « sse » du Procfile, workers uvicorn) : le proxy
+y route ce chemin, le reste du site passe par grow_with_green.wsgi. Sous
+ASGI, Django consomme les StreamingHttpResponse synchrones (export des
+factures...) en une seule liste ; ils doivent rester sur WSGI pour être
+réellement diffusés en flux. Une fois ce processus déployé, activer le
+flux dans les pages avec NOTIFICATIONS_SSE=1.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from . import entete
+
+
+def compteurs_entete(request):
+    """
+    Compteurs du panier et des notifications non lues pour base.html,
+    servis depuis le cache (grow_with_green.entete), et activation du flux
+    temps réel des notifications.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {
+        'compteurs_entete': SimpleLazyObject(lambda: entete.compteurs(user)),
+        'notifications_sse': settings.NOTIFICATIONS_SSE,
+    }
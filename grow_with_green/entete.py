@@ -0,0 +1,88 @@
+"""
+Compteurs de l'en-tête des pages : articles du panier et notifications
+non lues de l'utilisateur connecté.
+
+Les deux valeurs sont lues en une requête (nombre d'articles et compteur
+dénormalisé notifications.CompteurNotifications) puis conservées dans le
+cache sous une entrée par utilisateur (ENTETE_CACHE_TIMEOUT secondes).
+L'entrée est supprimée après validation de toute écriture sur PanierItem
+(signaux de boutique) et de tout ajustement du compteur de notifications.
+La suppression doit atteindre tous les processus (workers web, diffusion
+des promotions, purge) : le cache est partagé (CACHE_PROFIL redis ou db,
+voir les settings), sinon les autres workers garderaient un badge périmé
+jusqu'à l'expiration de l'entrée.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _cle(user_id):
+    return f'entete:{user_id}'
+
+
+def _cle_panier(panier_id):
+    return f'entete:panier:{panier_id}'
+
+
+def _compter(queryset, champ):
+    return Coalesce(Subquery(
+        queryset.values(champ).annotate(n=Count('pk')).values('n'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def calculer(user_id):
+    from accounts.models import User
+    from boutique.models import PanierItem
+
+    valeurs = User.objects.filter(pk=user_id).values(
+        nombre_panier=_compter(PanierItem.objects.filter(panier__user=OuterRef('pk')), 'panier__user'),
+        nombre_notifications=Coalesce('compteur_notifications__non_lues', 0),
+    ).first() or {}
+    return {
+        'panier': valeurs.get('nombre_panier', 0),
+        'notifications': valeurs.get('nombre_notifications', 0),
+    }
+
+
+def compteurs(user):
+    """{'panier': n, 'notifications': n} de l'utilisateur, depuis le cache"""
+    cle = _cle(user.pk)
+    valeurs = cache.get(cle)
+    if valeurs is None:
+        valeurs = calculer(user.pk)
+        cache.set(cle, valeurs, settings.ENTETE_CACHE_TIMEOUT)
+    return valeurs
+
+
+def invalider(*user_ids):
+    """Supprime les compteurs des utilisateurs après validation de la transaction"""
+    cles = [_cle(user_id) for user_id in set(user_ids)]
+    if cles:
+        transaction.on_commit(lambda: cache.delete_many(cles))
+
+
+def invalider_panier_item(item):
+    """
+    Invalide les compteurs du propriétaire d'un article de panier.
+
+    Le propriétaire d'un panier ne change pas : il est mémorisé dans le
+    cache pour que la suppression en masse des articles (checkout) ne
+    coûte pas une requête par article.
+    """
+    from boutique.models import Panier, PanierItem
+
+    if PanierItem.panier.is_cached(item):
+        invalider(item.panier.user_id)
+        return
+    cle = _cle_panier(item.panier_id)
+    user_id = cache.get(cle)
+    if user_id is None:
+        user_id = Panier.objects.filter(pk=item.panier_id).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return
+        cache.set(cle, user_id, None)
+    invalider(user_id)
@@ -0,0 +1,111 @@
+"""
+Instrumentation des requêtes HTTP : nombre de requêtes SQL, requêtes
+répétées (signature des N+1), temps passé en base et dans la vue.
+
+Pour chaque requête échantillonnée (settings.INSTRUMENTATION_ECHANTILLON) :
+- un en-tête Server-Timing (db, app) lisible dans les outils du navigateur ;
+- au-delà de settings.INSTRUMENTATION_SEUIL_LENT_MS, une ligne JSON sur le
+  logger ``grow_with_green.requetes_lentes`` avec les modèles SQL les plus
+  répétés.
+
+Le SQL transmis au wrapper contient des %s à la place des valeurs : c'est
+déjà le « modèle » de la requête, aucune normalisation n'est nécessaire.
+Les requêtes non échantillonnées ne paient rien.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('grow_with_green.requetes_lentes')
+
+
+class CompteurSQL:
+    """Wrapper d'exécution : agrège nombre et durée par modèle SQL"""
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+        self.par_modele = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duree = time.perf_counter() - debut
+            self.nombre += 1
+            self.duree += duree
+            stats = self.par_modele.get(sql)
+            if stats is None:
+                self.par_modele[sql] = [1, duree]
+            else:
+                stats[0] += 1
+                stats[1] += duree
+
+    @property
+    def doublons(self):
+        return self.nombre - len(self.par_modele)
+
+    def plus_repetees(self, limite):
+        repetees = sorted(
+            ((sql, n, d) for sql, (n, d) in self.par_modele.items() if n > 1),
+            key=lambda ligne: (ligne[1], ligne[2]),
+            reverse=True
+        )
+        return [
+            {'sql': sql[:300], 'nombre': n, 'duree_ms': round(d * 1000, 2)}
+            for sql, n, d in repetees[:limite]
+        ]
+
+
+class InstrumentationMiddleware:
+    """
+    À placer en tête de MIDDLEWARE pour compter aussi les requêtes de
+    session et d'authentification.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        echantillon = getattr(settings, 'INSTRUMENTATION_ECHANTILLON', 0)
+        if echantillon <= 0 or random.random() >= echantillon:
+            return self.get_response(request)
+
+        compteur = CompteurSQL()
+        debut = time.perf_counter()
+        with ExitStack() as pile:
+            for alias in connections:
+                pile.enter_context(connections[alias].execute_wrapper(compteur))
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        db_ms = compteur.duree * 1000
+        total_ms = duree * 1000
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{compteur.nombre} requetes SQL", '
+            f'app;dur={total_ms - db_ms:.1f}'
+        )
+
+        if total_ms >= getattr(settings, 'INSTRUMENTATION_SEUIL_LENT_MS', 500):
+            match = getattr(request, 'resolver_match', None)
+            # Utilisateur déjà chargé par la vue : ne pas déclencher de requête ici
+            user = getattr(request, '_cached_user', None)
+            logger.warning(json.dumps({
+                'methode': request.method,
+                'chemin': request.path,
+                'vue': match.view_name if match else None,
+                'statut': response.status_code,
+                'user_id': user.pk if user is not None and user.is_authenticated else None,
+                'duree_ms': round(total_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'vue_ms': round(total_ms - db_ms, 1),
+                'requetes': compteur.nombre,
+                'doublons': compteur.doublons,
+                'sql_repetees': compteur.plus_repetees(getattr(settings, 'INSTRUMENTATION_TOP_SQL', 5)),
+            }, ensure_ascii=False))
+        return response
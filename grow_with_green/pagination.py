@@ -0,0 +1,189 @@
+"""
+Pagination par curseur (keyset) partagée par les vues HTML et l'API.
+
+Au lieu d'un OFFSET, chaque page filtre sur les valeurs de tri de la
+dernière ligne vue, par exemple pour ('-date_commande', '-pk') :
+
+    date_commande < d OR (date_commande = d AND id < i)
+
+Avec un index composite sur ces colonnes, une page profonde coûte autant
+que la première. Le curseur est un jeton opaque (JSON en base64).
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CurseurInvalide(ValueError):
+    """Jeton de pagination illisible ou incompatible avec le tri"""
+
+
+@dataclass
+class PageCurseur:
+    """Objets d'une page et curseurs des pages voisines (None aux extrémités)"""
+    objets: list
+    suivant: str = None
+    precedent: str = None
+
+    def __iter__(self):
+        return iter(self.objets)
+
+    def __len__(self):
+        return len(self.objets)
+
+    @property
+    def a_suivant(self):
+        return self.suivant is not None
+
+    @property
+    def a_precedent(self):
+        return self.precedent is not None
+
+
+def _champ(ordre):
+    return ordre.lstrip('-')
+
+
+def _inverser(ordre):
+    return ordre[1:] if ordre.startswith('-') else f'-{ordre}'
+
+
+def encoder(valeurs, arriere=False):
+    donnees = {'v': valeurs}
+    if arriere:
+        donnees['r'] = 1
+    brut = json.dumps(donnees, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip('=')
+
+
+def decoder(curseur, modele, ordre):
+    """Retourne (valeurs converties, arriere) ou lève CurseurInvalide"""
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        donnees = json.loads(brut)
+        valeurs = donnees['v']
+        if len(valeurs) != len(ordre):
+            raise CurseurInvalide(curseur)
+        valeurs = [
+            modele._meta.get_field(_champ(o)).to_python(v) if _champ(o) != 'pk'
+            else modele._meta.pk.to_python(v)
+            for o, v in zip(ordre, valeurs)
+        ]
+    except (binascii.Error, ValueError, KeyError, TypeError, ValidationError) as e:
+        raise CurseurInvalide(curseur) from e
+    return valeurs, bool(donnees.get('r'))
+
+
+def _apres(ordre, valeurs):
+    """Q des lignes situées strictement après `valeurs` dans l'ordre donné"""
+    condition = Q()
+    egalites = {}
+    for o, valeur in zip(ordre, valeurs):
+        operateur = 'lt' if o.startswith('-') else 'gt'
+        condition |= Q(**egalites, **{f'{_champ(o)}__{operateur}': valeur})
+        egalites[_champ(o)] = valeur
+    return condition
+
+
+def _valeurs(objet, ordre):
+    return [getattr(objet, _champ(o)) for o in ordre]
+
+
+def paginer(queryset, ordre, curseur=None, taille=20):
+    """
+    Retourne une PageCurseur de `taille` objets triés selon `ordre`
+    (dont le dernier champ doit être unique, typiquement 'pk').
+    """
+    valeurs, arriere = (None, False)
+    if curseur:
+        valeurs, arriere = decoder(curseur, queryset.model, ordre)
+
+    sens = [_inverser(o) for o in ordre] if arriere else list(ordre)
+    qs = queryset.order_by(*sens)
+    if valeurs is not None:
+        qs = qs.filter(_apres(sens, valeurs))
+
+    objets = list(qs[:taille + 1])
+    encore = len(objets) > taille
+    objets = objets[:taille]
+    if arriere:
+        objets.reverse()
+
+    page = PageCurseur(objets)
+    if not objets:
+        return page
+    if encore or arriere:
+        page.suivant = encoder(_valeurs(objets[-1], ordre))
+    if (encore and arriere) or (valeurs is not None and not arriere):
+        page.precedent = encoder(_valeurs(objets[0], ordre), arriere=True)
+    return page
+
+
+def paginer_requete(request, queryset, ordre, taille=20, parametre='curseur'):
+    """Variante pour les vues HTML : un curseur invalide ramène à la première page"""
+    try:
+        return paginer(queryset, ordre, request.GET.get(parametre), taille)
+    except CurseurInvalide:
+        return paginer(queryset, ordre, None, taille)
+
+
+class CurseurPagination(BasePagination):
+    """
+    Pagination DRF par curseur composite ; les sous-classes définissent `ordre`.
+    """
+    ordre = ('-pk',)
+    page_size = 20
+    cursor_query_param = 'curseur'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginer(
+                queryset, self.ordre,
+                request.query_params.get(self.cursor_query_param),
+                self.page_size
+            )
+        except CurseurInvalide:
+            raise NotFound("Curseur invalide")
+        return self.page.objets
+
+    def _lien(self, curseur):
+        if curseur is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, curseur)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._lien(self.page.suivant),
+            'previous': self._lien(self.page.precedent),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': "Curseur de pagination",
+            'schema': {'type': 'string'},
+        }]
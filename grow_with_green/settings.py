@@ -8,6 +8,7 @@ from pathlib import Path
 import os
 from datetime import timedelta
 from django.contrib.messages import constants as messages
+from django.core.exceptions import ImproperlyConfigured
 
 # -------------------------------------------------------------------
 # BASE
@@ -67,6 +68,7 @@ JAZZMIN_SETTINGS = {
 # MIDDLEWARE
 # -------------------------------------------------------------------
 MIDDLEWARE = [
+    'grow_with_green.middleware.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -76,6 +78,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'production.middleware.StockMemoMiddleware',
 ]
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -101,6 +104,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
+                'grow_with_green.context_processors.compteurs_entete',
             ],
         },
     },
@@ -109,11 +113,184 @@ TEMPLATES = [
 # -------------------------------------------------------------------
 # DATABASE
 # -------------------------------------------------------------------
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Profil choisi par DB_PROFIL :
+# - 'sqlite' (défaut, petites installations) : mode WAL (lectures non
+#   bloquées par une écriture), attente de 20 s sur un verrou au lieu
+#   d'une erreur « database is locked », transactions IMMEDIATE pour
+#   prendre le verrou d'écriture dès le début du checkout ;
+# - 'postgres' : connexions persistantes (DB_CONN_MAX_AGE secondes,
+#   vérifiées avant réutilisation) ou, avec DB_POOL=1, pool de connexions
+#   de Django (nécessite psycopg 3 : pip install "psycopg[pool]").
+DB_PROFIL = os.environ.get('DB_PROFIL', 'sqlite')
+
+if DB_PROFIL == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'grow_with_green'),
+            'USER': os.environ.get('DB_USER', 'grow_with_green'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # Le pool remplace les connexions persistantes (incompatibles)
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+        }
+elif DB_PROFIL == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728'
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_PROFIL inconnu : {DB_PROFIL!r} (sqlite ou postgres)")
+
+# -------------------------------------------------------------------
+# CACHE
+# -------------------------------------------------------------------
+# Les invalidations (génération du catalogue, compteurs de l'en-tête,
+# version des suggestions, stock) et les clés d'idempotence de l'API
+# passent par le cache : il doit être commun à tous les processus (workers
+# web, envoi des emails, diffusion des promotions). Profil choisi par
+# CACHE_PROFIL :
+# - 'locmem' (défaut avec sqlite) : cache propre au processus, réservé au
+#   développement avec un seul processus ; refusé avec le profil postgres
+#   ou plusieurs workers (WEB_CONCURRENCY) ;
+# - 'redis' (défaut avec postgres) : serveur CACHE_URL (paquet redis) ;
+# - 'db' : table cache_grow_with_green de la base, sans service
+#   supplémentaire (à créer avec manage.py createcachetable).
+CACHE_PROFIL = os.environ.get('CACHE_PROFIL', 'redis' if DB_PROFIL == 'postgres' else 'locmem')
+
+if CACHE_PROFIL == 'locmem':
+    if DB_PROFIL == 'postgres' or int(os.environ.get('WEB_CONCURRENCY', '1')) > 1:
+        raise ImproperlyConfigured(
+            "CACHE_PROFIL=locmem n'est pas partagé entre les processus : "
+            "utiliser CACHE_PROFIL=redis ou CACHE_PROFIL=db"
+        )
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'grow-with-green',
+        }
+    }
+elif CACHE_PROFIL == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('CACHE_URL', 'redis://localhost:6379/0'),
+            'KEY_PREFIX': 'grow-with-green',
+        }
     }
+elif CACHE_PROFIL == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_grow_with_green',
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"CACHE_PROFIL inconnu : {CACHE_PROFIL!r} (locmem, redis ou db)")
+
+# Durée de vie (secondes) des quantités de stock en cache
+STOCK_CACHE_TIMEOUT = 300
+
+# Durée de vie (secondes) des indicateurs du dashboard administrateur
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Durée de vie (secondes) des réponses du catalogue en cache ; une écriture
+# sur le catalogue les rend obsolètes immédiatement (boutique.cache_catalogue)
+CATALOGUE_CACHE_TIMEOUT = 3600
+
+# Index de suggestions en mémoire : reconstruit au plus tard après ce délai
+# (secondes) pour intégrer les recherches fréquentes, ou dès qu'un autre
+# processus incrémente la version partagée dans le cache
+SUGGESTIONS_TTL = 600
+# Lecture de la version partagée au plus toutes les N secondes : délai
+# maximal avant qu'un worker voie une modification faite par un autre
+SUGGESTIONS_VERIFICATION = 5
+# Nombre minimal de recherches pour qu'un terme soit proposé
+SUGGESTIONS_TERME_MIN = 3
+# Recherches comptées en mémoire, écrites en lot au plus toutes les N secondes
+SUGGESTIONS_ENREGISTREMENT_INTERVALLE = 30
+
+# Durée de vie (secondes) des compteurs de l'en-tête (panier, notifications
+# non lues) ; invalidés à chaque écriture (grow_with_green.entete)
+ENTETE_CACHE_TIMEOUT = 900
+
+# Flux temps réel des notifications (notifications.views.flux_notifications),
+# ouvert par les pages seulement si NOTIFICATIONS_SSE=1 : le flux occupe sa
+# connexion en permanence et doit être servi par l'application ASGI
+# (processus « sse » du Procfile) ; sous WSGI il bloquerait un thread par page.
+# Intervalle (secondes) des commentaires de maintien de connexion, qui sert
+# aussi au rattrapage en base, et délai de reconnexion conseillé au
+# navigateur (millisecondes)
+NOTIFICATIONS_SSE = os.environ.get('NOTIFICATIONS_SSE') == '1'
+NOTIFICATIONS_SSE_KEEPALIVE = 25
+NOTIFICATIONS_SSE_RETRY_MS = 5000
+
+# Durée (secondes) pendant laquelle une réponse de l'API est rejouée pour
+# une même Idempotency-Key (api.idempotence)
+IDEMPOTENCE_TTL = 3600
+
+# Rétention des notifications (jours) : au-delà, la commande
+# purger_notifications les supprime ou les archive
+NOTIFICATIONS_RETENTION_LUES_JOURS = 90
+NOTIFICATIONS_RETENTION_NON_LUES_JOURS = 365
+
+# Inactivité (secondes) au-delà de laquelle une campagne promotionnelle
+# EN_COURS est considérée abandonnée et peut être reprise
+# (diffuser_promotions --campagne)
+NOTIFICATIONS_CAMPAGNE_INACTIVITE = 600
+
+# -------------------------------------------------------------------
+# INSTRUMENTATION (grow_with_green.middleware)
+# -------------------------------------------------------------------
+# Part des requêtes instrumentées (0 = désactivé, 1 = toutes)
+INSTRUMENTATION_ECHANTILLON = float(os.environ.get('INSTRUMENTATION_ECHANTILLON', '0.1'))
+# Au-delà de cette durée (ms), la requête est journalisée en JSON
+INSTRUMENTATION_SEUIL_LENT_MS = int(os.environ.get('INSTRUMENTATION_SEUIL_LENT_MS', '500'))
+# Nombre de modèles SQL répétés inclus dans la ligne de journal
+INSTRUMENTATION_TOP_SQL = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'requetes_lentes': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'grow_with_green.requetes_lentes': {
+            'handlers': ['requetes_lentes'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 # -------------------------------------------------------------------
@@ -155,6 +332,11 @@ AUTH_USER_MODEL = 'accounts.User'
 # -------------------------------------------------------------------
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# File d'attente des emails (commande envoyer_emails)
+EMAIL_OUTBOX_MAX_TENTATIVES = 5
+EMAIL_OUTBOX_BACKOFF = 60  # secondes, doublé à chaque échec
+EMAIL_OUTBOX_BAIL = 300  # secondes de réservation d'un lot par un worker
+
 # -------------------------------------------------------------------
 # MESSAGES
 # -------------------------------------------------------------------
@@ -0,0 +1,196 @@
+"""
+Outils de test partagés : journal des requêtes SQL et plans d'exécution
+"""
+import time
+import unittest
+from dataclasses import dataclass
+
+from django.db import connection
+
+
+@dataclass
+class Requete:
+    sql: str
+    params: tuple
+    duree: float
+
+
+class JournalRequetes:
+    """
+    Enregistre les requêtes exécutées dans le bloc (SQL, paramètres, durée).
+
+        with JournalRequetes() as journal:
+            client.get(url)
+        len(journal), journal.duree_totale
+    """
+
+    def __init__(self, connexion=None):
+        self.connexion = connexion or connection
+        self.requetes = []
+
+    def _enregistrer(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.requetes.append(Requete(sql, params, time.perf_counter() - debut))
+
+    def __enter__(self):
+        self._wrapper = self.connexion.execute_wrapper(self._enregistrer)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._wrapper.__exit__(*exc)
+
+    def __len__(self):
+        return len(self.requetes)
+
+    @property
+    def duree_totale(self):
+        return sum(requete.duree for requete in self.requetes)
+
+    def selects(self, table):
+        """Requêtes SELECT lisant la table donnée (en FROM)"""
+        return [
+            requete for requete in self.requetes
+            if requete.sql.startswith('SELECT') and f'FROM "{table}"' in requete.sql
+        ]
+
+
+def plan_execution(requete, connexion=None):
+    """Plan SQLite (EXPLAIN QUERY PLAN) d'une requête, une étape par ligne"""
+    connexion = connexion or connection
+    with connexion.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {requete.sql}', requete.params)
+        return '\n'.join(ligne[-1] for ligne in cursor.fetchall())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Plans vérifiés sur SQLite uniquement")
+class PlanRequetesMixin:
+    """Assertions sur les index utilisés par les requêtes d'une action"""
+
+    def plans(self, action, table):
+        with JournalRequetes() as journal:
+            action()
+        requetes = journal.selects(table)
+        self.assertTrue(requetes, f"Aucune requête sur {table}")
+        return [plan_execution(requete) for requete in requetes]
+
+    def assertIndexUtilise(self, action, table, index):
+        plans = self.plans(action, table)
+        self.assertTrue(
+            any(f'INDEX {index}' in plan for plan in plans),
+            f"{index} n'est pas utilisé sur {table} :\n" + '\n---\n'.join(plans)
+        )
+
+
+def peupler_donnees(echelle=1):
+    """
+    Jeu de données réaliste pour les mesures de performance (insertions en
+    masse). Retourne un dict des objets de référence : 'client' (compte
+    ayant un long historique), 'staff', 'produit', 'commande', 'avis',
+    'notification', 'panier_item'.
+
+    Le catalogue est limité à un produit par légume (Produit.legume est un
+    OneToOneField sur les trois types de légumes).
+    """
+    import random
+    import uuid
+    from decimal import Decimal
+
+    from accounts.models import User
+    from boutique.models import Avis, Panier, PanierItem, Produit, Wishlist, WishlistItem
+    from commandes.models import Commande, CommandeItem, VenteJournaliere, ZoneLivraison
+    from notifications.models import CompteurNotifications, Notification
+    from production.models import Legume, Stock
+
+    aleatoire = random.Random(42)
+    nb_clients = 50 * echelle
+    nb_commandes = 2000 * echelle
+    nb_notifications = 20 * echelle
+
+    zones = ZoneLivraison.objects.bulk_create([
+        ZoneLivraison(nom=nom, frais_livraison=frais, delai_livraison=delai)
+        for nom, frais, delai in (('Abidjan', 1000, 1), ('Bouaké', 2500, 2), ('Yamoussoukro', 2000, 2))
+    ])
+
+    produits = []
+    for nom in ('COURGE', 'GOMBO', 'AUBERGINE'):
+        legume = Legume.objects.create(nom=nom, cycle_jours=60, description=f"{nom.title()} bio")
+        Stock.objects.create(legume=legume, quantite_disponible=Decimal('5000'))
+        produits.append(Produit.objects.create(
+            legume=legume, nom=f"{nom.title()} fraîche", description=f"{nom.title()} cultivée localement",
+            image='products/produit.jpg', prix_b2c=Decimal('1500'), prix_b2b=Decimal('1200')
+        ))
+
+    staff = User.objects.create_user('staff', 'staff@example.com', 'motdepasse', is_staff=True)
+    client = User.objects.create_user('client', 'client@example.com', 'motdepasse', first_name='Awa')
+    clients = [client] + User.objects.bulk_create([
+        User(username=f'client{i}', email=f'client{i}@example.com', user_type=aleatoire.choice(['B2C', 'B2B']))
+        for i in range(nb_clients - 1)
+    ])
+
+    commandes = Commande.objects.bulk_create([
+        Commande(
+            # Un quart des commandes appartient au client de référence
+            user=client if i % 4 == 0 else aleatoire.choice(clients),
+            numero_commande=f"GWG-{uuid.UUID(int=aleatoire.getrandbits(128)).hex[:8].upper()}",
+            adresse_livraison='Cocody, Abidjan',
+            zone_livraison=aleatoire.choice(zones),
+            montant_produits=Decimal('3000'),
+            frais_livraison=Decimal('1000'),
+            montant_total=Decimal('4000'),
+            mode_paiement='WAVE',
+            paiement_valide=i % 5 != 0,
+            statut=aleatoire.choice(['EN_ATTENTE', 'CONFIRMEE', 'EXPEDIEE', 'LIVREE']),
+        )
+        for i in range(nb_commandes)
+    ], batch_size=500)
+    CommandeItem.objects.bulk_create([
+        CommandeItem(
+            commande=commande, produit=produit, quantite=Decimal('1'),
+            prix_unitaire=produit.prix_b2c, sous_total=produit.prix_b2c
+        )
+        for commande in commandes
+        for produit in aleatoire.sample(produits, aleatoire.randint(1, 3))
+    ], batch_size=1000)
+    VenteJournaliere.recalculer()
+
+    Avis.objects.bulk_create([
+        Avis(produit=produit, user=user, note=aleatoire.randint(1, 5), titre='Avis', commentaire='Très bon produit')
+        for user in clients
+        for produit in produits
+    ], batch_size=500)
+    Produit.objects.recalculer_notes()
+
+    Notification.objects.bulk_create([
+        Notification(
+            user=user, type='INFO', titre=f'Notification {i}', message='Message',
+            lien='/boutique/', lu=i % 3 != 0
+        )
+        for user in clients
+        for i in range(nb_notifications * (10 if user == client else 1))
+    ], batch_size=1000)
+    CompteurNotifications.recalculer()
+
+    panier = Panier.objects.create(user=client)
+    PanierItem.objects.bulk_create([
+        PanierItem(panier=panier, produit=produit, quantite=Decimal('2')) for produit in produits
+    ])
+    wishlist = Wishlist.objects.create(user=client)
+    WishlistItem.objects.bulk_create([WishlistItem(wishlist=wishlist, produit=produit) for produit in produits])
+
+    from boutique.search import reindexer
+    reindexer()
+
+    return {
+        'client': client,
+        'staff': staff,
+        'produit': produits[0],
+        'commande': Commande.objects.filter(user=client).first(),
+        'avis': Avis.objects.filter(produit=produits[0]).exclude(user=client).first(),
+        # Non lue : marquer_lu met aussi à jour le compteur
+        'notification': Notification.objects.filter(user=client, lu=False).first(),
+        'panier_item': panier.items.first(),
+    }
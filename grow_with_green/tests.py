@@ -0,0 +1,376 @@
+"""
+Budgets de requêtes SQL par vue.
+
+Chaque URL des applications boutique, commandes, accounts, notifications et
+de l'API v1 est appelée sur un jeu de données réaliste (voir
+grow_with_green.testing.peupler_donnees) ; le test échoue si une vue dépasse
+le nombre de requêtes déclaré ci-dessous, ce qui détecte les N+1. Le
+statut HTTP attendu est vérifié aussi : un budget tenu par une page d'erreur
+ne mesure rien. Les vues d'écriture reçoivent une requête valide, annulée
+après la mesure.
+
+Variables d'environnement :
+- BUDGET_REQUETES_ECHELLE : multiplie la taille du jeu de données (défaut 1)
+- BUDGET_REQUETES_JSON : chemin d'un fichier où écrire les mesures
+  (nombre de requêtes, temps SQL, temps total par vue) pour les suivre
+  d'un commit à l'autre
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import get_resolver, reverse
+
+from . import entete
+from .pagination import CurseurInvalide, paginer
+from .testing import JournalRequetes, peupler_donnees
+
+
+@dataclass
+class Budget:
+    url: str
+    requetes: int
+    kwargs: Callable = lambda d: {}
+    utilisateur: str = 'client'
+    query: str = ''
+    statut: int = 200
+    methode: str = 'get'
+    donnees: Callable = None
+
+
+BUDGETS = [
+    Budget('index', 3),
+    Budget('about', 2),
+    Budget('contact', 2),
+    Budget('admin_dashboard', 12, utilisateur='staff'),
+
+    Budget('boutique:catalogue', 4),
+    Budget('boutique:recherche', 7, query='?q=courge'),
+    Budget('boutique:detail_produit', 8, lambda d: {'pk': d['produit'].pk}),
+    Budget('boutique:voir_panier', 5),
+    Budget('boutique:ajouter_au_panier', 8, lambda d: {'produit_id': d['produit'].pk},
+           statut=302, methode='post', donnees=lambda d: {'quantite': '1'}),
+    Budget('boutique:supprimer_du_panier', 4, lambda d: {'item_id': d['panier_item'].pk}, statut=302),
+    # Compte sans avis : le client de référence en a déjà un sur chaque produit
+    Budget('boutique:ajouter_avis', 12, lambda d: {'produit_id': d['produit'].pk}, utilisateur='staff',
+           statut=302, methode='post', donnees=lambda d: {'note': '4', 'titre': 'Bon', 'commentaire': 'Très frais'}),
+    # Avis.save complet pour incrémenter utile_count
+    Budget('boutique:marquer_utile', 14, lambda d: {'avis_id': d['avis'].pk}, statut=302),
+    Budget('boutique:wishlist', 4),
+    Budget('boutique:ajouter_favoris', 6, lambda d: {'produit_id': d['produit'].pk}, statut=302),
+    Budget('boutique:mes_favoris', 6),
+    Budget('boutique:notifications', 4),
+
+    Budget('commandes:checkout', 4),
+    Budget('commandes:confirmation', 7, lambda d: {'numero_commande': d['commande'].numero_commande}),
+    Budget('commandes:mes_commandes', 4),
+    Budget('commandes:detail_commande', 4, lambda d: {'numero_commande': d['commande'].numero_commande}),
+    Budget('commandes:telecharger_facture', 4, lambda d: {'numero_commande': d['commande'].numero_commande}),
+    Budget('commandes:exporter_factures', 2, utilisateur='staff'),
+
+    Budget('accounts:inscription', 0, utilisateur=None),
+    Budget('accounts:inscription_b2b', 0, utilisateur=None),
+    Budget('accounts:login', 0, utilisateur=None),
+    Budget('accounts:logout', 4, statut=302),
+    Budget('accounts:profil', 2),
+    Budget('accounts:notifications', 6),
+    Budget('accounts:marquer_lu', 5, lambda d: {'pk': d['notification'].pk}, statut=302),
+    Budget('accounts:marquer_tout_lu', 4, statut=302),  # mise à jour du compteur de non lues
+
+    Budget('notifications:liste', 4),
+    Budget('notifications:marquer_lu', 5, lambda d: {'pk': d['notification'].pk}, statut=302),
+    Budget('notifications:tout_marquer_lu', 4, statut=302),
+    Budget('notifications:flux', 2),  # flux ouvert, non consommé
+
+    Budget('api:api-root', 2),
+    Budget('api:legume-list', 4),
+    Budget('api:legume-detail', 3, lambda d: {'pk': d['produit'].legume_id}),
+    Budget('api:produit-list', 4),
+    Budget('api:produit-en-stock', 3),
+    Budget('api:produit-suggest', 3, query='?q=cou'),
+    Budget('api:produit-detail', 4, lambda d: {'pk': d['produit'].pk}),
+    Budget('api:produit-ajouter-avis', 12, lambda d: {'pk': d['produit'].pk}, utilisateur='staff',
+           statut=201, methode='post', donnees=lambda d: {'note': 4, 'titre': 'Bon', 'commentaire': 'Très frais'}),
+    Budget('api:produit-avis', 4, lambda d: {'pk': d['produit'].pk}),
+    Budget('api:panier-list', 5),
+    Budget('api:panier-add-item', 11, methode='post',
+           donnees=lambda d: {'produit_id': d['produit'].pk, 'quantite': '1'}),
+    Budget('api:panier-clear', 7, methode='post'),
+    Budget('api:panier-remove-item', 9, methode='post', donnees=lambda d: {'item_id': d['panier_item'].pk}),
+    Budget('api:zone-livraison-list', 4),
+    Budget('api:zone-livraison-detail', 3, lambda d: {'pk': d['commande'].zone_livraison_id}),
+    Budget('api:commande-list', 3),
+    Budget('api:commande-recentes', 3),
+    Budget('api:commande-detail', 5, lambda d: {'pk': d['commande'].pk}),
+    Budget('api:user-fidelite', 6),
+    Budget('api:user-me', 2),
+    Budget('api:user-update-profile', 3, methode='patch', donnees=lambda d: {'first_name': 'Aya'}),
+    Budget('api:auth-register', 3, utilisateur=None, statut=201, methode='post', donnees=lambda d: {
+        'username': 'nouveau', 'email': 'nouveau@example.com',
+        'password': 'motdepasse', 'password2': 'motdepasse', 'telephone': '0700000000', 'user_type': 'B2C',
+    }),
+]
+
+NAMESPACES = ('boutique', 'commandes', 'accounts', 'notifications')
+
+
+class BudgetRequetesTests(TestCase):
+    """Nombre de requêtes SQL de chaque vue, sur des historiques longs"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donnees = peupler_donnees(int(os.environ.get('BUDGET_REQUETES_ECHELLE', 1)))
+
+    def mesurer(self, budget):
+        client = Client(raise_request_exception=False)
+        if budget.utilisateur:
+            client.force_login(self.donnees[budget.utilisateur])
+        url = reverse(budget.url, kwargs=budget.kwargs(self.donnees)) + budget.query
+        options = {}
+        if budget.donnees:
+            options['data'] = budget.donnees(self.donnees)
+        if budget.methode != 'get' and budget.url.startswith('api:'):
+            options['content_type'] = 'application/json'
+
+        # Mesure à froid : les caches applicatifs ne doivent pas masquer un N+1.
+        # Seuls les compteurs de l'en-tête, communs à toutes les pages et
+        # invalidés par les écritures, sont pré-calculés.
+        cache.clear()
+        if budget.utilisateur:
+            entete.compteurs(self.donnees[budget.utilisateur])
+        debut = time.perf_counter()
+        # Écritures annulées : chaque vue est mesurée sur le même jeu de données
+        with transaction.atomic():
+            with JournalRequetes() as journal:
+                reponse = getattr(client, budget.methode)(url, **options)
+            transaction.set_rollback(True)
+        return {
+            'url': budget.url,
+            'chemin': url,
+            'statut': reponse.status_code,
+            'requetes': len(journal),
+            'budget': budget.requetes,
+            'temps_sql_ms': round(journal.duree_totale * 1000, 2),
+            'temps_total_ms': round((time.perf_counter() - debut) * 1000, 2),
+        }
+
+    def test_budgets(self):
+        mesures = []
+        for budget in BUDGETS:
+            mesure = self.mesurer(budget)
+            mesures.append(mesure)
+            with self.subTest(url=budget.url):
+                self.assertEqual(mesure['statut'], budget.statut, mesure['chemin'])
+                self.assertLessEqual(
+                    mesure['requetes'], budget.requetes,
+                    f"{mesure['chemin']} : {mesure['requetes']} requêtes pour un budget de {budget.requetes}"
+                )
+
+        chemin = os.environ.get('BUDGET_REQUETES_JSON')
+        if chemin:
+            with open(chemin, 'w', encoding='utf-8') as fichier:
+                json.dump(mesures, fichier, indent=2, ensure_ascii=False)
+
+    def test_toutes_les_urls_ont_un_budget(self):
+        from api.urls import router
+
+        resolver = get_resolver()
+        noms = {
+            f'{namespace}:{motif.name}'
+            for namespace in NAMESPACES
+            for motif in resolver.namespace_dict[namespace][1].url_patterns
+            if motif.name
+        }
+        noms |= {f'api:{motif.name}' for motif in router.urls if motif.name}
+        self.assertEqual(noms - {budget.url for budget in BUDGETS}, set())
+
+
+class CompteursEnteteTests(TestCase):
+    """Compteurs de l'en-tête servis depuis le cache et invalidés par les écritures"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from accounts.models import User
+        from notifications.models import Notification
+
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        for i in range(3):
+            Notification.creer_notification(cls.user, 'INFO', f'Notification {i}', 'Message')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def lire_entete(self):
+        with JournalRequetes() as journal:
+            reponse = self.client.get(reverse('about'))
+        tables = [
+            requete for requete in journal.requetes
+            if 'boutique_panieritem' in requete.sql or 'notifications_notification' in requete.sql
+        ]
+        return reponse.context['compteurs_entete'], tables
+
+    def test_cache(self):
+        compteurs, tables = self.lire_entete()
+        self.assertEqual(compteurs['notifications'], 3)
+        self.assertEqual(len(tables), 1)
+
+        compteurs, tables = self.lire_entete()
+        self.assertEqual(compteurs['notifications'], 3)
+        self.assertEqual(tables, [])
+
+    def test_invalidation(self):
+        from boutique import services
+        from boutique.models import Produit
+        from notifications.models import Notification
+        from production.models import Legume, Stock
+
+        legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        Stock.objects.create(legume=legume, quantite_disponible=10)
+        produit = Produit.objects.create(
+            legume=legume, nom='Gombo', description='Gombo', image='products/a.jpg',
+            prix_b2c=1000, prix_b2b=800
+        )
+        self.lire_entete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.ajouter_au_panier(self.user, produit, 1)
+        self.assertEqual(self.lire_entete()[0]['panier'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.marquer_tout_lu(self.user)
+        self.assertEqual(self.lire_entete()[0]['notifications'], 0)
+
+
+class PaginationCurseurTests(TestCase):
+    """Pagination keyset : bornes de pages sur valeurs égales, curseurs altérés"""
+
+    ordre = ('-date_creation', '-pk')
+
+    @classmethod
+    def setUpTestData(cls):
+        from accounts.models import User
+        from notifications.models import Notification
+
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        Notification.objects.bulk_create([
+            Notification(user=cls.user, titre=f'Notification {i}', message='Message') for i in range(7)
+        ])
+        # Dates égales deux à deux : la page doit se départager sur pk
+        notifications = list(Notification.objects.order_by('pk'))
+        for i, notification in enumerate(notifications):
+            notification.date_creation = notifications[i - i % 2].date_creation
+        Notification.objects.bulk_update(notifications, ['date_creation'])
+        cls.attendu = list(Notification.objects.order_by(*cls.ordre).values_list('pk', flat=True))
+
+    def queryset(self):
+        from notifications.models import Notification
+
+        return Notification.objects.filter(user=self.user)
+
+    def test_parcours_avant_et_arriere(self):
+        pages, curseur = [], None
+        while True:
+            page = paginer(self.queryset(), self.ordre, curseur, taille=3)
+            pages.append(page)
+            if not page.a_suivant:
+                break
+            curseur = page.suivant
+        self.assertEqual([[n.pk for n in page] for page in pages], [
+            self.attendu[0:3], self.attendu[3:6], self.attendu[6:7]
+        ])
+        self.assertFalse(pages[0].a_precedent)
+
+        # Retour en arrière depuis la dernière page
+        page = paginer(self.queryset(), self.ordre, pages[-1].precedent, taille=3)
+        self.assertEqual([n.pk for n in page], self.attendu[3:6])
+        page = paginer(self.queryset(), self.ordre, page.precedent, taille=3)
+        self.assertEqual([n.pk for n in page], self.attendu[0:3])
+        self.assertFalse(page.a_precedent)
+
+    def test_page_exacte(self):
+        # Dernière page pleine : pas de page suivante vide annoncée
+        page = paginer(self.queryset(), self.ordre, None, taille=7)
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.a_suivant)
+
+    def test_curseur_altere(self):
+        import base64
+
+        def jeton(donnees):
+            return base64.urlsafe_b64encode(json.dumps(donnees).encode()).decode()
+
+        for curseur in (
+            'pas-du-base64!', jeton([1, 2]), jeton({'v': [1]}),
+            jeton({'v': ['hier', 3]}), jeton({'v': ['2026-01-01T00:00:00', 'abc']}),
+        ):
+            with self.subTest(curseur=curseur), self.assertRaises(CurseurInvalide):
+                paginer(self.queryset(), self.ordre, curseur, taille=3)
+
+    def test_curseur_altere_dans_les_vues(self):
+        self.client.force_login(self.user)
+        # Pages HTML : retour à la première page
+        reponse = self.client.get(reverse('accounts:notifications'), {'curseur': 'altere'})
+        self.assertEqual(reponse.status_code, 200)
+        # API : 404
+        reponse = self.client.get(reverse('api:commande-list'), {'curseur': 'altere'})
+        self.assertEqual(reponse.status_code, 404)
+
+
+class InstrumentationTests(TestCase):
+    """En-tête Server-Timing et journal des requêtes lentes selon l'échantillonnage"""
+
+    @override_settings(INSTRUMENTATION_ECHANTILLON=1, INSTRUMENTATION_SEUIL_LENT_MS=60_000)
+    def test_requete_echantillonnee(self):
+        reponse = self.client.get(reverse('about'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertRegex(reponse['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ requetes SQL", app;dur=[\d.]+$')
+
+    @override_settings(INSTRUMENTATION_ECHANTILLON=0)
+    def test_requete_non_echantillonnee(self):
+        reponse = self.client.get(reverse('about'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotIn('Server-Timing', reponse)
+
+    @override_settings(INSTRUMENTATION_ECHANTILLON=1, INSTRUMENTATION_SEUIL_LENT_MS=0)
+    def test_journal_requete_lente(self):
+        with self.assertLogs('grow_with_green.requetes_lentes', 'WARNING') as journal:
+            reponse = self.client.get(reverse('about'))
+        ligne = json.loads(journal.records[0].getMessage())
+        self.assertEqual(ligne['chemin'], reverse('about'))
+        self.assertEqual(ligne['vue'], 'about')
+        self.assertEqual(ligne['statut'], reponse.status_code)
+        self.assertIsNone(ligne['user_id'])
+
+
+class ProfilCacheTests(SimpleTestCase):
+    """Le cache local au processus est refusé dès que plusieurs processus servent le site"""
+
+    def charger_settings(self, **variables):
+        env = {
+            cle: valeur for cle, valeur in os.environ.items()
+            if cle not in ('CACHE_PROFIL', 'DB_PROFIL', 'WEB_CONCURRENCY')
+        }
+        return subprocess.run(
+            [sys.executable, '-c', 'import grow_with_green.settings'],
+            env={**env, **variables}, cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+
+    def test_locmem_refuse(self):
+        for variables in ({'WEB_CONCURRENCY': '4'}, {'DB_PROFIL': 'postgres', 'CACHE_PROFIL': 'locmem'}):
+            with self.subTest(**variables):
+                resultat = self.charger_settings(**variables)
+                self.assertNotEqual(resultat.returncode, 0)
+                self.assertIn('ImproperlyConfigured', resultat.stderr)
+
+    def test_cache_partage(self):
+        self.assertEqual(self.charger_settings().returncode, 0)
+        self.assertEqual(self.charger_settings(WEB_CONCURRENCY='4', CACHE_PROFIL='db').returncode, 0)
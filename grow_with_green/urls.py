@@ -6,11 +6,12 @@ from boutique import views as boutique_views
 
 
 urlpatterns = [
+    # Avant admin.site.urls, dont la vue finale intercepte tout admin/...
+    path('admin/dashboard/', boutique_views.dashboard_admin, name='admin_dashboard'),
     path('admin/', admin.site.urls),
     
     # Page d'accueil
     path('', boutique_views.index, name='index'),
-    path('admin/dashboard/', boutique_views.dashboard_admin, name='admin_dashboard'),
     path('a-propos/', boutique_views.about, name='about'),
     path('contact/', boutique_views.contact, name='contact'),
     path('notifications/', include('notifications.urls')),
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'grow_with_green.settings')
 
 application = get_wsgi_application()
+
+# Index de suggestions construit au démarrage de chaque worker, pas à la
+# première requête
+from boutique import suggestions  # noqa: E402
+
+suggestions.prechauffer()
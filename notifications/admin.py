@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notification
+from .models import CampagnePromo, CompteurNotifications, Notification, NotificationArchivee
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
@@ -15,3 +15,30 @@ class NotificationAdmin(admin.ModelAdmin):
             notif.marquer_comme_lu()
         self.message_user(request, "Notifications marquées comme lues")
     marquer_comme_lu.short_description = "Marquer comme lu"
+
+
+@admin.register(CompteurNotifications)
+class CompteurNotificationsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'non_lues']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'non_lues']
+
+
+@admin.register(CampagnePromo)
+class CampagnePromoAdmin(admin.ModelAdmin):
+    """Les campagnes créées ici sont diffusées par la commande diffuser_promotions"""
+    list_display = ['titre', 'cible', 'statut', 'envoyees', 'total', 'progression', 'date_creation']
+    list_filter = ['statut', 'cible']
+    search_fields = ['titre']
+    readonly_fields = [
+        'statut', 'total', 'envoyees', 'dernier_user_id', 'derniere_erreur',
+        'date_creation', 'date_debut', 'date_fin', 'derniere_activite'
+    ]
+
+
+@admin.register(NotificationArchivee)
+class NotificationArchiveeAdmin(admin.ModelAdmin):
+    """Notifications déplacées par la commande purger_notifications --archiver"""
+    list_display = ['user', 'type', 'titre', 'lu', 'date_creation', 'date_archivage']
+    list_filter = ['type', 'lu']
+    search_fields = ['user__username', 'titre']
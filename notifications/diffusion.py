@@ -0,0 +1,95 @@
+"""
+Diffusion en temps réel des nouvelles notifications (pub/sub en mémoire).
+
+Chaque connexion au flux SSE (notifications.views.flux_notifications)
+s'abonne avec une asyncio.Queue bornée ; publier() peut être appelé
+depuis n'importe quel thread (vues synchrones, signaux) et dépose le
+message dans la boucle de chaque abonné avec call_soon_threadsafe. Une
+connexion inactive ne coûte qu'une tâche asyncio et une file vide.
+
+La diffusion est locale au processus : elle ne sert qu'à livrer sans
+délai les notifications créées dans le worker de l'abonné. Celles créées
+par un autre processus (autres workers, diffuser_promotions, insertions
+en masse) sont lues en base par le flux à chaque intervalle de maintien
+(NOTIFICATIONS_SSE_KEEPALIVE). Un courtier partagé (Redis pub/sub,
+LISTEN/NOTIFY...) peut remplacer DiffusionLocale en gardant les mêmes
+méthodes pour supprimer ce délai.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+TAILLE_FILE = 100
+
+
+class DiffusionLocale:
+    """Abonnés par utilisateur : {user_id: {(boucle, file)}}"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._abonnes = defaultdict(set)
+
+    def abonner(self, user_id):
+        """À appeler depuis la boucle asyncio de la connexion"""
+        abonnement = (asyncio.get_running_loop(), asyncio.Queue(TAILLE_FILE))
+        with self._verrou:
+            self._abonnes[user_id].add(abonnement)
+        return abonnement
+
+    def desabonner(self, user_id, abonnement):
+        with self._verrou:
+            abonnes = self._abonnes.get(user_id)
+            if abonnes is not None:
+                abonnes.discard(abonnement)
+                if not abonnes:
+                    del self._abonnes[user_id]
+
+    def nombre_abonnes(self):
+        with self._verrou:
+            return sum(len(abonnes) for abonnes in self._abonnes.values())
+
+    def publier(self, user_id, message):
+        with self._verrou:
+            abonnes = list(self._abonnes.get(user_id, ()))
+        for boucle, file in abonnes:
+            try:
+                boucle.call_soon_threadsafe(_deposer, file, message)
+            except RuntimeError:
+                # Boucle fermée : la connexion est en train de se terminer
+                pass
+
+
+def _deposer(file, message):
+    # Un client trop lent perd les messages les plus anciens
+    if file.full():
+        file.get_nowait()
+    file.put_nowait(message)
+
+
+diffusion = DiffusionLocale()
+
+
+def message(notification):
+    """Contenu diffusé pour une notification"""
+    return {
+        'id': notification.pk,
+        'type': notification.type,
+        'titre': notification.titre,
+        'message': notification.message,
+        'lien': notification.lien,
+        'date_creation': notification.date_creation.isoformat(),
+    }
+
+
+def publier_notifications(notifications):
+    """Diffuse les notifications après validation de la transaction"""
+    messages = [(notification.user_id, message(notification)) for notification in notifications]
+
+    def publier():
+        for user_id, contenu in messages:
+            diffusion.publier(user_id, contenu)
+
+    if messages:
+        transaction.on_commit(publier)
@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from notifications.models import CampagnePromo
+from notifications.services import CampagneReprise, diffuser_campagne, reprendre_campagne
+
+
+class Command(BaseCommand):
+    help = (
+        "Diffuse les campagnes promotionnelles en attente (une notification "
+        "PROMO par client), par lots avec suivi de la progression"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=1000, help="Notifications insérées par transaction")
+        parser.add_argument(
+            '--campagne', type=int,
+            help="Reprendre une campagne précise, en échec ou en cours sans activité récente"
+        )
+        parser.add_argument(
+            '--inactivite', type=int,
+            help="Secondes sans progression après lesquelles une campagne en cours est reprenable "
+                 "(défaut : NOTIFICATIONS_CAMPAGNE_INACTIVITE)"
+        )
+        parser.add_argument('--boucle', action='store_true', help="Tourner en continu (worker)")
+        parser.add_argument('--pause', type=float, default=30, help="Pause (s) quand aucune campagne n'attend")
+
+    def handle(self, *args, **options):
+        if options['campagne']:
+            campagne = reprendre_campagne(options['campagne'], options['inactivite'])
+            if campagne is None:
+                try:
+                    statut = CampagnePromo.objects.get(pk=options['campagne']).get_statut_display()
+                except CampagnePromo.DoesNotExist:
+                    raise CommandError(f"Campagne {options['campagne']} introuvable")
+                raise CommandError(
+                    f"Campagne {options['campagne']} non reprenable ({statut}) : seules les campagnes "
+                    f"en échec ou en cours sans activité récente peuvent être reprises"
+                )
+            self.diffuser(campagne, options['lot'])
+            return
+
+        while True:
+            campagne = self.prochaine_campagne()
+            if campagne is not None:
+                self.diffuser(campagne, options['lot'])
+                continue
+            if not options['boucle']:
+                break
+            time.sleep(options['pause'])
+
+    def prochaine_campagne(self):
+        """Réserve la plus ancienne campagne en attente (UPDATE conditionnel)"""
+        campagnes = CampagnePromo.objects.filter(statut='EN_ATTENTE').select_related('code_promo')
+        for campagne in campagnes.order_by('date_creation'):
+            if CampagnePromo.objects.filter(pk=campagne.pk, statut='EN_ATTENTE').update(
+                statut='EN_COURS', derniere_activite=timezone.now()
+            ):
+                campagne.statut = 'EN_COURS'
+                return campagne
+        return None
+
+    def diffuser(self, campagne, taille_lot):
+        debut = time.perf_counter()
+        deja_envoyees = campagne.envoyees
+
+        def progression(campagne):
+            debit = (campagne.envoyees - deja_envoyees) / (time.perf_counter() - debut)
+            self.stdout.write(
+                f"Campagne {campagne.pk} : {campagne.envoyees}/{campagne.total} "
+                f"({campagne.progression} %), {debit:.0f} notifications/s"
+            )
+
+        try:
+            diffuser_campagne(campagne, taille_lot=taille_lot, progression=progression)
+        except CampagneReprise as e:
+            self.stderr.write(self.style.WARNING(f"{e} : diffusion arrêtée"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Campagne {campagne.pk} terminée : {campagne.envoyees} notification(s) "
+            f"en {time.perf_counter() - debut:.1f} s"
+        ))
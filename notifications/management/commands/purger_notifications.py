@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from notifications.services import purger_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime (ou archive) les notifications au-delà de la durée de "
+        "rétention, par plages d'identifiants en transactions courtes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lues-jours', type=int, default=settings.NOTIFICATIONS_RETENTION_LUES_JOURS,
+            help="Âge (jours) au-delà duquel une notification lue est purgée"
+        )
+        parser.add_argument(
+            '--non-lues-jours', type=int, default=settings.NOTIFICATIONS_RETENTION_NON_LUES_JOURS,
+            help="Âge (jours) au-delà duquel une notification non lue est purgée"
+        )
+        parser.add_argument('--archiver', action='store_true', help="Copier dans NotificationArchivee avant suppression")
+        parser.add_argument('--lot', type=int, default=500, help="Identifiants parcourus par transaction")
+        parser.add_argument('--pause', type=float, default=0, help="Pause (s) entre deux lots")
+
+    def handle(self, *args, **options):
+        if options['lues_jours'] < 0 or options['non_lues_jours'] < 0:
+            raise CommandError("Les durées de rétention doivent être positives")
+        if options['lot'] < 1:
+            raise CommandError("--lot doit être supérieur à 0")
+
+        maintenant = timezone.now()
+        debut = time.perf_counter()
+
+        def progression(pourcentage, supprimees):
+            debit = supprimees / (time.perf_counter() - debut)
+            self.stdout.write(f"{pourcentage} % : {supprimees} notification(s), {debit:.0f} notifications/s")
+
+        supprimees = purger_notifications(
+            lues_avant=maintenant - timedelta(days=options['lues_jours']),
+            non_lues_avant=maintenant - timedelta(days=options['non_lues_jours']),
+            archiver=options['archiver'],
+            taille_lot=options['lot'],
+            pause=options['pause'],
+            progression=progression,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{supprimees} notification(s) {'archivée(s)' if options['archiver'] else 'supprimée(s)'} "
+            f"en {time.perf_counter() - debut:.1f} s"
+        ))
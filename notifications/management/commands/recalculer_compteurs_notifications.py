@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from notifications.models import CompteurNotifications
+
+
+class Command(BaseCommand):
+    help = "Reconstruit le compteur de notifications non lues de chaque utilisateur"
+
+    def handle(self, *args, **options):
+        compteurs = CompteurNotifications.recalculer()
+        self.stdout.write(self.style.SUCCESS(f"Compteurs recalculés pour {len(compteurs)} utilisateur(s)"))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notification_notification_user_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('lu', False)), fields=['user', 'date_creation'], name='notification_non_lue_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def calculer_compteurs(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    CompteurNotifications = apps.get_model('notifications', 'CompteurNotifications')
+    non_lues = Notification.objects.filter(lu=False).values('user').annotate(nombre=Count('pk'))
+    CompteurNotifications.objects.bulk_create([
+        CompteurNotifications(user_id=ligne['user'], non_lues=ligne['nombre']) for ligne in non_lues
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_codepromo_pointsfidelite_historiquepoints'),
+        ('notifications', '0003_notification_notification_non_lue_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurNotifications',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='compteur_notifications', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+                ('non_lues', models.PositiveIntegerField(default=0, verbose_name='Notifications non lues')),
+            ],
+            options={
+                'verbose_name': 'Compteur de notifications',
+                'verbose_name_plural': 'Compteurs de notifications',
+            },
+        ),
+        migrations.RunPython(calculer_compteurs, migrations.RunPython.noop),
+    ]
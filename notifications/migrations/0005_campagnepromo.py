@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_codepromo_pointsfidelite_historiquepoints'),
+        ('notifications', '0004_compteurnotifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampagnePromo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('titre', models.CharField(max_length=200, verbose_name='Titre')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('lien', models.CharField(blank=True, max_length=500, null=True, verbose_name='Lien')),
+                ('cible', models.CharField(choices=[('TOUS', 'Tous les clients'), ('B2C', 'Particuliers'), ('B2B', 'Professionnels')], default='TOUS', max_length=10, verbose_name='Cible')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINEE', 'Terminée'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20, verbose_name='Statut')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Destinataires')),
+                ('envoyees', models.PositiveIntegerField(default=0, verbose_name='Notifications créées')),
+                ('dernier_user_id', models.PositiveIntegerField(default=0, verbose_name='Dernier utilisateur notifié')),
+                ('derniere_erreur', models.TextField(blank=True, default='', verbose_name='Dernière erreur')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('date_debut', models.DateTimeField(blank=True, null=True, verbose_name="Début de l'envoi")),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name="Fin de l'envoi")),
+                ('code_promo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='accounts.codepromo', verbose_name='Code promo')),
+            ],
+            options={
+                'verbose_name': 'Campagne promotionnelle',
+                'verbose_name_plural': 'Campagnes promotionnelles',
+                'ordering': ['-date_creation'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_campagnepromo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchivee',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('COMMANDE', 'Commande'), ('LIVRAISON', 'Livraison'), ('PROMO', 'Promotion'), ('ALERTE', 'Alerte'), ('INFO', 'Information')], max_length=20, verbose_name='Type')),
+                ('titre', models.CharField(max_length=200, verbose_name='Titre')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('lien', models.CharField(blank=True, max_length=500, null=True, verbose_name='Lien')),
+                ('lu', models.BooleanField(verbose_name='Lu')),
+                ('date_creation', models.DateTimeField(verbose_name='Date de création')),
+                ('date_lecture', models.DateTimeField(blank=True, null=True, verbose_name='Date de lecture')),
+                ('date_archivage', models.DateTimeField(auto_now_add=True, verbose_name="Date d'archivage")),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Notification archivée',
+                'verbose_name_plural': 'Notifications archivées',
+            },
+        ),
+    ]
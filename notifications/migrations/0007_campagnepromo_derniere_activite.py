@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notificationarchivee'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campagnepromo',
+            name='derniere_activite',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Dernière activité'),
+        ),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+from collections import Counter
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
 
+from .diffusion import publier_notifications
+
 class Notification(models.Model):
     """
     Système de notifications en temps réel
@@ -57,16 +63,59 @@ class Notification(models.Model):
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
         ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['user', 'date_creation', 'id'], name='notification_user_date_idx'),
+            # Compteur et liste des non lues : index partiel, ne grossit pas avec l'historique lu
+            models.Index(
+                fields=['user', 'date_creation'],
+                condition=models.Q(lu=False),
+                name='notification_non_lue_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.titre}"
     
+    def save(self, *args, **kwargs):
+        # Création : comptée par le signal post_save
+        champs = kwargs.get('update_fields')
+        if self._state.adding or (champs is not None and not {'lu', 'user'} & set(champs)):
+            return super().save(*args, **kwargs)
+        
+        # Modification (formulaire de l'administration...) : l'état enregistré
+        # est relu verrouillé pour ajuster le compteur si `lu` ou `user` change
+        with transaction.atomic(savepoint=False):
+            ancien = Notification.objects.select_for_update().filter(pk=self.pk).values('user_id', 'lu').first()
+            super().save(*args, **kwargs)
+            if ancien is not None:
+                deltas = Counter()
+                if not ancien['lu']:
+                    deltas[ancien['user_id']] -= 1
+                if not self.lu:
+                    deltas[self.user_id] += 1
+                CompteurNotifications.ajuster(deltas)
+    
     def marquer_comme_lu(self):
         """Marque la notification comme lue"""
-        if not self.lu:
-            self.lu = True
-            self.date_lecture = timezone.now()
-            self.save()
+        if self.lu:
+            return
+        self.lu = True
+        self.date_lecture = timezone.now()
+        # UPDATE conditionnel : deux lectures simultanées ne décomptent qu'une fois
+        with transaction.atomic(savepoint=False):
+            if Notification.objects.filter(pk=self.pk, lu=False).update(lu=True, date_lecture=self.date_lecture):
+                CompteurNotifications.ajuster({self.user_id: -1})
+    
+    @staticmethod
+    def marquer_tout_lu(user):
+        """Marque en une requête toutes les notifications non lues de l'utilisateur"""
+        with transaction.atomic(savepoint=False):
+            nombre = Notification.objects.filter(user=user, lu=False).update(
+                lu=True, date_lecture=timezone.now()
+            )
+            if nombre:
+                CompteurNotifications.ajuster({user.pk: -nombre})
+        return nombre
     
     @staticmethod
     def creer_notification(user, type, titre, message, lien=None):
@@ -91,9 +140,23 @@ class Notification(models.Model):
         )
     
     @staticmethod
-    def notifier_expedition(commande):
-        """Créer notification pour expédition"""
-        Notification.creer_notification(
+    def notifier_en_masse(contenu, commandes):
+        """Créer en une requête une notification par commande"""
+        with transaction.atomic(savepoint=False):
+            notifications = Notification.objects.bulk_create([
+                Notification(**contenu(commande)) for commande in commandes
+            ])
+            # bulk_create n'envoie pas post_save
+            CompteurNotifications.ajuster(Counter(
+                notification.user_id for notification in notifications if not notification.lu
+            ))
+            publier_notifications(notifications)
+        return notifications
+    
+    @staticmethod
+    def contenu_expedition(commande):
+        """Contenu de la notification d'expédition"""
+        return dict(
             user=commande.user,
             type='LIVRAISON',
             titre=f"Commande {commande.numero_commande} expédiée",
@@ -102,12 +165,293 @@ class Notification(models.Model):
         )
     
     @staticmethod
-    def notifier_livraison(commande):
-        """Créer notification pour livraison"""
-        Notification.creer_notification(
+    def notifier_expedition(commande):
+        """Créer notification pour expédition"""
+        Notification.creer_notification(**Notification.contenu_expedition(commande))
+    
+    @staticmethod
+    def contenu_livraison(commande):
+        """Contenu de la notification de livraison"""
+        return dict(
             user=commande.user,
             type='LIVRAISON',
             titre="Commande livrée ! 🎉",
             message=f"Votre commande {commande.numero_commande} a été livrée. N'oubliez pas de laisser un avis !",
             lien=f"/commandes/detail/{commande.numero_commande}/"
-        )
\ No newline at end of file
+        )
+    
+    @staticmethod
+    def notifier_livraison(commande):
+        """Créer notification pour livraison"""
+        Notification.creer_notification(**Notification.contenu_livraison(commande))
+
+
+class NotificationArchivee(models.Model):
+    """
+    Notifications sorties de la table principale par la politique de
+    rétention (commande purger_notifications --archiver). Même identifiant
+    que la notification d'origine ; la table n'est pas lue par les pages
+    du site et ne porte que l'index de l'utilisateur.
+    """
+    id = models.BigIntegerField(
+        primary_key=True
+    )
+    user = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Utilisateur"
+    )
+    type = models.CharField(
+        max_length=20,
+        choices=Notification.TYPE_CHOICES,
+        verbose_name="Type"
+    )
+    titre = models.CharField(
+        max_length=200,
+        verbose_name="Titre"
+    )
+    message = models.TextField(
+        verbose_name="Message"
+    )
+    lien = models.CharField(
+        max_length=500,
+        blank=True,
+        null=True,
+        verbose_name="Lien"
+    )
+    lu = models.BooleanField(
+        verbose_name="Lu"
+    )
+    date_creation = models.DateTimeField(
+        verbose_name="Date de création"
+    )
+    date_lecture = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Date de lecture"
+    )
+    date_archivage = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Date d'archivage"
+    )
+    
+    class Meta:
+        verbose_name = "Notification archivée"
+        verbose_name_plural = "Notifications archivées"
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.titre}"
+
+
+class CompteurNotifications(models.Model):
+    """
+    Nombre de notifications non lues par utilisateur (dénormalisé).
+
+    Le badge et les pages de notifications lisent une ligne par clé
+    primaire au lieu de compter l'historique. Le compteur est ajusté par
+    UPDATE ... SET non_lues = non_lues + n : à la création et à la
+    suppression (signaux), à la lecture, quand save() change `lu` ou
+    `user` et dans les chemins en masse (marquer_tout_lu, notifier_en_masse). La commande
+    recalculer_compteurs_notifications le reconstruit depuis les
+    notifications.
+    """
+    user = models.OneToOneField(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='compteur_notifications',
+        verbose_name="Utilisateur"
+    )
+    non_lues = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Notifications non lues"
+    )
+    
+    class Meta:
+        verbose_name = "Compteur de notifications"
+        verbose_name_plural = "Compteurs de notifications"
+    
+    def __str__(self):
+        return f"{self.user_id} : {self.non_lues} non lue(s)"
+    
+    @staticmethod
+    def non_lues_de(user):
+        """Nombre de notifications non lues de l'utilisateur (une requête par clé)"""
+        return CompteurNotifications.objects.filter(pk=user.pk).values_list(
+            'non_lues', flat=True
+        ).first() or 0
+    
+    @staticmethod
+    def ajuster(deltas):
+        """
+        Applique {user_id: delta} en une requête. Un utilisateur sans
+        compteur est initialisé depuis ses notifications (déjà modifiées).
+        """
+        from grow_with_green import entete
+        
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        valeurs = set(deltas.values())
+        if len(valeurs) == 1:
+            # Cas des envois groupés : même incrément pour tous, pas de CASE
+            increment = Value(valeurs.pop())
+        else:
+            increment = Case(
+                *(When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()),
+                default=Value(0)
+            )
+        with transaction.atomic(savepoint=False):
+            modifies = CompteurNotifications.objects.filter(user_id__in=deltas).update(
+                non_lues=Greatest(F('non_lues') + increment, Value(0))
+            )
+            manquants = []
+            if modifies < len(deltas):
+                existants = set(
+                    CompteurNotifications.objects.filter(user_id__in=deltas).values_list('user_id', flat=True)
+                )
+                # Un décrément sans compteur n'a rien à corriger (l'utilisateur
+                # peut être en cours de suppression)
+                manquants = [user_id for user_id, delta in deltas.items() if user_id not in existants and delta > 0]
+            if manquants:
+                try:
+                    with transaction.atomic():
+                        CompteurNotifications.recalculer(manquants)
+                except IntegrityError:
+                    # Compteur créé en parallèle par une transaction qui ne
+                    # voyait pas nos notifications (non validées) : l'UPDATE
+                    # est rejoué sur sa ligne
+                    for user_id in manquants:
+                        CompteurNotifications.ajuster({user_id: deltas[user_id]})
+        entete.invalider(*deltas)
+    
+    @staticmethod
+    def recalculer(user_ids=None):
+        """Reconstruit les compteurs (de tous les utilisateurs par défaut)"""
+        from accounts.models import User
+        
+        users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+        valeurs = users.annotate(
+            nombre_non_lues=Count('notifications', filter=models.Q(notifications__lu=False))
+        ).values_list('pk', 'nombre_non_lues')
+        with transaction.atomic():
+            if user_ids is None:
+                CompteurNotifications.objects.all().delete()
+            else:
+                CompteurNotifications.objects.filter(user_id__in=user_ids).delete()
+            return CompteurNotifications.objects.bulk_create([
+                CompteurNotifications(user_id=user_id, non_lues=nombre)
+                for user_id, nombre in valeurs
+            ], batch_size=1000)
+
+
+class CampagnePromo(models.Model):
+    """
+    Annonce d'une promotion à toute la clientèle, exécutée en tâche de
+    fond par la commande diffuser_promotions (notifications.services).
+    La progression est enregistrée après chaque lot : une campagne
+    interrompue reprend après le dernier utilisateur notifié.
+    """
+    CIBLE_CHOICES = (
+        ('TOUS', 'Tous les clients'),
+        ('B2C', 'Particuliers'),
+        ('B2B', 'Professionnels'),
+    )
+    STATUT_CHOICES = (
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINEE', 'Terminée'),
+        ('ECHEC', 'Échec'),
+    )
+    
+    titre = models.CharField(
+        max_length=200,
+        verbose_name="Titre"
+    )
+    message = models.TextField(
+        verbose_name="Message"
+    )
+    lien = models.CharField(
+        max_length=500,
+        blank=True,
+        null=True,
+        verbose_name="Lien"
+    )
+    code_promo = models.ForeignKey(
+        'accounts.CodePromo',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Code promo"
+    )
+    cible = models.CharField(
+        max_length=10,
+        choices=CIBLE_CHOICES,
+        default='TOUS',
+        verbose_name="Cible"
+    )
+    statut = models.CharField(
+        max_length=20,
+        choices=STATUT_CHOICES,
+        default='EN_ATTENTE',
+        verbose_name="Statut"
+    )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Destinataires"
+    )
+    envoyees = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Notifications créées"
+    )
+    dernier_user_id = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Dernier utilisateur notifié"
+    )
+    derniere_erreur = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Dernière erreur"
+    )
+    date_creation = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Date de création"
+    )
+    date_debut = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Début de l'envoi"
+    )
+    date_fin = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fin de l'envoi"
+    )
+    derniere_activite = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Dernière activité"
+    )
+    
+    class Meta:
+        verbose_name = "Campagne promotionnelle"
+        verbose_name_plural = "Campagnes promotionnelles"
+        ordering = ['-date_creation']
+    
+    def __str__(self):
+        return f"{self.titre} ({self.get_statut_display()})"
+    
+    @property
+    def message_notification(self):
+        """Message envoyé aux clients, suivi du code promo éventuel"""
+        if self.code_promo_id:
+            return f"{self.message}\n\nCode promo : {self.code_promo.code}"
+        return self.message
+    
+    @property
+    def progression(self):
+        """Pourcentage des destinataires notifiés"""
+        if not self.total:
+            return 100 if self.statut == 'TERMINEE' else 0
+        return round(100 * self.envoyees / self.total, 1)
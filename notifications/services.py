@@ -0,0 +1,192 @@
+"""
+Traitements en masse des notifications : diffusion d'une campagne
+promotionnelle à toute la clientèle et purge selon la durée de rétention
+
+Les identifiants des destinataires sont lus en flux (.iterator(), par
+paquets de `taille_lot`) et les notifications insérées par bulk_create,
+un lot par transaction : la mémoire et la durée des verrous restent
+bornées quel que soit le nombre de clients. Chaque transaction enregistre
+aussi la progression de la campagne (dernier utilisateur notifié), ce qui
+rend la reprise exacte après une interruption. Cette mise à jour est
+conditionnelle (dernier utilisateur notifié inchangé) : si la campagne a été
+reprise par un autre worker, le lot est annulé au lieu d'être dupliqué.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+
+from django.db import connections, transaction
+from django.db.models import F, Max, Min, Q
+from django.utils import timezone
+
+from accounts.models import User
+from .models import CampagnePromo, CompteurNotifications, Notification, NotificationArchivee
+
+
+def destinataires(campagne):
+    """Clients actifs visés par la campagne, par identifiant croissant"""
+    users = User.objects.filter(is_active=True, user_type__in=('B2C', 'B2B'))
+    if campagne.cible != 'TOUS':
+        users = users.filter(user_type=campagne.cible)
+    return users.order_by('pk')
+
+
+class CampagneReprise(Exception):
+    """La campagne a été reprise par un autre worker pendant la diffusion"""
+
+
+def reprendre_campagne(campagne_id, inactivite=None):
+    """
+    Réserve une campagne à reprendre (UPDATE conditionnel) : en échec, ou
+    en cours sans activité depuis `inactivite` secondes (par défaut
+    NOTIFICATIONS_CAMPAGNE_INACTIVITE). Retourne la campagne, ou None si
+    elle n'est pas reprenable (déjà diffusée par un worker actif, terminée
+    ou encore en attente).
+    """
+    if inactivite is None:
+        inactivite = settings.NOTIFICATIONS_CAMPAGNE_INACTIVITE
+    maintenant = timezone.now()
+    abandonnee = Q(statut='EN_COURS') & (
+        Q(derniere_activite__isnull=True) | Q(derniere_activite__lt=maintenant - timedelta(seconds=inactivite))
+    )
+    reservee = CampagnePromo.objects.filter(Q(statut='ECHEC') | abandonnee, pk=campagne_id).update(
+        statut='EN_COURS', derniere_activite=maintenant
+    )
+    if not reservee:
+        return None
+    return CampagnePromo.objects.select_related('code_promo').get(pk=campagne_id)
+
+
+def _lots(iterable, taille):
+    iterateur = iter(iterable)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+
+def diffuser_campagne(campagne, taille_lot=1000, progression=None):
+    """
+    Crée une notification PROMO par destinataire, lot par lot.
+
+    `progression(campagne)` est appelé après chaque lot validé.
+    Retourne la campagne à jour.
+    """
+    users = destinataires(campagne)
+    maintenant = timezone.now()
+    message = campagne.message_notification
+    campagne.statut = 'EN_COURS'
+    campagne.date_debut = campagne.date_debut or maintenant
+    campagne.derniere_activite = maintenant
+    campagne.total = campagne.envoyees + users.filter(pk__gt=campagne.dernier_user_id).count()
+    campagne.save(update_fields=['statut', 'date_debut', 'derniere_activite', 'total'])
+    
+    restants = users.filter(pk__gt=campagne.dernier_user_id).values_list('pk', flat=True)
+    try:
+        for user_ids in _lots(restants.iterator(chunk_size=taille_lot), taille_lot):
+            with transaction.atomic():
+                if not CampagnePromo.objects.filter(
+                    pk=campagne.pk, dernier_user_id=campagne.dernier_user_id
+                ).update(
+                    envoyees=F('envoyees') + len(user_ids),
+                    dernier_user_id=user_ids[-1],
+                    derniere_activite=timezone.now()
+                ):
+                    raise CampagneReprise(f"Campagne {campagne.pk} reprise par un autre worker")
+                Notification.objects.bulk_create([
+                    Notification(
+                        user_id=user_id, type='PROMO', titre=campagne.titre,
+                        message=message, lien=campagne.lien, date_creation=maintenant
+                    )
+                    for user_id in user_ids
+                ], batch_size=taille_lot)
+                CompteurNotifications.ajuster(Counter(user_ids))
+            campagne.envoyees += len(user_ids)
+            campagne.dernier_user_id = user_ids[-1]
+            if progression:
+                progression(campagne)
+    except CampagneReprise:
+        # Le worker qui a repris la campagne en gère désormais le statut
+        raise
+    except Exception as e:
+        campagne.statut = 'ECHEC'
+        campagne.derniere_erreur = str(e)
+        campagne.save(update_fields=['statut', 'derniere_erreur'])
+        raise
+    
+    campagne.statut = 'TERMINEE'
+    campagne.date_fin = timezone.now()
+    campagne.save(update_fields=['statut', 'date_fin'])
+    return campagne
+
+
+def _supprimer(notification_ids):
+    """
+    DELETE ... WHERE id IN (...) des notifications données. Contrairement à
+    QuerySet.delete(), aucun post_delete n'est envoyé : le signal qui
+    décompte les non lues ne s'ajoute pas à l'ajustement groupé de la purge.
+    """
+    connexion = connections[Notification.objects.db]
+    quote = connexion.ops.quote_name
+    with connexion.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(Notification._meta.db_table)} "
+            f"WHERE {quote(Notification._meta.pk.column)} IN ({', '.join(['%s'] * len(notification_ids))})",
+            notification_ids
+        )
+
+
+def purger_notifications(lues_avant, non_lues_avant, archiver=False, taille_lot=500, pause=0, progression=None):
+    """
+    Supprime (ou archive) les notifications lues créées avant `lues_avant`
+    et non lues créées avant `non_lues_avant`.
+
+    La table est parcourue par plages de `taille_lot` identifiants, une
+    transaction courte par plage : les verrous restent brefs et le site
+    peut fonctionner pendant la purge. `pause` (secondes) espace les
+    plages. `progression(pourcentage, supprimees)` est appelé après chaque
+    plage. Retourne le nombre de notifications supprimées.
+    """
+    condition = (
+        Q(lu=True, date_creation__lt=lues_avant)
+        | Q(lu=False, date_creation__lt=non_lues_avant)
+    )
+    bornes = Notification.objects.filter(condition).aggregate(premier=Min('pk'), dernier=Max('pk'))
+    if bornes['premier'] is None:
+        return 0
+    
+    supprimees = 0
+    debut = bornes['premier']
+    etendue = bornes['dernier'] - bornes['premier'] + 1
+    while debut <= bornes['dernier']:
+        fin = debut + taille_lot
+        with transaction.atomic():
+            # Verrouillées : une lecture simultanée ne décompte pas deux fois
+            lot = Notification.objects.select_for_update().filter(condition, pk__gte=debut, pk__lt=fin)
+            lot = list(lot if archiver else lot.only('pk', 'user_id', 'lu'))
+            if lot:
+                if archiver:
+                    NotificationArchivee.objects.bulk_create([
+                        NotificationArchivee(
+                            id=notification.pk, user_id=notification.user_id, type=notification.type,
+                            titre=notification.titre, message=notification.message, lien=notification.lien,
+                            lu=notification.lu, date_creation=notification.date_creation,
+                            date_lecture=notification.date_lecture
+                        )
+                        for notification in lot
+                    ], ignore_conflicts=True)
+                # DELETE direct, sans signal par ligne (aucune table ne
+                # référence Notification) ; les compteurs des non lues sont
+                # ajustés en une requête
+                _supprimer([notification.pk for notification in lot])
+                non_lues = Counter(notification.user_id for notification in lot if not notification.lu)
+                CompteurNotifications.ajuster({user_id: -nombre for user_id, nombre in non_lues.items()})
+                supprimees += len(lot)
+        debut = fin
+        if progression:
+            avancement = min(debut - bornes['premier'], etendue) / etendue
+            progression(round(100 * avancement, 1), supprimees)
+        if pause and debut <= bornes['dernier']:
+            time.sleep(pause)
+    return supprimees
@@ -1,16 +1,32 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from commandes.models import Commande
-from .models import Notification
+from .diffusion import publier_notifications
+from .models import CompteurNotifications, Notification
 
 @receiver(post_save, sender=Commande)
 def creer_notification_commande(sender, instance, created, **kwargs):
     """Créer une notification automatique lors de la création d'une commande"""
     if created:
-        Notification.creer_notification(
-            user=instance.user,
-            type='COMMANDE',
-            titre=f'Commande #{instance.reference} confirmée',
-            message=f'Votre commande d\'un montant de {instance.montant_total} FCFA a été enregistrée.',
-            lien=f'/commandes/detail/{instance.pk}/'
-        )
\ No newline at end of file
+        Notification.notifier_nouvelle_commande(instance)
+
+
+@receiver(post_save, sender=Notification)
+def compter_notification_creee(sender, instance, created, **kwargs):
+    """Une notification créée non lue incrémente le compteur de l'utilisateur"""
+    if created and not instance.lu:
+        CompteurNotifications.ajuster({instance.user_id: 1})
+
+
+@receiver(post_save, sender=Notification)
+def diffuser_notification(sender, instance, created, **kwargs):
+    """Pousser la nouvelle notification aux flux SSE ouverts de l'utilisateur"""
+    if created:
+        publier_notifications([instance])
+
+
+@receiver(post_delete, sender=Notification)
+def decompter_notification_supprimee(sender, instance, **kwargs):
+    """Une notification non lue supprimée décrémente le compteur"""
+    if not instance.lu:
+        CompteurNotifications.ajuster({instance.user_id: -1})
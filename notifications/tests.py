@@ -1,3 +1,368 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.db.models import F
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CodePromo, User
+from grow_with_green.testing import JournalRequetes, PlanRequetesMixin
+from .diffusion import diffusion, message
+from .models import CampagnePromo, CompteurNotifications, Notification, NotificationArchivee
+from .services import CampagneReprise, diffuser_campagne, purger_notifications, reprendre_campagne
+
+
+class IndexNotificationsTests(PlanRequetesMixin, TestCase):
+    """La page des notifications passe par les index de notification"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+        for lu in (True, False):
+            Notification.objects.create(user=cls.user, type='INFO', titre='Info', message='Message', lu=lu)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_liste(self):
+        self.assertIndexUtilise(
+            lambda: self.client.get('/accounts/notifications/'),
+            'notifications_notification', 'notification_user_date_idx'
+        )
+
+    def test_compteur_non_lues(self):
+        self.assertIndexUtilise(
+            lambda: Notification.objects.filter(user=self.user, lu=False).count(),
+            'notifications_notification', 'notification_non_lue_idx'
+        )
+
+
+class CompteurNotificationsTests(TestCase):
+    """Le compteur dénormalisé suit créations, lectures et chemins en masse"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+
+    def non_lues(self):
+        self.assertEqual(
+            CompteurNotifications.non_lues_de(self.user),
+            Notification.objects.filter(user=self.user, lu=False).count()
+        )
+        return CompteurNotifications.non_lues_de(self.user)
+
+    def test_compteur(self):
+        premiere = Notification.creer_notification(self.user, 'INFO', 'Info', 'Message')
+        Notification.notifier_en_masse(
+            lambda user: dict(user=user, type='INFO', titre='Info', message='Message'), [self.user] * 3
+        )
+        self.assertEqual(self.non_lues(), 4)
+
+        premiere.marquer_comme_lu()
+        # Seconde lecture depuis une copie périmée : pas de double décompte
+        copie = Notification.objects.get(pk=premiere.pk)
+        copie.lu = False
+        copie.marquer_comme_lu()
+        self.assertEqual(self.non_lues(), 3)
+
+        Notification.objects.filter(user=self.user, lu=False).first().delete()
+        self.assertEqual(self.non_lues(), 2)
+
+        Notification.marquer_tout_lu(self.user)
+        self.assertEqual(self.non_lues(), 0)
+
+    def test_modification(self):
+        autre = User.objects.create_user('autre', 'autre@example.com', 'motdepasse')
+        notification = Notification.creer_notification(self.user, 'INFO', 'Info', 'Message')
+
+        # Formulaire de l'administration : `lu` et `user` modifiables
+        notification.lu = True
+        notification.save()
+        self.assertEqual(self.non_lues(), 0)
+        notification.lu = False
+        notification.save()
+        self.assertEqual(self.non_lues(), 1)
+        notification.user = autre
+        notification.save()
+        self.assertEqual(self.non_lues(), 0)
+        self.assertEqual(CompteurNotifications.non_lues_de(autre), 1)
+
+    def test_compteur_cree_en_parallele(self):
+        Notification.creer_notification(self.user, 'INFO', 'Info', 'Message')
+        CompteurNotifications.objects.all().delete()
+        recalculer = CompteurNotifications.recalculer
+        appels = []
+
+        def insertion_concurrente(user_ids):
+            appels.append(user_ids)
+            if len(appels) == 1:
+                raise IntegrityError
+            return recalculer(user_ids)
+
+        with mock.patch.object(CompteurNotifications, 'recalculer', side_effect=insertion_concurrente):
+            CompteurNotifications.ajuster({self.user.pk: 1})
+        self.assertEqual(len(appels), 2)
+        self.assertEqual(self.non_lues(), 1)
+
+    def test_lecture_sans_comptage(self):
+        Notification.creer_notification(self.user, 'INFO', 'Info', 'Message')
+        with JournalRequetes() as journal:
+            CompteurNotifications.non_lues_de(self.user)
+        self.assertEqual(journal.selects('notifications_notification'), [])
+
+
+class FluxNotificationsTests(TestCase):
+    """Flux SSE alimenté par la diffusion en mémoire"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com', 'motdepasse')
+
+    async def test_flux(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        reponse = await client.get('/notifications/flux/')
+        self.assertEqual(reponse['Content-Type'], 'text/event-stream')
+
+        flux = aiter(reponse.streaming_content)
+        self.assertTrue((await anext(flux)).startswith(b'retry:'))
+        diffusion.publier(self.user.pk, {'id': 7, 'titre': 'Commande expédiée'})
+        evenement = (await asyncio.wait_for(anext(flux), 1)).decode()
+        self.assertIn('id: 7\nevent: notification\n', evenement)
+        self.assertIn('Commande expédiée', evenement)
+
+        await self._deconnecter(flux)
+        self.assertEqual(diffusion.nombre_abonnes(), 0)
+
+    async def _deconnecter(self, flux):
+        # Déconnexion du client : le gestionnaire ASGI annule la lecture en cours
+        lecture = asyncio.ensure_future(anext(flux))
+        await asyncio.sleep(0)
+        lecture.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await lecture
+
+    @override_settings(NOTIFICATIONS_SSE_KEEPALIVE=0.05)
+    async def test_notification_d_un_autre_processus(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        reponse = await client.get('/notifications/flux/')
+        flux = aiter(reponse.streaming_content)
+        await anext(flux)
+
+        # Insertion en masse, sans signal ni diffusion : comme diffuser_campagne
+        # ou un autre worker
+        await Notification.objects.abulk_create([
+            Notification(user=self.user, type='PROMO', titre='Promo', message='Code GREEN10'),
+        ])
+        notification = await Notification.objects.aget(user=self.user)
+        evenements = []
+        while not any('event: notification' in evenement for evenement in evenements):
+            evenements.append((await asyncio.wait_for(anext(flux), 1)).decode())
+        self.assertIn(f'id: {notification.pk}\n', evenements[-1])
+        self.assertIn('Code GREEN10', evenements[-1])
+
+        # Publiée aussi en mémoire ensuite : pas de doublon
+        diffusion.publier(self.user.pk, message(notification))
+        self.assertEqual(await asyncio.wait_for(anext(flux), 1), b': ping\n\n')
+        await self._deconnecter(flux)
+
+    async def test_rattrapage_last_event_id(self):
+        notifications = await Notification.objects.abulk_create([
+            Notification(user=self.user, titre=f'Notification {i}', message='Message')
+            for i in range(3)
+        ])
+        premiere = await Notification.objects.filter(user=self.user).order_by('pk').afirst()
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        reponse = await client.get('/notifications/flux/', headers={'last-event-id': str(premiere.pk)})
+        flux = aiter(reponse.streaming_content)
+        await anext(flux)
+
+        identifiants = [
+            (await asyncio.wait_for(anext(flux), 1)).decode().split('\n', 1)[0]
+            for _ in notifications[1:]
+        ]
+        self.assertEqual(identifiants, [f'id: {premiere.pk + 1}', f'id: {premiere.pk + 2}'])
+        await self._deconnecter(flux)
+
+    def test_flux_ouvert_seulement_si_active(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(reverse('about')), 'EventSource(')
+        with self.settings(NOTIFICATIONS_SSE=True):
+            self.assertContains(self.client.get(reverse('about')), 'new EventSource("/notifications/flux/")')
+
+    async def test_anonyme(self):
+        reponse = await AsyncClient().get('/notifications/flux/')
+        self.assertEqual(reponse.status_code, 403)
+
+    def test_publication_a_la_creation(self):
+        async def abonner():
+            return diffusion.abonner(self.user.pk)
+
+        boucle = asyncio.new_event_loop()
+        try:
+            abonnement = boucle.run_until_complete(abonner())
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = Notification.creer_notification(self.user, 'LIVRAISON', 'Livrée', 'Message')
+            contenu = boucle.run_until_complete(asyncio.wait_for(abonnement[1].get(), 1))
+            diffusion.desabonner(self.user.pk, abonnement)
+        finally:
+            boucle.close()
+        self.assertEqual(contenu['id'], notification.pk)
+
+
+class CampagnePromoTests(TestCase):
+    """Diffusion par lots d'une campagne à toute la clientèle"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([
+            User(username=f'client{i}', email=f'client{i}@example.com', user_type='B2B' if i % 4 == 0 else 'B2C')
+            for i in range(25)
+        ])
+        User.objects.create_user('staff', 'staff@example.com', user_type='ADMIN')
+
+    def test_diffusion_par_lots(self):
+        campagne = CampagnePromo.objects.create(titre='Promo', message='Code GREEN10')
+        lots = []
+        diffuser_campagne(campagne, taille_lot=10, progression=lambda c: lots.append(c.envoyees))
+
+        campagne.refresh_from_db()
+        self.assertEqual(lots, [10, 20, 25])
+        self.assertEqual((campagne.statut, campagne.envoyees, campagne.total), ('TERMINEE', 25, 25))
+        self.assertEqual(Notification.objects.filter(type='PROMO').count(), 25)
+        self.assertEqual(CompteurNotifications.objects.filter(non_lues=1).count(), 25)
+
+    def test_reprise(self):
+        users = list(User.objects.filter(user_type='B2B').order_by('pk'))
+        campagne = CampagnePromo.objects.create(
+            titre='Promo', message='Code PRO', cible='B2B',
+            statut='EN_COURS', envoyees=2, dernier_user_id=users[1].pk
+        )
+        diffuser_campagne(campagne, taille_lot=10)
+
+        self.assertEqual(campagne.envoyees, len(users))
+        self.assertEqual(
+            set(Notification.objects.filter(type='PROMO').values_list('user_id', flat=True)),
+            {user.pk for user in users[2:]}
+        )
+
+    def test_code_promo_dans_le_message(self):
+        maintenant = timezone.now()
+        code = CodePromo.objects.create(
+            code='GREEN10', description='10 %', valeur=10,
+            date_debut=maintenant, date_fin=maintenant + timedelta(days=30)
+        )
+        campagne = CampagnePromo.objects.create(titre='Promo', message='-10 % ce week-end', code_promo=code, cible='B2B')
+        diffuser_campagne(campagne, taille_lot=10)
+        self.assertEqual(
+            set(Notification.objects.filter(type='PROMO').values_list('message', flat=True)),
+            {'-10 % ce week-end\n\nCode promo : GREEN10'}
+        )
+
+    def test_reprise_reservee(self):
+        maintenant = timezone.now()
+        campagnes = {
+            statut: CampagnePromo.objects.create(
+                titre=statut, message='...', statut=statut, derniere_activite=maintenant
+            )
+            for statut in ('EN_ATTENTE', 'EN_COURS', 'TERMINEE', 'ECHEC')
+        }
+        for statut in ('EN_ATTENTE', 'EN_COURS', 'TERMINEE'):
+            with self.subTest(statut=statut):
+                self.assertIsNone(reprendre_campagne(campagnes[statut].pk))
+        with self.assertRaisesMessage(CommandError, 'non reprenable (En cours)'):
+            call_command('diffuser_promotions', campagne=campagnes['EN_COURS'].pk, stdout=StringIO())
+
+        # Un seul worker réserve une campagne en échec ou abandonnée
+        self.assertEqual(reprendre_campagne(campagnes['ECHEC'].pk).statut, 'EN_COURS')
+        self.assertIsNone(reprendre_campagne(campagnes['ECHEC'].pk))
+        CampagnePromo.objects.filter(pk=campagnes['EN_COURS'].pk).update(
+            derniere_activite=maintenant - timedelta(hours=1)
+        )
+        self.assertIsNotNone(reprendre_campagne(campagnes['EN_COURS'].pk, inactivite=600))
+        self.assertIsNone(reprendre_campagne(campagnes['EN_COURS'].pk, inactivite=600))
+
+    def test_lot_annule_si_campagne_reprise(self):
+        campagne = CampagnePromo.objects.create(titre='Promo', message='...')
+
+        def reprise_par_un_autre_worker(campagne):
+            CampagnePromo.objects.filter(pk=campagne.pk).update(dernier_user_id=F('dernier_user_id') + 1)
+
+        with self.assertRaises(CampagneReprise):
+            diffuser_campagne(campagne, taille_lot=10, progression=reprise_par_un_autre_worker)
+        # Le lot suivant n'est pas inséré, le statut reste au worker qui a repris
+        self.assertEqual(Notification.objects.filter(type='PROMO').count(), 10)
+        campagne.refresh_from_db()
+        self.assertEqual((campagne.statut, campagne.envoyees), ('EN_COURS', 10))
+
+
+class PurgeNotificationsTests(TestCase):
+    """Rétention : purge par plages d'identifiants, compteurs tenus à jour"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', 'client@example.com', user_type='B2C')
+        maintenant = timezone.now()
+        self.ancienne_lue = self.creer(lu=True, age=maintenant - timedelta(days=100))
+        self.ancienne_non_lue = self.creer(lu=False, age=maintenant - timedelta(days=400))
+        self.recente_lue = self.creer(lu=True, age=maintenant - timedelta(days=10))
+        self.non_lue_gardee = self.creer(lu=False, age=maintenant - timedelta(days=100))
+
+    def creer(self, lu, age):
+        notification = Notification.objects.create(user=self.user, type='INFO', titre='Info', message='...')
+        if lu:
+            notification.marquer_comme_lu()
+        Notification.objects.filter(pk=notification.pk).update(date_creation=age)
+        return notification
+
+    def restantes(self):
+        return set(Notification.objects.values_list('pk', flat=True))
+
+    def test_purge(self):
+        avancement = []
+        maintenant = timezone.now()
+        supprimees = purger_notifications(
+            lues_avant=maintenant - timedelta(days=90),
+            non_lues_avant=maintenant - timedelta(days=365),
+            taille_lot=1,
+            progression=lambda pourcentage, n: avancement.append(n),
+        )
+
+        self.assertEqual(supprimees, 2)
+        self.assertEqual(self.restantes(), {self.recente_lue.pk, self.non_lue_gardee.pk})
+        self.assertEqual(avancement[-1], 2)
+        self.assertEqual(CompteurNotifications.non_lues_de(self.user), 1)
+        self.assertFalse(NotificationArchivee.objects.exists())
+
+    def test_un_delete_par_lot(self):
+        maintenant = timezone.now()
+        with JournalRequetes() as journal:
+            purger_notifications(maintenant - timedelta(days=90), maintenant - timedelta(days=365), taille_lot=100)
+        deletes = [requete for requete in journal.requetes if requete.sql.startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(sorted(deletes[0].params), sorted([self.ancienne_lue.pk, self.ancienne_non_lue.pk]))
+        # Pas de signal post_delete : la non lue supprimée n'est décomptée qu'une fois
+        self.assertEqual(CompteurNotifications.non_lues_de(self.user), 1)
+
+    def test_commande_archiver(self):
+        sortie = StringIO()
+        call_command('purger_notifications', archiver=True, lot=2, stdout=sortie)
+
+        self.assertIn('2 notification(s) archivée(s)', sortie.getvalue())
+        self.assertEqual(self.restantes(), {self.recente_lue.pk, self.non_lue_gardee.pk})
+        archivees = NotificationArchivee.objects.order_by('pk')
+        self.assertEqual(
+            [(a.pk, a.user_id, a.lu) for a in archivees],
+            [(self.ancienne_lue.pk, self.user.pk, True), (self.ancienne_non_lue.pk, self.user.pk, False)]
+        )
+        self.assertEqual(CompteurNotifications.non_lues_de(self.user), 1)
+
+    def test_rien_a_purger(self):
+        limite = timezone.now() - timedelta(days=1000)
+        self.assertEqual(purger_notifications(limite, limite), 0)
@@ -5,6 +5,7 @@ app_name = 'notifications'
 
 urlpatterns = [
     path('', views.liste_notifications, name='liste'),
-    path('/lire/', views.marquer_lu, name='marquer_lu'),
+    path('<int:pk>/lire/', views.marquer_lu, name='marquer_lu'),
     path('tout-marquer-lu/', views.tout_marquer_lu, name='tout_marquer_lu'),
+    path('flux/', views.flux_notifications, name='flux'),
 ]
\ No newline at end of file
@@ -1,11 +1,20 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Notification
+from grow_with_green.pagination import paginer_requete
+from .diffusion import diffusion, message
+from .models import CompteurNotifications, Notification
 
 @login_required
 def liste_notifications(request):
     notifications = Notification.objects.filter(user=request.user)
-    non_lues = notifications.filter(lu=False).count()
+    non_lues = CompteurNotifications.non_lues_de(request.user)
+    notifications = paginer_requete(request, notifications, ('-date_creation', '-pk'))
     
     context = {
         'notifications': notifications,
@@ -24,5 +33,78 @@ def marquer_lu(request, pk):
 
 @login_required
 def tout_marquer_lu(request):
-    Notification.objects.filter(user=request.user, lu=False).update(lu=True)
-    return redirect('notifications:liste')
\ No newline at end of file
+    Notification.marquer_tout_lu(request.user)
+    return redirect('notifications:liste')
+
+
+def _evenement(contenu):
+    return f"id: {contenu['id']}\nevent: notification\ndata: {json.dumps(contenu, ensure_ascii=False)}\n\n"
+
+
+async def _nouvelles(user_id, dernier_id):
+    """Notifications de l'utilisateur créées après dernier_id, en base"""
+    notifications = Notification.objects.filter(user_id=user_id, pk__gt=dernier_id).order_by('pk')[:50]
+    return [message(notification) async for notification in notifications]
+
+
+async def _flux(user_id, dernier_id):
+    """
+    Événements SSE. La diffusion en mémoire livre tout de suite les
+    notifications créées dans ce processus ; à chaque intervalle de
+    maintien, la base est relue au-delà du dernier identifiant vu pour
+    livrer celles créées ailleurs (autres workers, diffuser_promotions,
+    insertions en masse sans signal). Le premier passage rattrape depuis
+    Last-Event-ID.
+    """
+    abonnement = diffusion.abonner(user_id)
+    try:
+        # Abonné avant la lecture en base : rien n'est perdu entre les deux,
+        # les doublons sont écartés par identifiant
+        if dernier_id is None:
+            dernier_id = (await Notification.objects.filter(user_id=user_id).aaggregate(
+                dernier=Max('pk')
+            ))['dernier'] or 0
+        yield f"retry: {settings.NOTIFICATIONS_SSE_RETRY_MS}\n\n"
+        # Identifiants déjà livrés par la diffusion en mémoire
+        livrees = set()
+        file = abonnement[1]
+        while True:
+            for contenu in await _nouvelles(user_id, dernier_id):
+                dernier_id = contenu['id']
+                if contenu['id'] not in livrees:
+                    yield _evenement(contenu)
+            livrees = {identifiant for identifiant in livrees if identifiant > dernier_id}
+            while True:
+                try:
+                    contenu = await asyncio.wait_for(file.get(), settings.NOTIFICATIONS_SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                    yield ": ping\n\n"
+                    break
+                if contenu['id'] <= dernier_id or contenu['id'] in livrees:
+                    continue
+                livrees.add(contenu['id'])
+                yield _evenement(contenu)
+    finally:
+        diffusion.desabonner(user_id, abonnement)
+
+
+async def flux_notifications(request):
+    """
+    Flux server-sent events des nouvelles notifications de l'utilisateur.
+    Vue asynchrone : à servir par l'application ASGI (une connexion
+    inactive n'occupe aucun thread).
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    try:
+        dernier_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        dernier_id = None
+
+    response = StreamingHttpResponse(_flux(user.pk, dernier_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Pas de mise en tampon par nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
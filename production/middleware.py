@@ -0,0 +1,16 @@
+from . import stock_cache
+
+
+class StockMemoMiddleware:
+    """
+    Active le mémo des stocks pour la durée de chaque requête
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stock_cache.demarrer_memo()
+        try:
+            return self.get_response(request)
+        finally:
+            stock_cache.terminer_memo()
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from datetime import timedelta
+from . import stock_cache
 
 class Legume(models.Model):
     """
@@ -144,11 +147,19 @@ class Recolte(models.Model):
         if self.plantation:
             self.plantation.statut = 'RECOLTEE'
             self.plantation.save()
-        # Mettre à jour le stock après la récolte
-        from boutique.models import Stock
-        stock, created = Stock.objects.get_or_create(legume=self.legume)
-        stock.quantite_disponible += self.quantite_recoltee
-        stock.save()
+        # Mettre à jour le stock après la récolte : incrément F() atomique,
+        # pas de lecture-modification-écriture concurrente des réservations
+        with transaction.atomic():
+            Stock.objects.get_or_create(legume=self.legume)
+            Stock.objects.filter(legume=self.legume).update(
+                quantite_disponible=F('quantite_disponible') + self.quantite_recoltee,
+                date_derniere_mise_a_jour=timezone.now(),
+            )
+            legume_id = self.legume_id
+            transaction.on_commit(lambda: stock_cache.invalider(legume_id))
+            # Mise à jour en masse : pas de signal post_save sur Stock
+            from boutique import cache_catalogue
+            cache_catalogue.invalider()
 
 
 class Stock(models.Model):
@@ -182,6 +193,23 @@ class Stock(models.Model):
     def __str__(self):
         return f"Stock {self.legume} : {self.quantite_disponible} kg"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Mettre à jour le cache une fois la transaction validée ; une
+        # expression (F('quantite_disponible') + ...) n'a pas de valeur à
+        # écrire, l'entrée est alors invalidée et relue en base
+        legume_id, quantite = self.legume_id, self.quantite_disponible
+        if hasattr(quantite, 'resolve_expression'):
+            transaction.on_commit(lambda: stock_cache.invalider(legume_id))
+        else:
+            transaction.on_commit(lambda: stock_cache.mettre_a_jour(legume_id, quantite))
+    
+    def delete(self, *args, **kwargs):
+        legume_id = self.legume_id
+        resultat = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: stock_cache.invalider(legume_id))
+        return resultat
+    
     @property
     def est_en_alerte(self):
         """Vérifie si le stock est en dessous du seuil d'alerte"""
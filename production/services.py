@@ -0,0 +1,111 @@
+"""
+Réservation des stocks lors de la confirmation des commandes
+
+Toutes les lignes sont décrémentées dans une seule transaction :
+les stocks concernés sont verrouillés (select_for_update), les commandes
+sont servies dans l'ordre tant que le stock suffit, puis chaque légume
+reçoit une seule mise à jour F() protégée contre les valeurs négatives.
+Comme avant ce service, un légume sans ligne Stock n'est pas suivi : ses
+lignes sont réservées sans décrément.
+Le nombre de requêtes dépend du nombre de légumes, pas du nombre de
+commandes ni de lignes.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from . import stock_cache
+from .models import Stock
+
+
+LigneReservation = namedtuple(
+    'LigneReservation', ['item_id', 'legume_id', 'quantite', 'reservee']
+)
+
+
+class ResultatReservation(namedtuple('ResultatReservation', ['commande_id', 'lignes'])):
+    """Résultat de la réservation d'une commande, ligne par ligne"""
+
+    @property
+    def ok(self):
+        return all(ligne.reservee for ligne in self.lignes)
+
+
+class ConflitStock(Exception):
+    """Le stock a changé pendant la réservation (verrou non supporté)"""
+
+
+def reserver_commandes(commandes):
+    """
+    Réserve le stock de plusieurs commandes.
+    
+    Une commande est acceptée entièrement ou rejetée entièrement (seuls
+    les légumes ayant un Stock sont vérifiés) ; retourne un dict
+    {commande_id: ResultatReservation}.
+    """
+    from commandes.models import CommandeItem
+    
+    commande_ids = [getattr(commande, 'pk', commande) for commande in commandes]
+    if not commande_ids:
+        return {}
+    
+    items = defaultdict(list)
+    for item in CommandeItem.objects.filter(commande_id__in=commande_ids).values(
+        'id', 'commande_id', 'quantite', legume_id=F('produit__legume_id')
+    ).order_by('id'):
+        items[item['commande_id']].append(item)
+    legume_ids = {item['legume_id'] for lignes in items.values() for item in lignes}
+    
+    with transaction.atomic():
+        disponibles = dict(
+            Stock.objects.select_for_update()
+            .filter(legume_id__in=legume_ids)
+            # Verrous toujours pris dans le même ordre : pas d'interblocage
+            # entre deux réservations portant sur les mêmes légumes
+            .order_by('legume_id')
+            .values_list('legume_id', 'quantite_disponible')
+        )
+        restants = dict(disponibles)
+        
+        resultats = {}
+        for commande_id in commande_ids:
+            lignes = items.get(commande_id, [])
+            besoins = defaultdict(Decimal)
+            for item in lignes:
+                # Légume sans Stock : non suivi, toujours réservé
+                if item['legume_id'] in disponibles:
+                    besoins[item['legume_id']] += item['quantite']
+            acceptee = all(restants[legume_id] >= quantite for legume_id, quantite in besoins.items())
+            if acceptee:
+                for legume_id, quantite in besoins.items():
+                    restants[legume_id] -= quantite
+            resultats[commande_id] = ResultatReservation(commande_id, [
+                LigneReservation(item['id'], item['legume_id'], item['quantite'], acceptee)
+                for item in lignes
+            ])
+        
+        for legume_id, initial in disponibles.items():
+            a_retirer = initial - restants[legume_id]
+            if not a_retirer:
+                continue
+            modifies = Stock.objects.filter(
+                legume_id=legume_id,
+                quantite_disponible__gte=a_retirer,
+            ).update(quantite_disponible=F('quantite_disponible') - a_retirer)
+            if not modifies:
+                raise ConflitStock(f"Stock du légume {legume_id} modifié pendant la réservation")
+        
+        touches = list(disponibles)
+        transaction.on_commit(lambda: stock_cache.invalider(*touches))
+        # Mise à jour en masse : pas de signal post_save sur Stock
+        from boutique import cache_catalogue
+        cache_catalogue.invalider()
+    
+    return resultats
+
+
+def reserver_commande(commande):
+    """Réserve le stock d'une seule commande"""
+    return reserver_commandes([commande])[commande.pk]
@@ -0,0 +1,74 @@
+"""
+Cache de lecture des stocks, indexé par legume_id
+
+Deux niveaux :
+- un mémo par requête (les lectures répétées d'une même requête sont gratuites)
+- le framework de cache Django (LocMemCache par défaut, voir settings.CACHES)
+
+Stock.save met à jour le cache après validation de la transaction (ou
+l'invalide si la quantité est une expression F()) ; les mises à jour en
+masse doivent appeler invalider().
+"""
+from decimal import Decimal
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+
+_local = Local()
+
+
+def _cle(legume_id):
+    return f"stock:{legume_id}"
+
+
+def _memo():
+    return getattr(_local, 'stocks', None)
+
+
+def demarrer_memo():
+    """Active le mémo pour la requête en cours"""
+    _local.stocks = {}
+
+
+def terminer_memo():
+    """Désactive le mémo à la fin de la requête"""
+    _local.stocks = None
+
+
+def quantite_disponible(legume_id):
+    """Retourne la quantité disponible pour un légume (0 s'il n'a pas de stock)"""
+    memo = _memo()
+    if memo is not None and legume_id in memo:
+        return memo[legume_id]
+    
+    quantite = cache.get(_cle(legume_id))
+    if quantite is None:
+        from .models import Stock
+        quantite = Stock.objects.filter(legume_id=legume_id).values_list(
+            'quantite_disponible', flat=True
+        ).first()
+        if quantite is None:
+            quantite = Decimal('0')
+        cache.set(_cle(legume_id), quantite, settings.STOCK_CACHE_TIMEOUT)
+    
+    if memo is not None:
+        memo[legume_id] = quantite
+    return quantite
+
+
+def mettre_a_jour(legume_id, quantite):
+    """Écrit la nouvelle quantité dans le cache (write-through)"""
+    cache.set(_cle(legume_id), quantite, settings.STOCK_CACHE_TIMEOUT)
+    memo = _memo()
+    if memo is not None:
+        memo[legume_id] = quantite
+
+
+def invalider(*legume_ids):
+    """Supprime les entrées du cache pour les légumes donnés"""
+    cache.delete_many([_cle(legume_id) for legume_id in legume_ids])
+    memo = _memo()
+    if memo is not None:
+        for legume_id in legume_ids:
+            memo.pop(legume_id, None)
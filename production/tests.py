@@ -1,3 +1,173 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import F
 from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+from boutique.models import Produit
+from commandes.models import Commande, CommandeItem, ZoneLivraison
+from . import stock_cache
+from .models import Legume, Recolte, Stock
+from .services import ConflitStock, reserver_commande, reserver_commandes
+
+
+class ReservationStockTests(TestCase):
+    """Réservation des stocks : commandes servies dans l'ordre, entières ou rejetées"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'motdepasse')
+        cls.zone = ZoneLivraison.objects.create(nom='Abidjan', frais_livraison=1000, delai_livraison=1)
+        cls.produits = {}
+        for nom in ('COURGE', 'GOMBO'):
+            legume = Legume.objects.create(nom=nom, cycle_jours=60, description=nom)
+            cls.produits[nom] = Produit.objects.create(
+                legume=legume, nom=nom.title(), description=nom, image='products/a.jpg',
+                prix_b2c=1000, prix_b2b=800
+            )
+        # Seule la courge a un stock suivi
+        cls.stock = Stock.objects.create(legume=cls.produits['COURGE'].legume, quantite_disponible=5)
+
+    def creer_commande(self, **quantites):
+        commande = Commande.objects.create(
+            user=self.staff, zone_livraison=self.zone, adresse_livraison='Cocody',
+            mode_paiement='WAVE', montant_produits=1000, frais_livraison=1000, paiement_valide=True
+        )
+        for nom, quantite in quantites.items():
+            CommandeItem.objects.create(
+                commande=commande, produit=self.produits[nom], quantite=quantite, prix_unitaire=1000
+            )
+        return commande
+
+    def stock_restant(self):
+        self.stock.refresh_from_db()
+        return self.stock.quantite_disponible
+
+    def test_commandes_servies_dans_l_ordre(self):
+        premiere = self.creer_commande(COURGE=3)
+        seconde = self.creer_commande(COURGE=3, GOMBO=1)
+        troisieme = self.creer_commande(COURGE=2)
+
+        resultats = reserver_commandes([premiere, seconde, troisieme])
+        self.assertEqual([resultats[c.pk].ok for c in (premiere, seconde, troisieme)], [True, False, True])
+        # Commande rejetée entièrement, y compris ses lignes sans stock suivi
+        self.assertEqual({ligne.reservee for ligne in resultats[seconde.pk].lignes}, {False})
+        self.assertEqual(self.stock_restant(), 0)
+
+    def test_legume_sans_stock(self):
+        commande = self.creer_commande(GOMBO=100)
+        self.assertTrue(reserver_commande(commande).ok)
+
+        self.assertTrue(commande.confirmer().ok)
+        commande.refresh_from_db()
+        self.assertEqual(commande.statut, 'CONFIRMEE')
+        self.assertEqual(self.stock_restant(), 5)
+
+    def test_confirmer_stock_insuffisant(self):
+        commande = self.creer_commande(COURGE=Decimal('5.5'))
+        self.assertFalse(commande.confirmer().ok)
+        commande.refresh_from_db()
+        self.assertEqual(commande.statut, 'EN_ATTENTE')
+        self.assertEqual(self.stock_restant(), 5)
+
+    def confirmer_depuis_l_admin(self, *commandes):
+        self.client.force_login(self.staff)
+        reponse = self.client.post(reverse('admin:commandes_commande_changelist'), {
+            'action': 'confirmer_commandes',
+            '_selected_action': [commande.pk for commande in commandes],
+        }, follow=True)
+        return [(message.level, message.message) for message in reponse.context['messages']]
+
+    def test_action_admin(self):
+        acceptee = self.creer_commande(COURGE=4)
+        rejetee = self.creer_commande(COURGE=4)
+        self.assertEqual(self.confirmer_depuis_l_admin(acceptee, rejetee), [
+            (messages.SUCCESS, "1 commande(s) confirmée(s)"),
+            (messages.WARNING, f"1 commande(s) non confirmée(s), stock insuffisant pour : {rejetee.numero_commande}"),
+        ])
+
+        # Aucun succès annoncé quand tout est rejeté
+        self.assertEqual(self.confirmer_depuis_l_admin(rejetee), [
+            (messages.ERROR, f"1 commande(s) non confirmée(s), stock insuffisant pour : {rejetee.numero_commande}"),
+        ])
+
+    def test_action_admin_conflit_de_stock(self):
+        commande = self.creer_commande(COURGE=1)
+        with mock.patch('production.services.reserver_commandes', side_effect=ConflitStock):
+            self.assertEqual(self.confirmer_depuis_l_admin(commande), [
+                (messages.ERROR, "Le stock a été modifié pendant la confirmation, aucune commande confirmée : "
+                                 "relancez l'action"),
+            ])
+        commande.refresh_from_db()
+        self.assertEqual(commande.statut, 'EN_ATTENTE')
+        self.assertEqual(self.stock_restant(), 5)
+
+    def test_recolte_incremente_le_stock(self):
+        legume = self.stock.legume
+        stock_cache.quantite_disponible(legume.pk)
+        # Copie périmée : la récolte ne doit pas écraser une réservation
+        Stock.objects.filter(pk=self.stock.pk).update(quantite_disponible=F('quantite_disponible') - 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recolte.objects.create(legume=legume, date_recolte=date.today(), quantite_recoltee=10)
+        self.assertEqual(self.stock_restant(), 13)
+        self.assertEqual(stock_cache.quantite_disponible(legume.pk), 13)
+
+        # Légume sans ligne Stock : créée à la première récolte
+        gombo = self.produits['GOMBO'].legume
+        with self.captureOnCommitCallbacks(execute=True):
+            Recolte.objects.create(legume=gombo, date_recolte=date.today(), quantite_recoltee=4)
+        self.assertEqual(Stock.objects.get(legume=gombo).quantite_disponible, 4)
+
+
+class StockCacheTests(TestCase):
+    """Cache des stocks : mémo par requête, écriture après validation, expressions F()"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.legume = Legume.objects.create(nom='GOMBO', cycle_jours=60, description='Gombo')
+        cls.stock = Stock.objects.create(legume=cls.legume, quantite_disponible=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_memo_par_requete(self):
+        stock_cache.demarrer_memo()
+        try:
+            with self.assertNumQueries(1):
+                self.assertEqual(stock_cache.quantite_disponible(self.legume.pk), 5)
+            # Entrée retirée du cache partagé : le mémo suffit
+            cache.clear()
+            with self.assertNumQueries(0):
+                self.assertEqual(stock_cache.quantite_disponible(self.legume.pk), 5)
+        finally:
+            stock_cache.terminer_memo()
+
+    def test_ecriture_apres_validation(self):
+        stock_cache.quantite_disponible(self.legume.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.stock.quantite_disponible = 7
+            self.stock.save()
+            # Transaction non validée : l'ancienne valeur reste servie
+            self.assertEqual(stock_cache.quantite_disponible(self.legume.pk), 5)
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(0):
+            self.assertEqual(stock_cache.quantite_disponible(self.legume.pk), 7)
+
+    def test_expression_f(self):
+        stock_cache.quantite_disponible(self.legume.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.quantite_disponible = F('quantite_disponible') + 3
+            self.stock.save()
+        self.assertEqual(stock_cache.quantite_disponible(self.legume.pk), 8)
 
-# Create your tests here.
+    def test_suppression(self):
+        stock_cache.quantite_disponible(self.legume.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.delete()
+        self.assertEqual(stock_cache.quantite_disponible(self.legume.pk), 0)